@@ -6,16 +6,24 @@ from .config import (
     AIRTABLE_BASE_ID,
     ANTHROPIC_API_KEY,
     ANTHROPIC_MODEL,
+    ANTHROPIC_SMALL_MODEL,
     VALID_CLIENT_CODES
 )
 
 from .helpers import (
     strip_markdown_json,
     get_next_working_day,
-    format_date_display
+    format_date_display,
+    compact_email,
+    split_quoted
 )
 
 from .airtable import (
+    AirtableUnavailable,
+    get_airtable_client,
+    close_airtable_client,
+    iter_records,
+    find_record,
     get_project_by_job_number,
     get_client_by_code,
     get_active_jobs_for_client,
@@ -23,5 +31,31 @@ from .airtable import (
     create_project,
     create_update,
     update_project_fields,
-    increment_project_round
+    update_project_fields_by_id,
+    increment_project_round,
+    increment_project_round_by_id,
+    mark_sent_to_client,
+    bulk_create_updates,
+    bulk_update_projects,
+    get_cache_stats,
+    invalidate_project,
+    invalidate_client
+)
+
+from .mirror import start_sync_worker as start_mirror_sync
+
+from .ranking import shortlist_jobs
+
+from .llm import (
+    LLMUnavailable,
+    model_for,
+    get_anthropic_client,
+    close_anthropic_client,
+    create_message,
+    create_structured,
+    create_batch,
+    wait_for_batch,
+    batch_status,
+    batch_results,
+    get_llm_stats
 )
@@ -1,10 +1,26 @@
 # Dot Shared Airtable Functions
 # All Airtable read/write operations
 
+import os
+import time
+import threading
+import importlib.util
 import httpx
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from .config import AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_CLIENTS_TABLE, AIRTABLE_PROJECTS_TABLE, AIRTABLE_UPDATES_TABLE
+from .config import (
+    AIRTABLE_API_KEY, AIRTABLE_API_URL, AIRTABLE_CLIENTS_TABLE, AIRTABLE_PROJECTS_TABLE, AIRTABLE_UPDATES_TABLE,
+    AIRTABLE_HTTP2, AIRTABLE_MAX_CONNECTIONS, AIRTABLE_MAX_KEEPALIVE, AIRTABLE_KEEPALIVE_EXPIRY,
+    AIRTABLE_TIMEOUT, AIRTABLE_CONNECT_TIMEOUT, AIRTABLE_CACHE_TTL, AIRTABLE_CACHE_SIZE,
+    AIRTABLE_PAGE_SIZE, AIRTABLE_PREFETCH_WORKERS, AIRTABLE_RATE_LIMIT, AIRTABLE_RATE_BURST,
+    AIRTABLE_RATE_LIMIT_DB, AIRTABLE_RATE_WAIT, AIRTABLE_MAX_RETRIES, AIRTABLE_BACKOFF_BASE, AIRTABLE_BACKOFF_MAX,
+    AIRTABLE_BATCH_SIZE, AIRTABLE_WRITE_COALESCE_WINDOW
+)
 from .helpers import get_next_working_day
+from .cache import TTLCache
+from .batching import WriteCoalescer
+from .ratelimit import TokenBucket, backoff_delay, parse_retry_after
+from . import mirror
 
 
 def _get_headers():
@@ -15,96 +31,398 @@ def _get_headers():
     }
 
 
+# ===================
+# HTTP CLIENT
+# ===================
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _http2_available():
+    """HTTP/2 needs the optional h2 package (httpx[http2])"""
+    return importlib.util.find_spec('h2') is not None
+
+
+def get_airtable_client():
+    """Get the pooled Airtable HTTP client for this process.
+    
+    Created lazily (and re-created after a fork) so each gunicorn worker
+    owns its own keep-alive pool. Every Airtable call in a worker reuses
+    these connections instead of paying a TCP+TLS handshake per request.
+    """
+    global _client, _client_pid
+    
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                http2 = AIRTABLE_HTTP2 and _http2_available()
+                if AIRTABLE_HTTP2 and not http2:
+                    print("h2 not installed - Airtable client falling back to HTTP/1.1")
+                
+                _client = httpx.Client(
+                    base_url=AIRTABLE_API_URL,
+                    headers=_get_headers(),
+                    http2=http2,
+                    limits=httpx.Limits(
+                        max_connections=AIRTABLE_MAX_CONNECTIONS,
+                        max_keepalive_connections=AIRTABLE_MAX_KEEPALIVE,
+                        keepalive_expiry=AIRTABLE_KEEPALIVE_EXPIRY
+                    ),
+                    timeout=httpx.Timeout(AIRTABLE_TIMEOUT, connect=AIRTABLE_CONNECT_TIMEOUT)
+                )
+                _client_pid = os.getpid()
+    
+    return _client
+
+
+def close_airtable_client():
+    """Close the pooled client (e.g. on worker shutdown)"""
+    global _client, _client_pid
+    
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+# ===================
+# RATE LIMITING
+# ===================
+
+_rate_limiter = TokenBucket(AIRTABLE_RATE_LIMIT_DB, AIRTABLE_RATE_LIMIT, AIRTABLE_RATE_BURST, name='airtable')
+
+# Worth retrying: rate limited (never processed), or - for reads only -
+# Airtable briefly unavailable. Writes aren't resent on 5xx as they may
+# already have been applied.
+RETRY_STATUS_CODES = {429}
+RETRY_READ_STATUS_CODES = {429, 502, 503, 504}
+
+
+class AirtableUnavailable(Exception):
+    """Airtable couldn't answer (rate limited, timed out or erroring) -
+    distinct from a lookup that found nothing. Apps return 503."""
+    pass
+
+
+def _is_unavailable(error):
+    """True for failures that say nothing about whether the record exists"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    # TimeoutError is the rate limiter giving up on a token
+    return isinstance(error, (httpx.TransportError, TimeoutError))
+
+
+def _request(method, path, **kwargs):
+    """Send an Airtable request through the shared rate limiter.
+    
+    Waits for a token before every attempt. On 429/5xx it backs off
+    (honouring Retry-After) and retries up to AIRTABLE_MAX_RETRIES times;
+    a 429 also pauses every other worker via the shared bucket.
+    Returns the final response - callers still raise_for_status().
+    """
+    retry_codes = RETRY_READ_STATUS_CODES if method == 'GET' else RETRY_STATUS_CODES
+    
+    attempt = 0
+    while True:
+        _rate_limiter.acquire(timeout=AIRTABLE_RATE_WAIT)
+        
+        try:
+            response = get_airtable_client().request(method, path, **kwargs)
+        except httpx.ConnectError:
+            # Request never reached Airtable, so it's safe to resend
+            if attempt >= AIRTABLE_MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(attempt, AIRTABLE_BACKOFF_BASE, AIRTABLE_BACKOFF_MAX))
+            attempt += 1
+            continue
+        
+        if response.status_code not in retry_codes or attempt >= AIRTABLE_MAX_RETRIES:
+            return response
+        
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        delay = backoff_delay(attempt, AIRTABLE_BACKOFF_BASE, AIRTABLE_BACKOFF_MAX, retry_after)
+        if response.status_code == 429:
+            _rate_limiter.block_for(delay)
+        
+        print(f"Airtable {response.status_code} on {method} {path} - retrying in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+
+
+def _table_path(table, record_id=None):
+    """Path of a table (or record) relative to the base URL"""
+    if record_id:
+        return f"/{table}/{record_id}"
+    return f"/{table}"
+
+
+# ===================
+# PAGINATION
+# ===================
+
+# Fetches the next page of a listing while the caller works through the current one
+_prefetch_executor = ThreadPoolExecutor(max_workers=AIRTABLE_PREFETCH_WORKERS, thread_name_prefix='airtable-prefetch')
+
+
+def _list_params(formula=None, fields=None, sort=None, page_size=None):
+    """Build list-records query params.
+    
+    fields projects the response down to just those fields (None = all).
+    sort is a list of field names or {'field': ..., 'direction': ...} dicts.
+    Returned as a list of pairs so fields[] can repeat.
+    """
+    params = []
+    if formula:
+        params.append(('filterByFormula', formula))
+    for field in fields or []:
+        params.append(('fields[]', field))
+    for i, spec in enumerate(sort or []):
+        if isinstance(spec, str):
+            spec = {'field': spec}
+        params.append((f'sort[{i}][field]', spec['field']))
+        params.append((f'sort[{i}][direction]', spec.get('direction', 'asc')))
+    params.append(('pageSize', min(page_size or AIRTABLE_PAGE_SIZE, 100)))
+    return params
+
+
+def _fetch_page(table, params, offset=None, timeout=None):
+    """Fetch one page of records. Returns (records, next_offset)."""
+    if offset:
+        params = params + [('offset', offset)]
+    
+    kwargs = {'timeout': timeout} if timeout else {}
+    response = _request('GET', _table_path(table), params=params, **kwargs)
+    response.raise_for_status()
+    
+    body = response.json()
+    return body.get('records', []), body.get('offset')
+
+
+def iter_records(table, formula=None, fields=None, sort=None, page_size=None, timeout=None):
+    """Stream every record matching formula, following Airtable's offset cursor.
+    
+    Pages are fetched lazily, with the next page requested in the background
+    while the current one is being consumed, so at most two pages are held
+    in memory. Errors are raised to the caller.
+    """
+    params = _list_params(formula, fields, sort, page_size)
+    records, offset = _fetch_page(table, params, timeout=timeout)
+    
+    while True:
+        next_page = None
+        if offset:
+            next_page = _prefetch_executor.submit(_fetch_page, table, params, offset, timeout)
+        
+        try:
+            yield from records
+        except GeneratorExit:
+            if next_page:
+                next_page.cancel()
+            raise
+        
+        if not next_page:
+            return
+        
+        records, offset = next_page.result()
+
+
+def find_record(table, formula, fields=None, timeout=None):
+    """Return the first record matching formula, or None.
+    
+    Errors are raised to the caller.
+    """
+    params = _list_params(formula, fields, page_size=1) + [('maxRecords', 1)]
+    records, _ = _fetch_page(table, params, timeout=timeout)
+    return records[0] if records else None
+
+
+# ===================
+# LOOKUP CACHE
+# ===================
+
+# Keyed by job number / client code. Only found records are cached, and
+# every write to a project or client invalidates its entry.
+_project_cache = TTLCache(maxsize=AIRTABLE_CACHE_SIZE, ttl=AIRTABLE_CACHE_TTL)
+_client_cache = TTLCache(maxsize=AIRTABLE_CACHE_SIZE, ttl=AIRTABLE_CACHE_TTL)
+
+
+def get_cache_stats():
+    """Hit/miss counters for the project and client lookup caches"""
+    return {
+        'projects': _project_cache.stats(),
+        'clients': _client_cache.stats()
+    }
+
+
+def invalidate_project(job_number):
+    """Drop a cached project so the next lookup goes to Airtable"""
+    _project_cache.invalidate(job_number)
+
+
+def invalidate_client(client_code):
+    """Drop a cached client so the next lookup goes to Airtable"""
+    _client_cache.invalidate(client_code)
+
+
 # ===================
 # READ OPERATIONS
 # ===================
 
-def get_project_by_job_number(job_number):
+# Field projections - only request what each lookup actually reads
+PROJECT_LOOKUP_FIELDS = [
+    'Job Number', 'Project Name', 'Client', 'Stage', 'Status', 'Round', 'With Client?', 'Teams Channel ID'
+]
+CLIENT_LOOKUP_FIELDS = ['Client', 'Teams ID', 'Sharepoint ID', 'Next #']
+ACTIVE_JOB_FIELDS = ['Job Number', 'Project Name', 'Description']
+
+ACTIVE_STATUSES = ['In Progress', 'On Hold']
+
+
+def _project_from_record(record, job_number=''):
+    """Project details dict from a Projects record"""
+    fields = record['fields']
+    
+    # Get client name from linked record if available
+    client_name = fields.get('Client', '')
+    if isinstance(client_name, list):
+        client_name = client_name[0] if client_name else ''
+    
+    return {
+        'recordId': record['id'],
+        'jobNumber': fields.get('Job Number', job_number),
+        'jobName': fields.get('Project Name', ''),
+        'clientName': client_name,
+        'stage': fields.get('Stage', ''),
+        'status': fields.get('Status', ''),
+        'round': fields.get('Round', 0) or 0,
+        'withClient': fields.get('With Client?', False),
+        'teamsChannelId': fields.get('Teams Channel ID', None)
+    }
+
+
+def _client_from_record(record, client_code):
+    """Client details dict from a Clients record"""
+    fields = record['fields']
+    
+    return {
+        'recordId': record['id'],
+        'clientCode': client_code,
+        'clientName': fields.get('Client', ''),
+        'teamsId': fields.get('Teams ID', None),
+        'sharepointUrl': fields.get('Sharepoint ID', None),
+        'nextNumber': fields.get('Next #', 1)
+    }
+
+
+def _active_job_from_record(record):
+    """Job summary used for matching emails to jobs"""
+    fields = record['fields']
+    
+    return {
+        'jobNumber': fields.get('Job Number', ''),
+        'jobName': fields.get('Project Name', ''),
+        'description': fields.get('Description', '')
+    }
+
+
+def _active_jobs_formula(client_code):
+    """Filter by client code prefix in Job Number and active status"""
+    return f"AND(FIND('{client_code}', {{Job Number}})=1, OR({{Status}}='In Progress', {{Status}}='On Hold'))"
+
+def get_project_by_job_number(job_number, use_cache=True):
     """Look up existing project by job number.
     
     Returns project details dict or None if not found.
     Used by Traffic to validate job numbers and enrich routing data.
+    Served from the lookup cache or local mirror when fresh; pass
+    use_cache=False to force a read from Airtable.
+    Raises AirtableUnavailable if Airtable couldn't be asked (rate
+    limited, timed out or erroring), so that isn't mistaken for not found.
     """
     if not AIRTABLE_API_KEY:
         print("No Airtable API key configured")
         return None
     
+    if use_cache:
+        cached = _project_cache.get(job_number)
+        if cached is not None:
+            return dict(cached)
+    
     try:
-        search_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_PROJECTS_TABLE}"
-        params = {'filterByFormula': f"{{Job Number}}='{job_number}'"}
-        
-        response = httpx.get(search_url, headers=_get_headers(), params=params, timeout=10.0)
-        response.raise_for_status()
-        
-        records = response.json().get('records', [])
-        
-        if not records:
+        record = None
+        if use_cache and mirror.is_fresh(AIRTABLE_PROJECTS_TABLE):
+            record = mirror.find_record(AIRTABLE_PROJECTS_TABLE, 'job_number', job_number)
+        
+        if not record:
+            record = find_record(
+                AIRTABLE_PROJECTS_TABLE,
+                f"{{Job Number}}='{job_number}'",
+                fields=PROJECT_LOOKUP_FIELDS
+            )
+        
+        if not record:
             print(f"Job '{job_number}' not found in Airtable")
             return None
         
-        record = records[0]
-        fields = record['fields']
-        
-        # Get client name from linked record if available
-        client_name = fields.get('Client', '')
-        if isinstance(client_name, list):
-            client_name = client_name[0] if client_name else ''
-        
-        return {
-            'recordId': record['id'],
-            'jobNumber': fields.get('Job Number', job_number),
-            'jobName': fields.get('Project Name', ''),
-            'clientName': client_name,
-            'stage': fields.get('Stage', ''),
-            'status': fields.get('Status', ''),
-            'round': fields.get('Round', 0) or 0,
-            'withClient': fields.get('With Client?', False),
-            'teamsChannelId': fields.get('Teams Channel ID', None)
-        }
+        project = _project_from_record(record, job_number)
+        
+        _project_cache.set(job_number, project)
+        return dict(project)
         
     except Exception as e:
         print(f"Error looking up project in Airtable: {e}")
-        return None
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        raise
 
 
-def get_client_by_code(client_code):
+def get_client_by_code(client_code, use_cache=True):
     """Look up client by code.
     
     Returns client details including Teams ID, SharePoint URL, next job number.
     Used by Triage when creating new jobs.
+    Served from the lookup cache or local mirror when fresh; pass
+    use_cache=False when the value must be current (e.g. the Next # counter).
+    Raises AirtableUnavailable as get_project_by_job_number does.
     """
     if not AIRTABLE_API_KEY:
         print("No Airtable API key configured")
         return None
     
+    if use_cache:
+        cached = _client_cache.get(client_code)
+        if cached is not None:
+            return dict(cached)
+    
     try:
-        search_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_CLIENTS_TABLE}"
-        params = {'filterByFormula': f"{{Client code}}='{client_code}'"}
-        
-        response = httpx.get(search_url, headers=_get_headers(), params=params, timeout=10.0)
-        response.raise_for_status()
-        
-        records = response.json().get('records', [])
-        
-        if not records:
+        record = None
+        if use_cache and mirror.is_fresh(AIRTABLE_CLIENTS_TABLE):
+            record = mirror.find_record(AIRTABLE_CLIENTS_TABLE, 'client_code', client_code)
+        
+        if not record:
+            record = find_record(
+                AIRTABLE_CLIENTS_TABLE,
+                f"{{Client code}}='{client_code}'",
+                fields=CLIENT_LOOKUP_FIELDS
+            )
+        
+        if not record:
             print(f"Client code '{client_code}' not found in Airtable")
             return None
         
-        record = records[0]
-        fields = record['fields']
+        client = _client_from_record(record, client_code)
         
-        return {
-            'recordId': record['id'],
-            'clientCode': client_code,
-            'clientName': fields.get('Client', ''),
-            'teamsId': fields.get('Teams ID', None),
-            'sharepointUrl': fields.get('Sharepoint ID', None),
-            'nextNumber': fields.get('Next #', 1)
-        }
+        _client_cache.set(client_code, client)
+        return dict(client)
         
     except Exception as e:
         print(f"Error looking up client in Airtable: {e}")
-        return None
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        raise
 
 
 def get_active_jobs_for_client(client_code):
@@ -112,37 +430,29 @@ def get_active_jobs_for_client(client_code):
     
     Returns list of job summaries for matching against.
     Used by Traffic when trying to match emails to jobs.
+    Raises AirtableUnavailable rather than returning [] if Airtable
+    couldn't be asked.
     """
     if not AIRTABLE_API_KEY:
         print("No Airtable API key configured")
         return []
     
     try:
-        # Filter by client code prefix in Job Number and active status
-        filter_formula = f"AND(FIND('{client_code}', {{Job Number}})=1, OR({{Status}}='In Progress', {{Status}}='On Hold'))"
-        
-        search_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_PROJECTS_TABLE}"
-        params = {'filterByFormula': filter_formula}
-        
-        response = httpx.get(search_url, headers=_get_headers(), params=params, timeout=10.0)
-        response.raise_for_status()
-        
-        records = response.json().get('records', [])
-        
-        jobs = []
-        for record in records:
-            fields = record['fields']
-            jobs.append({
-                'jobNumber': fields.get('Job Number', ''),
-                'jobName': fields.get('Project Name', ''),
-                'description': fields.get('Description', '')
-            })
+        if mirror.is_fresh(AIRTABLE_PROJECTS_TABLE):
+            records = mirror.select_records(
+                AIRTABLE_PROJECTS_TABLE, order_by='job_number',
+                client_code=client_code, status=ACTIVE_STATUSES
+            )
+        else:
+            records = iter_records(AIRTABLE_PROJECTS_TABLE, formula=_active_jobs_formula(client_code), fields=ACTIVE_JOB_FIELDS)
         
-        return jobs
+        return [_active_job_from_record(record) for record in records]
         
     except Exception as e:
         print(f"Error getting active jobs for client: {e}")
-        return []
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        raise
 
 
 # ===================
@@ -154,13 +464,15 @@ def increment_client_job_number(client_code):
     
     Returns formatted job number (e.g., 'TOW 023') or 'TBC' on failure.
     Also returns Teams ID, SharePoint URL, and client record ID.
+    Raises AirtableUnavailable if Airtable is rate limited or unreachable.
     """
     if not AIRTABLE_API_KEY:
         print("No Airtable API key configured")
         return f"{client_code} TBC", None, None, None
     
     try:
-        client = get_client_by_code(client_code)
+        # Always read the live counter - a cached Next # would hand out duplicates
+        client = get_client_by_code(client_code, use_cache=False)
         
         if not client:
             return f"{client_code} TBC", None, None, None
@@ -172,18 +484,47 @@ def increment_client_job_number(client_code):
         job_number = f"{client_code} {str(current_number).zfill(3)}"
         
         # Update Airtable with incremented number
-        update_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_CLIENTS_TABLE}/{client['recordId']}"
         update_data = {'fields': {'Next #': next_number}}
         
-        httpx.patch(update_url, headers=_get_headers(), json=update_data, timeout=10.0)
+        response = _request('PATCH', _table_path(AIRTABLE_CLIENTS_TABLE, client['recordId']), json=update_data)
+        invalidate_client(client_code)
+        if response.status_code == 429:
+            # Never applied - the number must not be handed out
+            raise AirtableUnavailable(f"Rate limited updating Next # for {client_code}")
+        if response.is_success:
+            mirror.upsert(AIRTABLE_CLIENTS_TABLE, response.json(), merge=True)
         
         return job_number, client['teamsId'], client['sharepointUrl'], client['recordId']
         
     except Exception as e:
         print(f"Error incrementing job number: {e}")
+        # A TBC number while Airtable is rate limited would become a TBC project
+        if isinstance(e, AirtableUnavailable):
+            raise
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
         return f"{client_code} TBC", None, None, None
 
 
+def _new_project_fields(job_number, job_name, description, project_owner, client_record_id):
+    """Fields for a new Projects record"""
+    fields = {
+        'Job Number': job_number,
+        'Project Name': job_name,
+        'Description': description,
+        'Status': 'In Progress',
+        'Stage': 'Triage',
+        'Project Owner': project_owner,
+        'Start Date': date.today().isoformat()
+    }
+    
+    # Add client link if we have the record ID
+    if client_record_id:
+        fields['Client Link'] = [client_record_id]
+    
+    return fields
+
+
 def create_project(job_number, job_name, description, project_owner, client_record_id):
     """Create a new project record.
     
@@ -195,27 +536,14 @@ def create_project(job_number, job_name, description, project_owner, client_reco
         return None
     
     try:
-        job_data = {
-            'fields': {
-                'Job Number': job_number,
-                'Project Name': job_name,
-                'Description': description,
-                'Status': 'In Progress',
-                'Stage': 'Triage',
-                'Project Owner': project_owner,
-                'Start Date': date.today().isoformat()
-            }
-        }
-        
-        # Add client link if we have the record ID
-        if client_record_id:
-            job_data['fields']['Client Link'] = [client_record_id]
-        
-        create_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_PROJECTS_TABLE}"
-        response = httpx.post(create_url, headers=_get_headers(), json=job_data, timeout=10.0)
+        job_data = {'fields': _new_project_fields(job_number, job_name, description, project_owner, client_record_id)}
+        
+        response = _request('POST', _table_path(AIRTABLE_PROJECTS_TABLE), json=job_data)
         response.raise_for_status()
+        invalidate_project(job_number)
         
         new_record = response.json()
+        mirror.upsert(AIRTABLE_PROJECTS_TABLE, new_record)
         print(f"Created project: {job_number}")
         return new_record.get('id')
         
@@ -224,6 +552,20 @@ def create_project(job_number, job_name, description, project_owner, client_reco
         return None
 
 
+def _new_update_fields(project_record_id, update_text, update_due=None):
+    """Fields for a new Updates record"""
+    # Default to 5 working days if no due date provided
+    if not update_due:
+        update_due = get_next_working_day(date.today(), 5).isoformat()
+    
+    return {
+        'Project Link': [project_record_id],
+        'Update': update_text,
+        'Updated on': date.today().isoformat(),
+        'Update due': update_due
+    }
+
+
 def create_update(project_record_id, update_text, update_due=None):
     """Create a new update record in the Updates table.
     
@@ -235,22 +577,16 @@ def create_update(project_record_id, update_text, update_due=None):
         return False
     
     try:
-        # Default to 5 working days if no due date provided
-        if not update_due:
-            update_due = get_next_working_day(date.today(), 5).isoformat()
-        
-        update_data = {
-            'fields': {
-                'Project Link': [project_record_id],
-                'Update': update_text,
-                'Updated on': date.today().isoformat(),
-                'Update due': update_due
-            }
-        }
-        
-        create_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_UPDATES_TABLE}"
-        response = httpx.post(create_url, headers=_get_headers(), json=update_data, timeout=10.0)
-        response.raise_for_status()
+        fields = _new_update_fields(project_record_id, update_text, update_due)
+        
+        if _update_coalescer:
+            # Rides along with other requests' updates in one batched POST
+            if not _update_coalescer.submit(fields).result(timeout=_COALESCE_RESULT_TIMEOUT):
+                raise ValueError("Record missing from batch response")
+        else:
+            response = _request('POST', _table_path(AIRTABLE_UPDATES_TABLE), json={'fields': fields})
+            response.raise_for_status()
+            mirror.upsert(AIRTABLE_UPDATES_TABLE, response.json())
         
         print(f"Created update for project {project_record_id}: {update_text}")
         return True
@@ -260,47 +596,83 @@ def create_update(project_record_id, update_text, update_due=None):
         return False
 
 
+# Project fields that may be written directly (Update is a lookup from Updates)
+PROJECT_UPDATE_FIELDS = ['Stage', 'Status', 'Live Date', 'With Client?']
+
+
+def _writable_project_fields(updates):
+    """Only the directly writable project fields, skipping None values"""
+    return {
+        field: updates[field]
+        for field in PROJECT_UPDATE_FIELDS
+        if field in updates and updates[field] is not None
+    }
+
+
+def _invalidate_project_record(record_id, job_number=None):
+    """Invalidate a cached project by job number, or by record ID if unknown"""
+    if job_number:
+        invalidate_project(job_number)
+    else:
+        _project_cache.invalidate_where(lambda project: project['recordId'] == record_id)
+
+
+def _patch_project(record_id, fields):
+    """PATCH fields onto a Project record by record ID"""
+    response = _request('PATCH', _table_path(AIRTABLE_PROJECTS_TABLE, record_id), json={'fields': fields})
+    response.raise_for_status()
+    
+    record = response.json()
+    mirror.upsert(AIRTABLE_PROJECTS_TABLE, record, merge=True)
+    return record
+
+
 def update_project_fields(job_number, updates):
     """Update specific fields on a Project record.
     
     Used for Stage, Status, Live Date, With Client changes.
     NOT for Update field - that's a lookup from Updates table.
+    Prefer update_project_fields_by_id when the record ID is already known.
+    """
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return False
+    
+    # First find the record
+    project = get_project_by_job_number(job_number)
+    
+    if not project:
+        return False
+    
+    return update_project_fields_by_id(project['recordId'], updates, job_number=job_number)
+
+
+def update_project_fields_by_id(record_id, updates, job_number=None):
+    """Update specific fields on a Project record by record ID.
+    
+    Same rules as update_project_fields, but skips the job number search
+    for callers that already hold project['recordId'].
     """
     if not AIRTABLE_API_KEY:
         print("No Airtable API key configured")
         return False
     
     try:
-        # First find the record
-        project = get_project_by_job_number(job_number)
-        
-        if not project:
-            return False
-        
-        # Build update payload - only include valid fields
-        field_mapping = {
-            'Stage': 'Stage',
-            'Status': 'Status',
-            'Live Date': 'Live Date',
-            'With Client?': 'With Client?'
-        }
-        
-        update_fields = {}
-        for key, airtable_field in field_mapping.items():
-            if key in updates and updates[key] is not None:
-                update_fields[airtable_field] = updates[key]
+        update_fields = _writable_project_fields(updates)
         
         if not update_fields:
             print("No project fields to update")
             return True
         
-        update_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_PROJECTS_TABLE}/{project['recordId']}"
-        update_data = {'fields': update_fields}
-        
-        response = httpx.patch(update_url, headers=_get_headers(), json=update_data, timeout=10.0)
-        response.raise_for_status()
+        if _project_coalescer:
+            # Rides along with other requests' changes in one batched PATCH
+            if not _project_coalescer.submit((record_id, update_fields)).result(timeout=_COALESCE_RESULT_TIMEOUT):
+                raise ValueError("Record missing from batch response")
+        else:
+            _patch_project(record_id, update_fields)
+        _invalidate_project_record(record_id, job_number)
         
-        print(f"Updated project {job_number}: {update_fields}")
+        print(f"Updated project {job_number or record_id}: {update_fields}")
         return True
         
     except Exception as e:
@@ -318,24 +690,182 @@ def increment_project_round(job_number):
         print("No Airtable API key configured")
         return None
     
+    # Read the live round - a cached value could be behind another worker's write
+    project = get_project_by_job_number(job_number, use_cache=False)
+    
+    if not project:
+        return None
+    
+    return increment_project_round_by_id(project['recordId'], project['round'], job_number=job_number)
+
+
+def increment_project_round_by_id(record_id, current_round, job_number=None):
+    """Set Round to current_round + 1 on a Project record by record ID.
+    
+    current_round should come from a live (uncached) project lookup.
+    Returns the new round number or None on failure.
+    """
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+    
     try:
-        project = get_project_by_job_number(job_number)
+        new_round = (current_round or 0) + 1
         
-        if not project:
-            return None
+        _patch_project(record_id, {'Round': new_round})
+        _invalidate_project_record(record_id, job_number)
         
-        current_round = project.get('round', 0) or 0
-        new_round = current_round + 1
+        print(f"Incremented round for {job_number or record_id}: {new_round}")
+        return new_round
         
-        update_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_PROJECTS_TABLE}/{project['recordId']}"
-        update_data = {'fields': {'Round': new_round}}
+    except Exception as e:
+        print(f"Error incrementing round in Airtable: {e}")
+        return None
+
+
+def mark_sent_to_client(record_id, current_round, job_number=None):
+    """Increment Round and set With Client? in a single PATCH.
+    
+    Used by Work-to-Client, which needs both changes on every send.
+    current_round should come from a live (uncached) project lookup.
+    Returns the new round number or None on failure.
+    """
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+    
+    try:
+        new_round = (current_round or 0) + 1
         
-        response = httpx.patch(update_url, headers=_get_headers(), json=update_data, timeout=10.0)
-        response.raise_for_status()
+        _patch_project(record_id, {'Round': new_round, 'With Client?': True})
+        _invalidate_project_record(record_id, job_number)
         
-        print(f"Incremented round for {job_number}: {new_round}")
+        print(f"Sent to client {job_number or record_id}: round {new_round}")
         return new_round
         
     except Exception as e:
-        print(f"Error incrementing round in Airtable: {e}")
+        print(f"Error marking project sent to client in Airtable: {e}")
         return None
+
+
+# ===================
+# BATCH WRITES
+# ===================
+
+def _chunks(items, size=AIRTABLE_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _post_updates_batch(field_sets):
+    """Create up to 10 Updates records in one POST.
+    
+    Returns the new record IDs in the same order. Errors are raised.
+    """
+    payload = {'records': [{'fields': fields} for fields in field_sets]}
+    response = _request('POST', _table_path(AIRTABLE_UPDATES_TABLE), json=payload)
+    response.raise_for_status()
+    
+    records = response.json().get('records', [])
+    for record in records:
+        mirror.upsert(AIRTABLE_UPDATES_TABLE, record)
+    return [record['id'] for record in records]
+
+
+def _patch_projects_batch(changes):
+    """Apply up to 10 (record_id, fields) changes in one PATCH.
+    
+    Changes to the same record are merged (later fields win), since a
+    record can only appear once per request. Returns the updated record
+    for each change, in order. Errors are raised.
+    """
+    merged = {}
+    for record_id, fields in changes:
+        merged.setdefault(record_id, {}).update(fields)
+    
+    payload = {'records': [{'id': record_id, 'fields': fields} for record_id, fields in merged.items()]}
+    response = _request('PATCH', _table_path(AIRTABLE_PROJECTS_TABLE), json=payload)
+    response.raise_for_status()
+    
+    updated = {record['id']: record for record in response.json().get('records', [])}
+    for record_id, record in updated.items():
+        mirror.upsert(AIRTABLE_PROJECTS_TABLE, record, merge=True)
+        _invalidate_project_record(record_id)
+    return [updated.get(record_id) for record_id, _ in changes]
+
+
+def bulk_create_updates(updates):
+    """Create many Updates records, 10 per request.
+    
+    Each item is a dict with project_record_id, update_text and optional
+    update_due (defaults to 5 working days, as in create_update).
+    Used when replaying a backlog of status emails.
+    Returns the new record IDs in order, with None for any that failed.
+    """
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return [None] * len(updates)
+    
+    field_sets = [
+        _new_update_fields(u['project_record_id'], u['update_text'], u.get('update_due'))
+        for u in updates
+    ]
+    
+    record_ids = []
+    for chunk in _chunks(field_sets):
+        try:
+            record_ids.extend(_post_updates_batch(chunk))
+        except Exception as e:
+            print(f"Error creating {len(chunk)} updates in Airtable: {e}")
+            record_ids.extend([None] * len(chunk))
+    
+    print(f"Created {sum(1 for r in record_ids if r)}/{len(updates)} updates")
+    return record_ids
+
+
+def bulk_update_projects(updates):
+    """Update fields on many Project records, 10 per request.
+    
+    Each item is a (record_id, fields) pair; fields follow the same rules
+    as update_project_fields (Stage, Status, Live Date, With Client?).
+    Used for bulk changes such as closing jobs at quarter end.
+    Returns a success flag per item, in order.
+    """
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return [False] * len(updates)
+    
+    changes = [(record_id, _writable_project_fields(fields)) for record_id, fields in updates]
+    
+    results = []
+    for chunk in _chunks(changes):
+        to_send = [change for change in chunk if change[1]]
+        try:
+            sent = _patch_projects_batch(to_send) if to_send else []
+            updated = iter(sent)
+            # Changes with no writable fields count as no-op successes
+            results.extend(bool(next(updated)) if fields else True for _, fields in chunk)
+        except Exception as e:
+            print(f"Error updating {len(chunk)} projects in Airtable: {e}")
+            results.extend([False] * len(chunk))
+    
+    print(f"Updated {sum(results)}/{len(updates)} projects")
+    return results
+
+
+# Coalesce single writes from concurrent requests (off unless a window is set)
+_update_coalescer = None
+_project_coalescer = None
+if AIRTABLE_WRITE_COALESCE_WINDOW > 0:
+    _update_coalescer = WriteCoalescer(
+        _post_updates_batch, AIRTABLE_BATCH_SIZE, AIRTABLE_WRITE_COALESCE_WINDOW, name='updates'
+    )
+    _project_coalescer = WriteCoalescer(
+        _patch_projects_batch, AIRTABLE_BATCH_SIZE, AIRTABLE_WRITE_COALESCE_WINDOW, name='projects'
+    )
+
+# Longest a coalesced write can reasonably take, including rate limiting and retries
+_COALESCE_RESULT_TIMEOUT = (
+    AIRTABLE_WRITE_COALESCE_WINDOW + AIRTABLE_RATE_WAIT
+    + (AIRTABLE_MAX_RETRIES + 1) * (AIRTABLE_TIMEOUT + AIRTABLE_BACKOFF_MAX)
+)
@@ -0,0 +1,516 @@
+# Dot Shared Airtable Functions (async)
+# asyncio versions of shared/airtable.py, for handlers that gather independent lookups
+#
+# Same names, arguments and return values as the sync module - just awaited.
+# Shares the sync module's lookup caches, rate limiter and local mirror; their
+# SQLite calls can wait on a file lock, so they run off the event loop.
+
+import asyncio
+import weakref
+import httpx
+
+from .config import (
+    AIRTABLE_API_KEY, AIRTABLE_API_URL, AIRTABLE_CLIENTS_TABLE, AIRTABLE_PROJECTS_TABLE, AIRTABLE_UPDATES_TABLE,
+    AIRTABLE_HTTP2, AIRTABLE_MAX_CONNECTIONS, AIRTABLE_MAX_KEEPALIVE, AIRTABLE_KEEPALIVE_EXPIRY,
+    AIRTABLE_TIMEOUT, AIRTABLE_CONNECT_TIMEOUT, AIRTABLE_RATE_WAIT, AIRTABLE_MAX_RETRIES,
+    AIRTABLE_BACKOFF_BASE, AIRTABLE_BACKOFF_MAX
+)
+from .ratelimit import backoff_delay, parse_retry_after
+from . import mirror
+from .airtable import (
+    _get_headers, _http2_available, _table_path, _list_params, _chunks,
+    _rate_limiter, RETRY_STATUS_CODES, RETRY_READ_STATUS_CODES, AirtableUnavailable, _is_unavailable,
+    _project_cache, _client_cache, invalidate_project, invalidate_client, _invalidate_project_record,
+    PROJECT_LOOKUP_FIELDS, CLIENT_LOOKUP_FIELDS, ACTIVE_JOB_FIELDS, ACTIVE_STATUSES,
+    _project_from_record, _client_from_record, _active_job_from_record, _active_jobs_formula,
+    _new_project_fields, _new_update_fields, _writable_project_fields
+)
+
+
+# ===================
+# HTTP CLIENT
+# ===================
+
+# An AsyncClient is tied to the event loop it was first used on, so keep one per loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_airtable_async_client():
+    """Get the pooled async Airtable client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=AIRTABLE_API_URL,
+            headers=_get_headers(),
+            http2=AIRTABLE_HTTP2 and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=AIRTABLE_MAX_CONNECTIONS,
+                max_keepalive_connections=AIRTABLE_MAX_KEEPALIVE,
+                keepalive_expiry=AIRTABLE_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(AIRTABLE_TIMEOUT, connect=AIRTABLE_CONNECT_TIMEOUT)
+        )
+        _clients[loop] = client
+
+    return client
+
+
+async def close_airtable_async_client():
+    """Close the running loop's client (call before the loop shuts down)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _request(method, path, **kwargs):
+    """Async _request - same rate limiting and retry rules as the sync module"""
+    retry_codes = RETRY_READ_STATUS_CODES if method == 'GET' else RETRY_STATUS_CODES
+
+    attempt = 0
+    while True:
+        await _rate_limiter.acquire_async(timeout=AIRTABLE_RATE_WAIT)
+
+        try:
+            response = await get_airtable_async_client().request(method, path, **kwargs)
+        except httpx.ConnectError:
+            # Request never reached Airtable, so it's safe to resend
+            if attempt >= AIRTABLE_MAX_RETRIES:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, AIRTABLE_BACKOFF_BASE, AIRTABLE_BACKOFF_MAX))
+            attempt += 1
+            continue
+
+        if response.status_code not in retry_codes or attempt >= AIRTABLE_MAX_RETRIES:
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        delay = backoff_delay(attempt, AIRTABLE_BACKOFF_BASE, AIRTABLE_BACKOFF_MAX, retry_after)
+        if response.status_code == 429:
+            await _rate_limiter.block_for_async(delay)
+
+        print(f"Airtable {response.status_code} on {method} {path} - retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+# ===================
+# PAGINATION
+# ===================
+
+async def _fetch_page(table, params, offset=None, timeout=None):
+    """Fetch one page of records. Returns (records, next_offset)."""
+    if offset:
+        params = params + [('offset', offset)]
+
+    kwargs = {'timeout': timeout} if timeout else {}
+    response = await _request('GET', _table_path(table), params=params, **kwargs)
+    response.raise_for_status()
+
+    body = response.json()
+    return body.get('records', []), body.get('offset')
+
+
+async def iter_records(table, formula=None, fields=None, sort=None, page_size=None, timeout=None):
+    """Async generator over every matching record, prefetching the next page"""
+    params = _list_params(formula, fields, sort, page_size)
+    records, offset = await _fetch_page(table, params, timeout=timeout)
+
+    while True:
+        next_page = None
+        if offset:
+            next_page = asyncio.ensure_future(_fetch_page(table, params, offset, timeout))
+
+        try:
+            for record in records:
+                yield record
+        except GeneratorExit:
+            if next_page:
+                next_page.cancel()
+            raise
+
+        if not next_page:
+            return
+
+        records, offset = await next_page
+
+
+async def find_record(table, formula, fields=None, timeout=None):
+    """Return the first record matching formula, or None"""
+    params = _list_params(formula, fields, page_size=1) + [('maxRecords', 1)]
+    records, _ = await _fetch_page(table, params, timeout=timeout)
+    return records[0] if records else None
+
+
+# ===================
+# READ OPERATIONS
+# ===================
+
+async def get_project_by_job_number(job_number, use_cache=True):
+    """Look up existing project by job number (see airtable.get_project_by_job_number)"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+
+    if use_cache:
+        cached = _project_cache.get(job_number)
+        if cached is not None:
+            return dict(cached)
+
+    try:
+        record = None
+        if use_cache and await asyncio.to_thread(mirror.is_fresh, AIRTABLE_PROJECTS_TABLE):
+            record = await asyncio.to_thread(mirror.find_record, AIRTABLE_PROJECTS_TABLE, 'job_number', job_number)
+
+        if not record:
+            record = await find_record(
+                AIRTABLE_PROJECTS_TABLE,
+                f"{{Job Number}}='{job_number}'",
+                fields=PROJECT_LOOKUP_FIELDS
+            )
+
+        if not record:
+            print(f"Job '{job_number}' not found in Airtable")
+            return None
+
+        project = _project_from_record(record, job_number)
+
+        _project_cache.set(job_number, project)
+        return dict(project)
+
+    except Exception as e:
+        print(f"Error looking up project in Airtable: {e}")
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        raise
+
+
+async def get_client_by_code(client_code, use_cache=True):
+    """Look up client by code (see airtable.get_client_by_code)"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+
+    if use_cache:
+        cached = _client_cache.get(client_code)
+        if cached is not None:
+            return dict(cached)
+
+    try:
+        record = None
+        if use_cache and await asyncio.to_thread(mirror.is_fresh, AIRTABLE_CLIENTS_TABLE):
+            record = await asyncio.to_thread(mirror.find_record, AIRTABLE_CLIENTS_TABLE, 'client_code', client_code)
+
+        if not record:
+            record = await find_record(
+                AIRTABLE_CLIENTS_TABLE,
+                f"{{Client code}}='{client_code}'",
+                fields=CLIENT_LOOKUP_FIELDS
+            )
+
+        if not record:
+            print(f"Client code '{client_code}' not found in Airtable")
+            return None
+
+        client = _client_from_record(record, client_code)
+
+        _client_cache.set(client_code, client)
+        return dict(client)
+
+    except Exception as e:
+        print(f"Error looking up client in Airtable: {e}")
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        raise
+
+
+async def get_active_jobs_for_client(client_code):
+    """Get all active (In Progress, On Hold) jobs for a client"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return []
+
+    try:
+        if await asyncio.to_thread(mirror.is_fresh, AIRTABLE_PROJECTS_TABLE):
+            records = await asyncio.to_thread(
+                mirror.select_records, AIRTABLE_PROJECTS_TABLE, order_by='job_number',
+                client_code=client_code, status=ACTIVE_STATUSES
+            )
+            return [_active_job_from_record(record) for record in records]
+
+        return [
+            _active_job_from_record(record)
+            async for record in iter_records(
+                AIRTABLE_PROJECTS_TABLE, formula=_active_jobs_formula(client_code), fields=ACTIVE_JOB_FIELDS
+            )
+        ]
+
+    except Exception as e:
+        print(f"Error getting active jobs for client: {e}")
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        raise
+
+
+# ===================
+# WRITE OPERATIONS
+# ===================
+
+async def increment_client_job_number(client_code):
+    """Increment and return the next job number for a client.
+
+    Returns (job_number, teams_id, sharepoint_url, client_record_id),
+    with a '<code> TBC' job number on failure.
+    """
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return f"{client_code} TBC", None, None, None
+
+    try:
+        # Always read the live counter - a cached Next # would hand out duplicates
+        client = await get_client_by_code(client_code, use_cache=False)
+
+        if not client:
+            return f"{client_code} TBC", None, None, None
+
+        current_number = client['nextNumber']
+        job_number = f"{client_code} {str(current_number).zfill(3)}"
+
+        update_data = {'fields': {'Next #': current_number + 1}}
+        response = await _request('PATCH', _table_path(AIRTABLE_CLIENTS_TABLE, client['recordId']), json=update_data)
+        invalidate_client(client_code)
+        if response.status_code == 429:
+            # Never applied - the number must not be handed out
+            raise AirtableUnavailable(f"Rate limited updating Next # for {client_code}")
+        if response.is_success:
+            await asyncio.to_thread(mirror.upsert, AIRTABLE_CLIENTS_TABLE, response.json(), merge=True)
+
+        return job_number, client['teamsId'], client['sharepointUrl'], client['recordId']
+
+    except Exception as e:
+        print(f"Error incrementing job number: {e}")
+        # A TBC number while Airtable is rate limited would become a TBC project
+        if isinstance(e, AirtableUnavailable):
+            raise
+        if _is_unavailable(e):
+            raise AirtableUnavailable(str(e)) from e
+        return f"{client_code} TBC", None, None, None
+
+
+async def create_project(job_number, job_name, description, project_owner, client_record_id):
+    """Create a new project record. Returns the new record ID or None."""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+
+    try:
+        job_data = {'fields': _new_project_fields(job_number, job_name, description, project_owner, client_record_id)}
+
+        response = await _request('POST', _table_path(AIRTABLE_PROJECTS_TABLE), json=job_data)
+        response.raise_for_status()
+        invalidate_project(job_number)
+
+        new_record = response.json()
+        await asyncio.to_thread(mirror.upsert, AIRTABLE_PROJECTS_TABLE, new_record)
+        print(f"Created project: {job_number}")
+        return new_record.get('id')
+
+    except Exception as e:
+        print(f"Error creating project in Airtable: {e}")
+        return None
+
+
+async def create_update(project_record_id, update_text, update_due=None):
+    """Create a new update record in the Updates table. Returns True on success."""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return False
+
+    try:
+        fields = _new_update_fields(project_record_id, update_text, update_due)
+
+        response = await _request('POST', _table_path(AIRTABLE_UPDATES_TABLE), json={'fields': fields})
+        response.raise_for_status()
+        await asyncio.to_thread(mirror.upsert, AIRTABLE_UPDATES_TABLE, response.json())
+
+        print(f"Created update for project {project_record_id}: {update_text}")
+        return True
+
+    except Exception as e:
+        print(f"Error creating update in Airtable: {e}")
+        return False
+
+
+async def _patch_project(record_id, fields):
+    """PATCH fields onto a Project record by record ID"""
+    response = await _request('PATCH', _table_path(AIRTABLE_PROJECTS_TABLE, record_id), json={'fields': fields})
+    response.raise_for_status()
+
+    record = response.json()
+    await asyncio.to_thread(mirror.upsert, AIRTABLE_PROJECTS_TABLE, record, merge=True)
+    return record
+
+
+async def update_project_fields(job_number, updates):
+    """Update Stage/Status/Live Date/With Client? on a project by job number"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return False
+
+    project = await get_project_by_job_number(job_number)
+
+    if not project:
+        return False
+
+    return await update_project_fields_by_id(project['recordId'], updates, job_number=job_number)
+
+
+async def update_project_fields_by_id(record_id, updates, job_number=None):
+    """Update Stage/Status/Live Date/With Client? on a project by record ID"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return False
+
+    try:
+        update_fields = _writable_project_fields(updates)
+
+        if not update_fields:
+            print("No project fields to update")
+            return True
+
+        await _patch_project(record_id, update_fields)
+        _invalidate_project_record(record_id, job_number)
+
+        print(f"Updated project {job_number or record_id}: {update_fields}")
+        return True
+
+    except Exception as e:
+        print(f"Error updating project in Airtable: {e}")
+        return False
+
+
+async def increment_project_round(job_number):
+    """Increment the Round counter on a project. Returns the new round."""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+
+    # Read the live round - a cached value could be behind another worker's write
+    project = await get_project_by_job_number(job_number, use_cache=False)
+
+    if not project:
+        return None
+
+    return await increment_project_round_by_id(project['recordId'], project['round'], job_number=job_number)
+
+
+async def increment_project_round_by_id(record_id, current_round, job_number=None):
+    """Set Round to current_round + 1 by record ID. Returns the new round."""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+
+    try:
+        new_round = (current_round or 0) + 1
+
+        await _patch_project(record_id, {'Round': new_round})
+        _invalidate_project_record(record_id, job_number)
+
+        print(f"Incremented round for {job_number or record_id}: {new_round}")
+        return new_round
+
+    except Exception as e:
+        print(f"Error incrementing round in Airtable: {e}")
+        return None
+
+
+async def mark_sent_to_client(record_id, current_round, job_number=None):
+    """Increment Round and set With Client? in a single PATCH. Returns the new round."""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return None
+
+    try:
+        new_round = (current_round or 0) + 1
+
+        await _patch_project(record_id, {'Round': new_round, 'With Client?': True})
+        _invalidate_project_record(record_id, job_number)
+
+        print(f"Sent to client {job_number or record_id}: round {new_round}")
+        return new_round
+
+    except Exception as e:
+        print(f"Error marking project sent to client in Airtable: {e}")
+        return None
+
+
+# ===================
+# BATCH WRITES
+# ===================
+
+async def bulk_create_updates(updates):
+    """Create many Updates records, 10 per request (see airtable.bulk_create_updates)"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return [None] * len(updates)
+
+    field_sets = [
+        _new_update_fields(u['project_record_id'], u['update_text'], u.get('update_due'))
+        for u in updates
+    ]
+
+    record_ids = []
+    for chunk in _chunks(field_sets):
+        try:
+            payload = {'records': [{'fields': fields} for fields in chunk]}
+            response = await _request('POST', _table_path(AIRTABLE_UPDATES_TABLE), json=payload)
+            response.raise_for_status()
+
+            records = response.json().get('records', [])
+            for record in records:
+                await asyncio.to_thread(mirror.upsert, AIRTABLE_UPDATES_TABLE, record)
+            record_ids.extend(record['id'] for record in records)
+        except Exception as e:
+            print(f"Error creating {len(chunk)} updates in Airtable: {e}")
+            record_ids.extend([None] * len(chunk))
+
+    print(f"Created {sum(1 for r in record_ids if r)}/{len(updates)} updates")
+    return record_ids
+
+
+async def bulk_update_projects(updates):
+    """Update many Project records, 10 per request (see airtable.bulk_update_projects)"""
+    if not AIRTABLE_API_KEY:
+        print("No Airtable API key configured")
+        return [False] * len(updates)
+
+    changes = [(record_id, _writable_project_fields(fields)) for record_id, fields in updates]
+
+    results = []
+    for chunk in _chunks(changes):
+        merged = {}
+        for record_id, fields in chunk:
+            if fields:
+                merged.setdefault(record_id, {}).update(fields)
+
+        try:
+            updated = {}
+            if merged:
+                payload = {'records': [{'id': record_id, 'fields': fields} for record_id, fields in merged.items()]}
+                response = await _request('PATCH', _table_path(AIRTABLE_PROJECTS_TABLE), json=payload)
+                response.raise_for_status()
+
+                updated = {record['id']: record for record in response.json().get('records', [])}
+                for record_id, record in updated.items():
+                    await asyncio.to_thread(mirror.upsert, AIRTABLE_PROJECTS_TABLE, record, merge=True)
+                    _invalidate_project_record(record_id)
+
+            # Changes with no writable fields count as no-op successes
+            results.extend(record_id in updated if fields else True for record_id, fields in chunk)
+        except Exception as e:
+            print(f"Error updating {len(chunk)} projects in Airtable: {e}")
+            results.extend([False] * len(chunk))
+
+    print(f"Updated {sum(results)}/{len(updates)} projects")
+    return results
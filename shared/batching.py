@@ -0,0 +1,96 @@
+# Dot Shared Batching
+# Coalesces individual writes into batched requests
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteCoalescer:
+    """Collects items submitted within a short window and flushes them together.
+
+    flush(items) is called with up to max_batch items and must return a
+    list of results aligned with them. Each submit() returns a Future that
+    resolves to that item's result (or the flush's exception). The flusher
+    thread starts on first use and is re-created after a fork, or on the
+    next submit if it dies (its queued callers get the exception).
+    """
+
+    def __init__(self, flush, max_batch=10, window=0.05, name='writes'):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.window = window
+        self.name = name
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item):
+        future = Future()
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append((item, future))
+            self._cond.notify()
+        return future
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            # Items queued before a fork belong to the parent's callers
+            self._pending = []
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f'coalesce-{self.name}', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _next_batch(self):
+        """Wait for a first item, then up to `window` more for the batch to fill"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._flush_batch(batch)
+            except BaseException as e:
+                # Don't leave callers waiting on a thread that's gone - fail this
+                # batch and everything queued behind it now
+                with self._cond:
+                    queued, self._pending = self._pending, []
+                    self._thread = None
+                _fail(batch + queued, e)
+                raise
+
+    def _flush_batch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.flush(items)
+        except Exception as e:
+            _fail(batch, e)
+            return
+
+        results = list(results) + [None] * (len(batch) - len(results))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _fail(batch, error):
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
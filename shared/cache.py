@@ -0,0 +1,181 @@
+# Dot Shared Cache
+# Small in-process caches used across Dot apps
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ttl seconds.
+
+    Thread-safe, so it can be shared by all request threads in a worker.
+    Keeps hit/miss/eviction counters for the health endpoints.
+    """
+
+    def __init__(self, maxsize=512, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value or None if missing/expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if full"""
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a single key (no-op if not cached)"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose value matches predicate(value)"""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def clear(self):
+        """Drop everything and reset counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class PersistentCache:
+    """JSON key/value cache in a local SQLite file, shared by all workers on a host.
+
+    Use where every gunicorn worker should see the same entries (e.g. a
+    value stored by one worker and served by another). Entries expire
+    after their ttl; hit/miss counters are per process.
+    """
+
+    def __init__(self, path, ttl=3600.0, name='cache'):
+        self.path = path
+        self.ttl = ttl
+        self.name = name
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        """One connection per thread per process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.name} (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return the cached value or None if missing/expired"""
+        row = self._connect().execute(
+            f'SELECT value FROM {self.name} WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serialisable value"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._connect().execute(
+            f'INSERT OR REPLACE INTO {self.name} (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), expires_at)
+        )
+
+    def add(self, key, value, ttl=None):
+        """Store only if key is absent or expired. Returns True if stored.
+
+        Atomic across processes, so it can be used to claim work.
+        """
+        conn = self._connect()
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'DELETE FROM {self.name} WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = conn.execute(
+                f'INSERT OR IGNORE INTO {self.name} (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            conn.execute('COMMIT')
+            return cursor.rowcount == 1
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, key):
+        self._connect().execute(f'DELETE FROM {self.name} WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        """Drop expired entries; returns how many were removed"""
+        cursor = self._connect().execute(f'DELETE FROM {self.name} WHERE expires_at <= ?', (time.time(),))
+        return cursor.rowcount
+
+    def stats(self):
+        """Counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,94 @@
+# Dot Shared Compression
+# Accept-Encoding negotiated gzip/brotli compression for Flask responses
+
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/html',
+    'text/plain'
+}
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _supported_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _choose_encoding():
+    """Best encoding the client accepts, or None"""
+    return request.accept_encodings.best_match(_supported_encodings())
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return zlib.compress(data, GZIP_LEVEL, wbits=31)
+
+
+def _compress_stream(chunks, encoding):
+    """Compress an iterable of bytes, flushing after each chunk so the
+    client can start decoding before the body is finished"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+def compress_response(response, min_size=1024):
+    """Compress a response in place if the client accepts gzip/br.
+
+    Streamed responses are compressed chunk by chunk; buffered ones
+    smaller than min_size are left alone.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = _choose_encoding()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(_compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app, min_size=1024):
+    """Compress every eligible response from app"""
+    app.after_request(lambda response: compress_response(response, min_size))
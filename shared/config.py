@@ -12,9 +12,98 @@ AIRTABLE_CLIENTS_TABLE = 'Clients'
 AIRTABLE_PROJECTS_TABLE = 'Projects'
 AIRTABLE_UPDATES_TABLE = 'Updates'
 
+# Airtable HTTP client (one pooled, keep-alive client per process)
+AIRTABLE_API_URL = f'https://api.airtable.com/v0/{AIRTABLE_BASE_ID}'
+AIRTABLE_HTTP2 = os.environ.get('AIRTABLE_HTTP2', 'true').lower() == 'true'
+AIRTABLE_MAX_CONNECTIONS = int(os.environ.get('AIRTABLE_MAX_CONNECTIONS', 10))
+AIRTABLE_MAX_KEEPALIVE = int(os.environ.get('AIRTABLE_MAX_KEEPALIVE', 5))
+AIRTABLE_KEEPALIVE_EXPIRY = float(os.environ.get('AIRTABLE_KEEPALIVE_EXPIRY', 60.0))
+AIRTABLE_TIMEOUT = float(os.environ.get('AIRTABLE_TIMEOUT', 10.0))
+AIRTABLE_CONNECT_TIMEOUT = float(os.environ.get('AIRTABLE_CONNECT_TIMEOUT', 5.0))
+AIRTABLE_PAGE_SIZE = int(os.environ.get('AIRTABLE_PAGE_SIZE', 100))  # Airtable max is 100
+AIRTABLE_PREFETCH_WORKERS = int(os.environ.get('AIRTABLE_PREFETCH_WORKERS', 4))
+
+# Rate limiting - Airtable allows 5 requests/second per base. The bucket is
+# shared by all workers on a host through a local SQLite file; lower the
+# rate per service if several services share the base at peak times.
+AIRTABLE_RATE_LIMIT = float(os.environ.get('AIRTABLE_RATE_LIMIT', 5.0))
+AIRTABLE_RATE_BURST = float(os.environ.get('AIRTABLE_RATE_BURST', 5.0))
+AIRTABLE_RATE_LIMIT_DB = os.environ.get('AIRTABLE_RATE_LIMIT_DB', '/tmp/dot-airtable-ratelimit.sqlite')
+AIRTABLE_RATE_WAIT = float(os.environ.get('AIRTABLE_RATE_WAIT', 30.0))  # max seconds to queue for a token
+AIRTABLE_MAX_RETRIES = int(os.environ.get('AIRTABLE_MAX_RETRIES', 4))
+AIRTABLE_BACKOFF_BASE = float(os.environ.get('AIRTABLE_BACKOFF_BASE', 0.5))
+AIRTABLE_BACKOFF_MAX = float(os.environ.get('AIRTABLE_BACKOFF_MAX', 30.0))
+
+# Write batching - Airtable accepts up to 10 records per create/update call.
+# With a window > 0, single writes from concurrent requests are coalesced.
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_WRITE_COALESCE_WINDOW = float(os.environ.get('AIRTABLE_WRITE_COALESCE_WINDOW', 0.0))
+
+# Read-through cache for project/client lookups (per worker, 0 disables)
+AIRTABLE_CACHE_TTL = float(os.environ.get('AIRTABLE_CACHE_TTL', 60.0))
+AIRTABLE_CACHE_SIZE = int(os.environ.get('AIRTABLE_CACHE_SIZE', 512))
+
+# Optional local SQLite mirror of Projects/Clients/Updates (see shared/mirror.py)
+AIRTABLE_MIRROR_ENABLED = os.environ.get('AIRTABLE_MIRROR_ENABLED', 'false').lower() == 'true'
+AIRTABLE_MIRROR_DB = os.environ.get('AIRTABLE_MIRROR_DB', '/tmp/dot-airtable-mirror.sqlite')
+AIRTABLE_MIRROR_MAX_STALENESS = float(os.environ.get('AIRTABLE_MIRROR_MAX_STALENESS', 300.0))
+AIRTABLE_MIRROR_SYNC_INTERVAL = float(os.environ.get('AIRTABLE_MIRROR_SYNC_INTERVAL', 60.0))
+AIRTABLE_MIRROR_FULL_SYNC_INTERVAL = float(os.environ.get('AIRTABLE_MIRROR_FULL_SYNC_INTERVAL', 3600.0))
+
 # Anthropic
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
-ANTHROPIC_MODEL = 'claude-sonnet-4-20250514'
+ANTHROPIC_MODEL = os.environ.get('ANTHROPIC_MODEL', 'claude-sonnet-4-20250514')
+
+# Small, fast model for first-pass classification (Traffic escalates to
+# ANTHROPIC_MODEL when it isn't confident). Per-app/per-stage overrides
+# are read by shared.llm.model_for, e.g. TRIAGE_MODEL, TRAFFIC_CLASSIFY_MODEL.
+ANTHROPIC_SMALL_MODEL = os.environ.get('ANTHROPIC_SMALL_MODEL', 'claude-3-5-haiku-20241022')
+
+# LLM gateway - one pooled client per worker, retries on 429/5xx/529 and
+# connection errors, and a per-model circuit breaker. If the primary model
+# keeps failing (or its breaker is open) calls go to the fallback model.
+ANTHROPIC_TIMEOUT = float(os.environ.get('ANTHROPIC_TIMEOUT', 60.0))
+ANTHROPIC_CONNECT_TIMEOUT = float(os.environ.get('ANTHROPIC_CONNECT_TIMEOUT', 5.0))
+ANTHROPIC_MAX_CONNECTIONS = int(os.environ.get('ANTHROPIC_MAX_CONNECTIONS', 20))
+ANTHROPIC_MAX_RETRIES = int(os.environ.get('ANTHROPIC_MAX_RETRIES', 3))
+ANTHROPIC_BACKOFF_BASE = float(os.environ.get('ANTHROPIC_BACKOFF_BASE', 1.0))
+ANTHROPIC_BACKOFF_MAX = float(os.environ.get('ANTHROPIC_BACKOFF_MAX', 20.0))
+ANTHROPIC_FALLBACK_MODEL = os.environ.get('ANTHROPIC_FALLBACK_MODEL', '')  # empty = no fallback
+ANTHROPIC_BREAKER_THRESHOLD = int(os.environ.get('ANTHROPIC_BREAKER_THRESHOLD', 5))  # consecutive failed calls
+ANTHROPIC_BREAKER_COOLDOWN = float(os.environ.get('ANTHROPIC_BREAKER_COOLDOWN', 30.0))  # seconds before a trial call
+
+# Prompt caching - system prompts are sent as cacheable blocks so repeat
+# calls within the cache lifetime (~5 minutes) read them from cache
+ANTHROPIC_PROMPT_CACHE = os.environ.get('ANTHROPIC_PROMPT_CACHE', 'true').lower() == 'true'
+
+# Structured output - replies are forced through each app's schema.json tool
+ANTHROPIC_STRUCTURED_OUTPUT = os.environ.get('ANTHROPIC_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+
+# Email bodies are compacted (quoted history, signatures and disclaimers
+# stripped) and capped at this many tokens before going to Claude
+EMAIL_COMPACTION = os.environ.get('EMAIL_COMPACTION', 'true').lower() == 'true'
+EMAIL_TOKEN_BUDGET = int(os.environ.get('EMAIL_TOKEN_BUDGET', 4000))
+
+# Idempotency - retried requests (same Idempotency-Key header, or same
+# sender/subject/body) within the window replay the first response
+IDEMPOTENCY_ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+IDEMPOTENCY_DB = os.environ.get('IDEMPOTENCY_DB', '/tmp/dot-idempotency.sqlite')
+IDEMPOTENCY_WINDOW = float(os.environ.get('IDEMPOTENCY_WINDOW', 600.0))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 90.0))  # max seconds a duplicate waits for the original
+IDEMPOTENCY_LOCK_TTL = float(os.environ.get('IDEMPOTENCY_LOCK_TTL', 120.0))  # in-flight claim expiry if a worker dies
+
+# Async jobs - a request with ?async=true (or Prefer: respond-async) is
+# queued in a local SQLite file and answered 202 with a job ID. Each worker
+# process runs ASYNC_JOBS_WORKERS threads that work through the queue.
+ASYNC_JOBS_ENABLED = os.environ.get('ASYNC_JOBS_ENABLED', 'true').lower() == 'true'
+ASYNC_JOBS_DB = os.environ.get('ASYNC_JOBS_DB', '/tmp/dot-jobs.sqlite')
+ASYNC_JOBS_WORKERS = int(os.environ.get('ASYNC_JOBS_WORKERS', 2))
+ASYNC_JOBS_MAX_QUEUED = int(os.environ.get('ASYNC_JOBS_MAX_QUEUED', 500))  # 503 when this many are waiting
+ASYNC_JOBS_MAX_ATTEMPTS = int(os.environ.get('ASYNC_JOBS_MAX_ATTEMPTS', 3))  # runs when Claude is unavailable (503)
+ASYNC_JOBS_LEASE = float(os.environ.get('ASYNC_JOBS_LEASE', 300.0))  # running job is retried if its worker vanishes
+ASYNC_JOBS_RETENTION = float(os.environ.get('ASYNC_JOBS_RETENTION', 86400.0))  # finished jobs kept for polling
+ASYNC_JOBS_CALLBACK_TIMEOUT = float(os.environ.get('ASYNC_JOBS_CALLBACK_TIMEOUT', 10.0))
+ASYNC_JOBS_CALLBACK_HOSTS = [h.strip().lower() for h in os.environ.get('ASYNC_JOBS_CALLBACK_HOSTS', '').split(',') if h.strip()]  # empty = callbacks off
 
 # Valid client codes
 VALID_CLIENT_CODES = ['ONE', 'ONS', 'SKY', 'TOW', 'FIS', 'FST', 'WKA', 'HUN', 'LAB', 'EON', 'OTH']
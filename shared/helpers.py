@@ -1,8 +1,12 @@
 # Dot Shared Helpers
 # Utility functions used across all Dot apps
 
+import html
+import re
 from datetime import date, timedelta
 
+from .config import EMAIL_COMPACTION, EMAIL_TOKEN_BUDGET
+
 
 def strip_markdown_json(content):
     """Strip markdown code blocks from Claude's JSON response"""
@@ -57,3 +61,206 @@ def format_date_display(date_str):
         return date_str
     except:
         return date_str
+
+
+# ===================
+# EMAIL COMPACTION
+# ===================
+
+# Where quoted history starts: "> " lines, "On ... wrote:", Outlook
+# "From:/Sent:" blocks and separator lines
+QUOTE_START_PATTERN = re.compile(
+    r'^[ \t]*(>|On .+wrote:\s*$|From:.*\n[ \t]*(Sent|Date):|-{2,}\s*(Original|Forwarded) Message|_{10,})',
+    re.I | re.M
+)
+FORWARD_PATTERN = re.compile(r'^[ \t]*-{2,}\s*Forwarded message', re.I | re.M)
+
+# A new message shorter than this (in words) is treated as a cover note for
+# the quoted message below it (e.g. "FYI - see brief below"), which is kept
+COVER_NOTE_WORDS = 40
+
+SIGN_OFF_PATTERN = re.compile(
+    r'^[ \t]*(thanks|thank you|cheers|regards|kind regards|best regards|many thanks|best|nga mihi|ngā mihi)[ \t]*[,!.]?[ \t]*$',
+    re.I
+)
+
+# What can follow a sign-off for it to count as one: a name and contact
+# details (short lines, no list items, no sentences)
+SIGNATURE_MAX_LINES = 8
+SIGNATURE_MAX_LINE_LENGTH = 60
+SIGNATURE_MAX_WORDS = 8
+LIST_ITEM_PATTERN = re.compile(r'^[ \t]*([-*•]|\d+[.)])\s')
+SIGNATURE_DELIMITER_PATTERN = re.compile(r'^(-- ?|Sent from my .+|Get Outlook for .+)$', re.I)
+
+# Paragraphs that are pure boilerplate
+BOILERPLATE_PATTERNS = [
+    re.compile(r'(confidential|privileged).{0,200}(intended recipient|addressee|received this (e-?mail|message) in error)', re.I | re.S),
+    re.compile(r'this (e-?mail|message) and any (attachments|files)', re.I),
+    re.compile(r'please consider the environment before printing', re.I),
+    re.compile(r'^\s*(caution|external email)\s*:?.{0,40}(originated|outside)', re.I),
+    re.compile(r'^\s*(disclaimer|unsubscribe)\b', re.I)
+]
+
+HTML_BLOCK_PATTERN = re.compile(r'<\s*/?\s*(br|p|div|li|tr|h[1-6])\b[^>]*>', re.I)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)"""
+    return (len(text or '') + 3) // 4
+
+
+def html_to_text(content):
+    """Plain text from an HTML email body"""
+    content = re.sub(r'<(style|script)\b.*?</\1>', '', content, flags=re.I | re.S)
+    content = HTML_BLOCK_PATTERN.sub('\n', content)
+    return html.unescape(HTML_TAG_PATTERN.sub('', content))
+
+
+def split_quoted(content):
+    """Split an email into (new message, quoted history)"""
+    match = QUOTE_START_PATTERN.search(content or '')
+    if not match:
+        return content or '', ''
+    return content[:match.start()], content[match.start():]
+
+
+def strip_quoted_history(content):
+    """Drop quoted reply history, keeping a forwarded or cover-noted message.
+    
+    "See below" forwards keep the first quoted message (the thing being
+    forwarded) but not the history quoted inside it.
+    """
+    new, quoted = split_quoted(content)
+    if not quoted:
+        return new
+    
+    if FORWARD_PATTERN.match(quoted) or len(new.split()) < COVER_NOTE_WORDS:
+        return new + _first_quoted_message(quoted)
+    
+    return new
+
+
+def _first_quoted_message(quoted):
+    """The first message in quoted history, without anything quoted inside it"""
+    lines = quoted.split('\n')
+    
+    # "> " style: keep the single-level quoted lines
+    if any(line.lstrip().startswith('>') for line in lines[:2]):
+        kept = []
+        for line in lines:
+            stripped = line.lstrip()
+            if not stripped.startswith('>') and kept and stripped:
+                break
+            if not re.match(r'>\s*>', stripped):
+                kept.append(line)
+        return '\n'.join(kept)
+    
+    # Outlook/forward style: keep the header block, then cut at the next marker
+    header_end = re.search(r'\n[ \t]*\n', quoted)
+    if not header_end:
+        return quoted
+    inner, _ = split_quoted(quoted[header_end.end():])
+    return quoted[:header_end.end()] + inner
+
+
+def _is_signature_line(line):
+    """A name, title, phone number or address - not message content"""
+    line = line.strip()
+    return (
+        len(line) <= SIGNATURE_MAX_LINE_LENGTH
+        and len(line.split()) <= SIGNATURE_MAX_WORDS
+        and not LIST_ITEM_PATTERN.match(line)
+        and not line.endswith(('.', '?', '!', ':', ';'))
+    )
+
+
+def strip_signature(content):
+    """Drop everything after a signature delimiter, or after the last
+    sign-off line and name when only a name/contact block follows it"""
+    lines = content.split('\n')
+    
+    for i, line in enumerate(lines):
+        if SIGNATURE_DELIMITER_PATTERN.match(line.rstrip()):
+            lines = lines[:i]
+            break
+    
+    for i in range(len(lines) - 1, -1, -1):
+        if SIGN_OFF_PATTERN.match(lines[i]):
+            tail = [line for line in lines[i + 1:] if line.strip()]
+            # A "Thanks!" with the request still to come isn't a sign-off
+            if len(tail) <= SIGNATURE_MAX_LINES and all(_is_signature_line(line) for line in tail):
+                lines = lines[:i + 1] + tail[:1]
+            break
+    
+    return '\n'.join(lines)
+
+
+def strip_boilerplate(content):
+    """Drop disclaimer and banner paragraphs"""
+    paragraphs = re.split(r'\n[ \t]*\n', content)
+    kept = [p for p in paragraphs if not any(pattern.search(p) for pattern in BOILERPLATE_PATTERNS)]
+    return '\n\n'.join(kept)
+
+
+def normalize_whitespace(content):
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+    content = content.replace('\u00a0', ' ').replace('\u200b', '')
+    content = re.sub(r'[ \t]+', ' ', content)
+    content = re.sub(r' *\n *', '\n', content)
+    content = re.sub(r'\n{3,}', '\n\n', content)
+    return content.strip()
+
+
+def truncate_to_budget(content, max_tokens):
+    """Keep the head and tail of content within max_tokens, marking the cut"""
+    if max_tokens is None or estimate_tokens(content) <= max_tokens:
+        return content, False
+    
+    max_chars = max_tokens * 4
+    head = int(max_chars * 0.7)
+    tail = max_chars - head
+    omitted = len(content) - head - tail
+    return f"{content[:head]}\n\n[... {omitted} characters omitted ...]\n\n{content[-tail:]}", True
+
+
+def compact_email(content, max_tokens=None):
+    """Shrink an email body before sending it to Claude.
+    
+    Strips quoted history, signatures and boilerplate, normalises
+    whitespace and enforces a token budget (EMAIL_TOKEN_BUDGET by default)
+    with head/tail truncation.
+    
+    Returns:
+        Tuple of (compacted text, stats dict with originalTokens,
+        compactedTokens, tokensSaved and truncated)
+    """
+    original = content or ''
+    if max_tokens is None:
+        max_tokens = EMAIL_TOKEN_BUDGET
+    
+    if not EMAIL_COMPACTION:
+        compacted, truncated = original, False
+    else:
+        compacted = original
+        if re.search(r'<(br|p|div|html|table)\b', compacted, re.I):
+            compacted = html_to_text(compacted)
+        compacted = compacted.replace('\r\n', '\n').replace('\r', '\n')
+        compacted = strip_quoted_history(compacted)
+        compacted = strip_boilerplate(compacted)
+        compacted = strip_signature(compacted)
+        compacted = normalize_whitespace(compacted)
+        compacted, truncated = truncate_to_budget(compacted, max_tokens)
+    
+    # Never send an empty body because every line looked like noise
+    if not compacted.strip():
+        compacted, truncated = truncate_to_budget(normalize_whitespace(original), max_tokens)
+    
+    original_tokens = estimate_tokens(original)
+    compacted_tokens = estimate_tokens(compacted)
+    return compacted, {
+        'originalTokens': original_tokens,
+        'compactedTokens': compacted_tokens,
+        'tokensSaved': original_tokens - compacted_tokens,
+        'truncated': truncated
+    }
@@ -0,0 +1,135 @@
+# Dot Shared Idempotency
+# Replays the stored response when a request is retried
+
+import functools
+import hashlib
+import json
+import threading
+import time
+
+from flask import request, make_response, Response
+
+from .cache import PersistentCache
+from .config import (
+    IDEMPOTENCY_ENABLED, IDEMPOTENCY_DB, IDEMPOTENCY_WINDOW,
+    IDEMPOTENCY_WAIT, IDEMPOTENCY_LOCK_TTL
+)
+
+
+POLL_INTERVAL = 0.2
+
+# Fields hashed when the caller sends no Idempotency-Key header
+DEFAULT_KEY_FIELDS = ('senderEmail', 'subjectLine', 'emailContent')
+
+_stores = {}
+_stores_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'executed': 0, 'replayed': 0, 'coalesced': 0, 'conflicts': 0}
+
+
+def _store(name):
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = PersistentCache(IDEMPOTENCY_DB, ttl=IDEMPOTENCY_WINDOW, name=f"idempotency_{name.replace('-', '_')}")
+        return _stores[name]
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def request_key(key_fields=DEFAULT_KEY_FIELDS):
+    """Idempotency-Key header, else a hash of the identifying body fields.
+
+    Returns None if neither is available (the request then runs as normal).
+    """
+    header = request.headers.get('Idempotency-Key', '').strip()
+    if header:
+        return f"key:{header}"
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not any(data.get(field) for field in key_fields):
+        return None
+
+    payload = json.dumps([data.get(field) for field in key_fields], sort_keys=True, default=str)
+    return f"hash:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def _replay(entry, how):
+    response = Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+    response.headers['Idempotent-Replayed'] = how
+    return response
+
+
+def idempotent(name, key_fields=DEFAULT_KEY_FIELDS):
+    """Make a Flask view safe to retry.
+
+    The first request for a key runs the view and stores its response for
+    IDEMPOTENCY_WINDOW seconds; repeats get the stored response back. A
+    repeat that arrives while the first is still running waits for it
+    (across all workers on the host) instead of running the view again.
+    5xx responses are not stored, so a failed request can be retried.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request_key(key_fields) if IDEMPOTENCY_ENABLED else None
+            if key is None:
+                return view(*args, **kwargs)
+
+            store = _store(name)
+            deadline = time.monotonic() + IDEMPOTENCY_WAIT
+            waited = False
+
+            while True:
+                try:
+                    claimed = store.add(key, {'state': 'pending'}, ttl=IDEMPOTENCY_LOCK_TTL)
+                except Exception as e:
+                    print(f"Idempotency store unavailable, running request: {e}")
+                    return view(*args, **kwargs)
+
+                if claimed:
+                    break
+
+                entry = store.get(key)
+                if entry and entry.get('state') == 'done':
+                    _count('coalesced' if waited else 'replayed')
+                    return _replay(entry, 'coalesced' if waited else 'true')
+
+                if time.monotonic() >= deadline:
+                    _count('conflicts')
+                    return make_response({'error': 'Duplicate request still in progress', 'retryable': True}, 409)
+
+                waited = True
+                time.sleep(POLL_INTERVAL)
+
+            _count('executed')
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                store.delete(key)
+                raise
+
+            if response.status_code >= 500 or response.is_streamed:
+                store.delete(key)
+            else:
+                store.set(key, {
+                    'state': 'done',
+                    'status': response.status_code,
+                    'mimetype': response.mimetype,
+                    'body': response.get_data(as_text=True)
+                })
+            return response
+
+        return wrapper
+    return decorator
+
+
+def get_idempotency_stats():
+    """Executed vs replayed/coalesced duplicates for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['enabled'] = IDEMPOTENCY_ENABLED
+    stats['window'] = IDEMPOTENCY_WINDOW
+    return stats
@@ -0,0 +1,400 @@
+# Dot Shared Async Jobs
+# Opt-in 202 + poll/callback mode for slow (Claude-backed) endpoints
+
+import os
+import functools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import httpx
+from flask import request, make_response, jsonify
+
+from .config import (
+    ASYNC_JOBS_ENABLED, ASYNC_JOBS_DB, ASYNC_JOBS_WORKERS, ASYNC_JOBS_MAX_QUEUED,
+    ASYNC_JOBS_MAX_ATTEMPTS, ASYNC_JOBS_LEASE, ASYNC_JOBS_RETENTION,
+    ASYNC_JOBS_CALLBACK_TIMEOUT, ASYNC_JOBS_CALLBACK_HOSTS
+)
+from .ratelimit import backoff_delay
+
+
+POLL_INTERVAL = 0.5
+PURGE_INTERVAL = 300.0
+CALLBACK_ATTEMPTS = 3
+
+# Request headers replayed when the job runs (so idempotency keys still apply)
+FORWARDED_HEADERS = ('Idempotency-Key',)
+
+
+class JobQueue:
+    """Durable job queue in a local SQLite file, shared by all workers on a host.
+
+    Jobs are claimed inside an IMMEDIATE transaction with a lease, so each
+    runs once; a job whose worker died is picked up again when its lease
+    runs out.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        """One connection per thread per process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            queue TEXT NOT NULL,
+            status TEXT NOT NULL,
+            path TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            headers TEXT NOT NULL,
+            callback_url TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,
+            lease_until REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            result_status INTEGER,
+            result TEXT,
+            callback_status TEXT
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (queue, status, available_at)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, queue, path, payload, headers, callback_url=None):
+        """Add a job; returns its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            '''INSERT INTO jobs (id, queue, status, path, payload, headers, callback_url, available_at, created_at)
+            VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)''',
+            (job_id, queue, path, json.dumps(payload), json.dumps(headers), callback_url, now, now)
+        )
+        return job_id
+
+    def claim(self, queues, lease):
+        """Take the oldest runnable job from queues, or None"""
+        if not queues:
+            return None
+
+        conn = self._connect()
+        now = time.time()
+        marks = ','.join('?' * len(queues))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                f'''SELECT * FROM jobs WHERE queue IN ({marks}) AND (
+                    (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until <= ?)
+                ) ORDER BY available_at LIMIT 1''',
+                (*queues, now, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    '''UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                    lease_until = ?, started_at = COALESCE(started_at, ?) WHERE id = ?''',
+                    (now + lease, now, row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if row is None:
+            return None
+        job = dict(row)
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'])
+        job['headers'] = json.loads(job['headers'])
+        return job
+
+    def retry_later(self, job_id, delay):
+        self._connect().execute(
+            "UPDATE jobs SET status = 'queued', lease_until = NULL, available_at = ? WHERE id = ?",
+            (time.time() + delay, job_id)
+        )
+
+    def finish(self, job_id, result_status, result):
+        self._connect().execute(
+            '''UPDATE jobs SET status = ?, result_status = ?, result = ?, finished_at = ?, lease_until = NULL
+            WHERE id = ?''',
+            ('done' if result_status < 400 else 'failed', result_status, json.dumps(result), time.time(), job_id)
+        )
+
+    def set_callback_status(self, job_id, callback_status):
+        self._connect().execute('UPDATE jobs SET callback_status = ? WHERE id = ?', (callback_status, job_id))
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self, queues, status):
+        marks = ','.join('?' * len(queues))
+        return self._connect().execute(
+            f'SELECT COUNT(*) FROM jobs WHERE queue IN ({marks}) AND status = ?', (*queues, status)
+        ).fetchone()[0]
+
+    def purge_finished(self, older_than):
+        """Drop finished jobs older than older_than seconds; returns how many"""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at <= ?",
+            (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+
+_queue = JobQueue(ASYNC_JOBS_DB)
+_views = {}
+_rerunnable = {}
+_app = None
+_wake = threading.Event()
+_workers = []
+_workers_pid = None
+_workers_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'queued': 0, 'completed': 0, 'failed': 0, 'retried': 0, 'callbacks': 0, 'callbackFailures': 0}
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp)) if timestamp else None
+
+
+def _wants_async():
+    return (
+        request.args.get('async', '').lower() in ('1', 'true', 'yes')
+        or 'respond-async' in request.headers.get('Prefer', '').lower()
+    )
+
+
+def _callback_allowed(url):
+    """Only POST results to hosts on the allowlist (none configured = no callbacks)"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    host = parsed.hostname.lower()
+    return any(host == allowed or host.endswith('.' + allowed) for allowed in ASYNC_JOBS_CALLBACK_HOSTS)
+
+
+def job_view(job):
+    """Public shape of a job for GET /jobs/<id> and callbacks"""
+    return {
+        'jobId': job['id'],
+        'queue': job['queue'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'createdAt': _iso(job['created_at']),
+        'startedAt': _iso(job['started_at']),
+        'finishedAt': _iso(job['finished_at']),
+        'resultStatus': job['result_status'],
+        'result': json.loads(job['result']) if job['result'] else None,
+        'callbackUrl': job['callback_url'],
+        'callbackStatus': job['callback_status']
+    }
+
+
+def async_job(name, retry_on_503=True):
+    """Let callers opt in to running a POST view in the background.
+
+    With ?async=true or a Prefer: respond-async header the JSON body is
+    queued and the caller gets 202 with a job ID and status URL (also in
+    Location). The result can be polled at GET /jobs/<id>, and is POSTed
+    to callbackUrl (body field or X-Callback-Url header) if one is given.
+    Requests without the opt-in run as normal.
+
+    retry_on_503 re-runs a job that got 503 (Claude unavailable) or whose
+    worker died mid-run. Pass False for views where a run cut short part
+    way through its Airtable writes can't safely be repeated.
+    """
+    def decorator(view):
+        _views[name] = view
+        _rerunnable[name] = retry_on_503
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not (ASYNC_JOBS_ENABLED and _wants_async()):
+                return view(*args, **kwargs)
+
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return view(*args, **kwargs)
+
+            callback_url = data.get('callbackUrl') or request.headers.get('X-Callback-Url')
+            if callback_url and not _callback_allowed(callback_url):
+                return make_response({'error': 'callbackUrl not allowed', 'details': callback_url}, 400)
+
+            try:
+                if _queue.count([name], 'queued') >= ASYNC_JOBS_MAX_QUEUED:
+                    response = make_response({'error': 'Job queue full', 'retryable': True}, 503)
+                    response.headers['Retry-After'] = '30'
+                    return response
+
+                headers = {h: request.headers[h] for h in FORWARDED_HEADERS if h in request.headers}
+                job_id = _queue.enqueue(name, request.path, data, headers, callback_url)
+            except sqlite3.Error as e:
+                print(f"Job queue unavailable, running request: {e}")
+                return view(*args, **kwargs)
+
+            _count('queued')
+            start_workers()
+            _wake.set()
+
+            status_url = f"{request.script_root}/jobs/{job_id}"
+            response = make_response({'jobId': job_id, 'status': 'queued', 'statusUrl': status_url}, 202)
+            response.headers['Location'] = status_url
+            return response
+
+        return wrapper
+    return decorator
+
+
+def _run(job):
+    """Run a claimed job's view in a request context built from the queued request"""
+    view = _views[job['queue']]
+    try:
+        with _app.test_request_context(job['path'], method='POST', json=job['payload'], headers=job['headers']):
+            response = _app.make_response(view())
+            result_status = response.status_code
+            result = response.get_json(silent=True)
+            if result is None:
+                result = response.get_data(as_text=True)
+    except Exception as e:
+        print(f"Job {job['id']} ({job['queue']}) failed: {e}")
+        result_status, result = 500, {'error': 'Internal server error', 'details': str(e)}
+
+    if result_status == 503 and _rerunnable[job['queue']] and job['attempts'] < ASYNC_JOBS_MAX_ATTEMPTS:
+        delay = backoff_delay(job['attempts'] - 1, 5.0, 120.0)
+        print(f"Job {job['id']} got 503 - retrying in {delay:.0f}s")
+        _queue.retry_later(job['id'], delay)
+        _count('retried')
+        return
+
+    _finish(job, result_status, result)
+
+
+def _finish(job, result_status, result):
+    _queue.finish(job['id'], result_status, result)
+    _count('completed' if result_status < 400 else 'failed')
+
+    if job['callback_url']:
+        _send_callback(job['id'], job['callback_url'])
+
+
+def _send_callback(job_id, url):
+    """POST the finished job to its callback URL, retrying 5xx/429/connection errors"""
+    body = job_view(_queue.get(job_id))
+    outcome = None
+    for attempt in range(CALLBACK_ATTEMPTS):
+        try:
+            response = httpx.post(url, json=body, timeout=ASYNC_JOBS_CALLBACK_TIMEOUT)
+            outcome = str(response.status_code)
+            if response.status_code < 300:
+                _queue.set_callback_status(job_id, f"delivered ({outcome})")
+                _count('callbacks')
+                return
+            if response.status_code < 500 and response.status_code != 429:
+                break
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if attempt < CALLBACK_ATTEMPTS - 1:
+            time.sleep(backoff_delay(attempt, 1.0, 30.0))
+
+    print(f"Callback for job {job_id} to {url} failed: {outcome}")
+    _queue.set_callback_status(job_id, f"failed ({outcome})")
+    _count('callbackFailures')
+
+
+def _worker_loop():
+    last_purge = 0.0
+    while True:
+        try:
+            job = _queue.claim(list(_views), ASYNC_JOBS_LEASE)
+        except sqlite3.Error as e:
+            print(f"Job queue claim failed: {e}")
+            job = None
+
+        if job is not None:
+            if job['status'] == 'running' and not _rerunnable[job['queue']]:
+                # Its worker died part way through - it may already have written to Airtable
+                _finish(job, 500, {'error': 'Job interrupted', 'details': 'Worker lost mid-run; not re-run as it may have partly completed'})
+            elif job['attempts'] > ASYNC_JOBS_MAX_ATTEMPTS:
+                # Lease ran out on every attempt - the job keeps killing its worker
+                _finish(job, 500, {'error': 'Job abandoned', 'details': 'Worker lost on every attempt'})
+            else:
+                _run(job)
+            continue
+
+        if time.time() - last_purge > PURGE_INTERVAL:
+            last_purge = time.time()
+            try:
+                _queue.purge_finished(ASYNC_JOBS_RETENTION)
+            except sqlite3.Error as e:
+                print(f"Job purge failed: {e}")
+
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+
+
+def start_workers():
+    """Start this process's job worker threads (once per process)"""
+    global _workers, _workers_pid
+
+    if not ASYNC_JOBS_ENABLED or _app is None:
+        return
+
+    with _workers_lock:
+        if _workers_pid != os.getpid():
+            _workers = []
+            _workers_pid = os.getpid()
+        _workers = [thread for thread in _workers if thread.is_alive()]
+        while len(_workers) < ASYNC_JOBS_WORKERS:
+            thread = threading.Thread(target=_worker_loop, name=f"async-job-{len(_workers)}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def get_job(job_id):
+    """GET /jobs/<id> - a queued job's status and, once finished, its result"""
+    job = _queue.get(job_id)
+    if job is None or job['queue'] not in _views:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_view(job))
+
+
+def init_jobs(app):
+    """Serve GET /jobs/<id> from app and start its job workers"""
+    global _app
+
+    _app = app
+    app.add_url_rule('/jobs/<job_id>', 'get_job', get_job, methods=['GET'])
+    start_workers()
+
+
+def get_jobs_stats():
+    """Queue depth for this app's queues and this process's job counters"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['enabled'] = ASYNC_JOBS_ENABLED
+    stats['workers'] = ASYNC_JOBS_WORKERS
+    if _views:
+        try:
+            stats['waiting'] = _queue.count(list(_views), 'queued')
+            stats['running'] = _queue.count(list(_views), 'running')
+        except sqlite3.Error as e:
+            stats['error'] = str(e)
+    return stats
@@ -0,0 +1,703 @@
+# Dot Shared LLM
+# Claude gateway: pooled client, retries, circuit breaking and model fallback,
+# plus cacheable system prompts, structured output and token usage tracking
+
+import os
+import json
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import httpx
+from anthropic import Anthropic, APIConnectionError, APIStatusError
+
+from .config import (
+    ANTHROPIC_API_KEY, ANTHROPIC_MODEL, ANTHROPIC_PROMPT_CACHE, ANTHROPIC_STRUCTURED_OUTPUT,
+    ANTHROPIC_TIMEOUT, ANTHROPIC_CONNECT_TIMEOUT, ANTHROPIC_MAX_CONNECTIONS, ANTHROPIC_MAX_RETRIES,
+    ANTHROPIC_BACKOFF_BASE, ANTHROPIC_BACKOFF_MAX, ANTHROPIC_FALLBACK_MODEL,
+    ANTHROPIC_BREAKER_THRESHOLD, ANTHROPIC_BREAKER_COOLDOWN
+)
+from .helpers import strip_markdown_json
+from .ratelimit import backoff_delay, parse_retry_after
+
+
+# Latencies kept per model for the p50/p95 figures on the health endpoints
+LATENCY_WINDOW = 500
+
+# Message Batches - polled at this interval while waiting for results.
+# The SDK adds the batches beta itself; prompt caching needs its own.
+BATCH_POLL_INTERVAL = 10.0
+BATCH_BETAS = ['prompt-caching-2024-07-31'] if ANTHROPIC_PROMPT_CACHE else []
+
+
+class LLMUnavailable(Exception):
+    """Claude couldn't be reached on any model (retries exhausted or circuit open)"""
+
+
+def model_for(app, stage=None, default=None):
+    """Model an app (or one stage of it) should call.
+    
+    Checks <APP>_<STAGE>_MODEL, then the stage's default, then <APP>_MODEL,
+    then ANTHROPIC_MODEL - e.g. model_for('traffic', 'classify',
+    ANTHROPIC_SMALL_MODEL) or model_for('work-to-client').
+    """
+    prefix = app.upper().replace('-', '_')
+    if stage:
+        model = os.environ.get(f"{prefix}_{stage.upper()}_MODEL") or default
+        if model:
+            return model
+    return os.environ.get(f"{prefix}_MODEL") or ANTHROPIC_MODEL
+
+
+# ===================
+# CLIENT
+# ===================
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_anthropic_client():
+    """Get the pooled Anthropic client for this process.
+    
+    Created lazily (and re-created after a fork) like the Airtable client.
+    The SDK's own retries are off - create_message owns retry policy.
+    """
+    global _client, _client_pid
+
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                timeout = httpx.Timeout(ANTHROPIC_TIMEOUT, connect=ANTHROPIC_CONNECT_TIMEOUT)
+                _client = Anthropic(
+                    api_key=ANTHROPIC_API_KEY,
+                    max_retries=0,
+                    timeout=timeout,
+                    http_client=httpx.Client(
+                        timeout=timeout,
+                        follow_redirects=True,
+                        limits=httpx.Limits(
+                            max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                            max_keepalive_connections=ANTHROPIC_MAX_CONNECTIONS
+                        )
+                    )
+                )
+                _client_pid = os.getpid()
+
+    return _client
+
+
+def close_anthropic_client():
+    """Close the pooled client (e.g. on worker shutdown)"""
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+# ===================
+# CIRCUIT BREAKER
+# ===================
+
+class CircuitBreaker:
+    """Per-model breaker: opens after `threshold` consecutive failed calls,
+    then lets a single trial call through once `cooldown` seconds pass.
+    
+    State is per process - each gunicorn worker trips independently.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go ahead now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.threshold > 0 and self.failures >= self.threshold):
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutiveFailures': self.failures, 'trips': self.trips}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def _breaker(model):
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(ANTHROPIC_BREAKER_THRESHOLD, ANTHROPIC_BREAKER_COOLDOWN)
+        return _breakers[model]
+
+
+# ===================
+# USAGE AND METRICS
+# ===================
+
+_usage_lock = threading.Lock()
+_usage_totals = {
+    'calls': 0,
+    'inputTokens': 0,
+    'outputTokens': 0,
+    'cacheReadTokens': 0,
+    'cacheWriteTokens': 0
+}
+_model_metrics = {}
+
+
+def _metrics(model):
+    """Per-model counters (caller holds _usage_lock)"""
+    if model not in _model_metrics:
+        _model_metrics[model] = {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'fallbacks': 0,
+            'inputTokens': 0,
+            'outputTokens': 0,
+            'latencies': deque(maxlen=LATENCY_WINDOW)
+        }
+    return _model_metrics[model]
+
+
+def _count(model, key):
+    with _usage_lock:
+        _metrics(model)[key] += 1
+
+
+def cacheable_system(prompt):
+    """System prompt as a single text block marked for prompt caching"""
+    return [{'type': 'text', 'text': prompt, 'cache_control': {'type': 'ephemeral'}}]
+
+
+def response_usage(response):
+    """Token counts for one Claude response, including prompt cache reads/writes"""
+    usage = response.usage
+    return {
+        'inputTokens': usage.input_tokens or 0,
+        'outputTokens': usage.output_tokens or 0,
+        'cacheReadTokens': getattr(usage, 'cache_read_input_tokens', None) or 0,
+        'cacheWriteTokens': getattr(usage, 'cache_creation_input_tokens', None) or 0
+    }
+
+
+def _record_usage(model, usage, latency):
+    with _usage_lock:
+        _usage_totals['calls'] += 1
+        for key, value in usage.items():
+            _usage_totals[key] += value
+
+        metrics = _metrics(model)
+        metrics['calls'] += 1
+        metrics['inputTokens'] += usage['inputTokens'] + usage['cacheReadTokens'] + usage['cacheWriteTokens']
+        metrics['outputTokens'] += usage['outputTokens']
+        if latency is not None:
+            metrics['latencies'].append(latency)
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+# ===================
+# GATEWAY
+# ===================
+
+def _is_retryable(error):
+    """Timeouts, connection failures, 408/409/429 and 5xx (incl. 529 overloaded)"""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (
+        error.status_code in (408, 409, 429) or error.status_code >= 500
+    )
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    return parse_retry_after(response.headers.get('retry-after')) if response is not None else None
+
+
+def _call_model(client, label, on_delta=None, **kwargs):
+    """One model with retries. Raises LLMUnavailable if its breaker is open,
+    otherwise the last API error once retries run out.
+    
+    With on_delta the response is streamed. Only opening the stream is
+    retried - once deltas have been handed out, a failure is raised as is.
+    """
+    model = kwargs['model']
+    breaker = _breaker(model)
+    if not breaker.allow():
+        raise LLMUnavailable(f"{model} circuit open")
+
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            if ANTHROPIC_PROMPT_CACHE:
+                response = client.beta.prompt_caching.messages.create(**kwargs)
+            else:
+                response = client.messages.create(**kwargs)
+        except (APIConnectionError, APIStatusError) as e:
+            if not _is_retryable(e):
+                # Claude answered, the request itself was bad
+                breaker.record_success()
+                raise
+
+            _count(model, 'errors')
+            if attempt >= ANTHROPIC_MAX_RETRIES:
+                breaker.record_failure()
+                raise
+
+            delay = backoff_delay(attempt, ANTHROPIC_BACKOFF_BASE, ANTHROPIC_BACKOFF_MAX, _retry_after(e))
+            print(f"{label} {model} failed ({type(e).__name__}: {e}) - retrying in {delay:.1f}s")
+            _count(model, 'retries')
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        breaker.record_success()
+        if on_delta is not None:
+            response = _collect_stream(response, on_delta)
+        return response, time.monotonic() - start
+
+
+def _collect_stream(stream, on_delta):
+    """Consume a messages stream, passing text and tool input JSON to
+    on_delta, and rebuild the final message from its events"""
+    message = None
+    blocks = []
+    for event in stream:
+        if event.type == 'message_start':
+            message = event.message
+        elif event.type == 'content_block_start':
+            block = event.content_block
+            blocks.append(SimpleNamespace(type=block.type, text=getattr(block, 'text', ''), name=getattr(block, 'name', None), partial=''))
+        elif event.type == 'content_block_delta':
+            delta = event.delta
+            if delta.type == 'text_delta':
+                blocks[-1].text += delta.text
+                on_delta(delta.text)
+            elif delta.type == 'input_json_delta':
+                blocks[-1].partial += delta.partial_json
+                on_delta(delta.partial_json)
+        elif event.type == 'message_delta':
+            message.stop_reason = event.delta.stop_reason
+            message.usage.output_tokens = event.usage.output_tokens
+
+    for block in blocks:
+        if block.type == 'tool_use':
+            try:
+                block.input = json.loads(block.partial) if block.partial else {}
+            except json.JSONDecodeError:
+                block.input = None  # cut off - create_structured reports it
+    message.content = blocks
+    return message
+
+
+def create_message(system, label='claude', client=None, on_delta=None, **kwargs):
+    """messages.create through the gateway, with the system prompt sent as
+    a cacheable block.
+    
+    Takes the same arguments as messages.create. Retries transient errors,
+    falls back to ANTHROPIC_FALLBACK_MODEL if the requested model is down
+    and raises LLMUnavailable if nothing answers. Logs and records the
+    call's latency and token usage, then returns (response, usage).
+    
+    If on_delta is given the response is streamed and on_delta(text) is
+    called with each piece of text or tool input JSON as it arrives.
+    """
+    client = client or get_anthropic_client()
+    kwargs['system'] = cacheable_system(system) if ANTHROPIC_PROMPT_CACHE else system
+    if on_delta is not None:
+        kwargs['stream'] = True
+
+    models = [kwargs['model']]
+    if ANTHROPIC_FALLBACK_MODEL and ANTHROPIC_FALLBACK_MODEL != kwargs['model']:
+        models.append(ANTHROPIC_FALLBACK_MODEL)
+
+    last_error = None
+    for model in models:
+        if last_error is not None:
+            print(f"{label} falling back to {model}: {last_error}")
+            _count(model, 'fallbacks')
+        try:
+            response, latency = _call_model(client, label, on_delta, **{**kwargs, 'model': model})
+            break
+        except LLMUnavailable as e:
+            last_error = e
+        except (APIConnectionError, APIStatusError) as e:
+            if not _is_retryable(e):
+                raise
+            last_error = e
+    else:
+        raise LLMUnavailable(f"Claude unavailable: {last_error}") from last_error
+
+    usage = response_usage(response)
+    _record_usage(model, usage, latency)
+    print(
+        f"{label} {model} {latency * 1000:.0f}ms tokens: input={usage['inputTokens']} output={usage['outputTokens']} "
+        f"cache_read={usage['cacheReadTokens']} cache_write={usage['cacheWriteTokens']}"
+    )
+    usage['model'] = model
+    usage['latencyMs'] = round(latency * 1000)
+    return response, usage
+
+
+def get_llm_stats():
+    """Token totals and per-model latency/error counts for this process,
+    for the health endpoints"""
+    with _usage_lock:
+        totals = dict(_usage_totals)
+        models = {}
+        for model, metrics in _model_metrics.items():
+            latencies = list(metrics['latencies'])
+            models[model] = {key: value for key, value in metrics.items() if key != 'latencies'}
+            models[model]['p50LatencyMs'] = round(_percentile(latencies, 0.5) * 1000) if latencies else None
+            models[model]['p95LatencyMs'] = round(_percentile(latencies, 0.95) * 1000) if latencies else None
+
+    for model in models:
+        models[model]['circuit'] = _breaker(model).stats()
+
+    prompt_tokens = totals['inputTokens'] + totals['cacheReadTokens'] + totals['cacheWriteTokens']
+    totals['promptCacheEnabled'] = ANTHROPIC_PROMPT_CACHE
+    totals['cacheReadRate'] = round(totals['cacheReadTokens'] / prompt_tokens, 3) if prompt_tokens else 0.0
+    totals['fallbackModel'] = ANTHROPIC_FALLBACK_MODEL or None
+    totals['models'] = models
+    return totals
+
+
+# ===================
+# STRUCTURED OUTPUT
+# ===================
+
+class InvalidModelOutput(json.JSONDecodeError):
+    """Claude's output couldn't be parsed as JSON, even after repair"""
+
+    def __init__(self, error, raw_response):
+        super().__init__(error.msg, error.doc, error.pos)
+        self.raw_response = raw_response
+
+
+def repair_json(text):
+    """Best-effort fix for common JSON slips: surrounding prose, trailing
+    commas, raw newlines inside strings and output cut off mid-object"""
+    text = strip_markdown_json(text)
+    start = text.find('{')
+    if start == -1:
+        return text
+    end = text.rfind('}')
+    text = text[start:end + 1] if end > start else text[start:]
+
+    repaired = []
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == '\n':
+                char = '\\n'
+            elif char == '\t':
+                char = '\\t'
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+        repaired.append(char)
+
+    if in_string:
+        repaired.append('"')
+    repaired = ''.join(repaired).rstrip().rstrip(',')
+    repaired += ''.join(reversed(stack))
+    return re.sub(r',\s*([}\]])', r'\1', repaired)
+
+
+def parse_json_output(text):
+    """Parse Claude's JSON text, with one local repair pass if it's malformed.
+    
+    Raises InvalidModelOutput (a JSONDecodeError) if repair doesn't help.
+    """
+    try:
+        return json.loads(strip_markdown_json(text))
+    except json.JSONDecodeError as e:
+        try:
+            result = json.loads(repair_json(text))
+            print(f"Repaired malformed JSON from Claude: {e}")
+            return result
+        except json.JSONDecodeError:
+            raise InvalidModelOutput(e, text)
+
+
+class PartialJSONObject:
+    """Picks completed top-level fields out of a JSON object as it streams in.
+    
+    feed() takes each new piece of text and returns the names of fields
+    it completed; their values are in .fields. Work is linear in the total
+    text - each character is looked at once.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.fields = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key = None
+        self._start = None  # where the current top-level key/value began
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        for i in range(self._pos, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._finish(i + 1, completed)
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._start = i
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 2:
+                    self._start = i
+            elif char in '}]':
+                if self._depth == 1 and self._start is not None:
+                    self._finish(i, completed)
+                self._depth -= 1
+                if self._depth == 1:
+                    self._finish(i + 1, completed)
+            elif self._depth == 1:
+                if char in ',: \t\r\n':
+                    if self._start is not None:
+                        self._finish(i, completed)
+                elif self._start is None:
+                    self._start = i
+        self._pos = len(self.text)
+        return completed
+
+    def _finish(self, end, completed):
+        """A top-level token ended at end - it's either a key or its value"""
+        token = self.text[self._start:end]
+        self._start = None
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            self._key = None
+            return
+        if self._key is None:
+            self._key = value if isinstance(value, str) else None
+        else:
+            self.fields[self._key] = value
+            completed.append(self._key)
+            self._key = None
+
+
+def create_structured(system, tool, label='claude', client=None, on_field=None, **kwargs):
+    """Claude call whose output is forced through a tool's JSON schema.
+    
+    tool is a tool definition ({'name', 'description', 'input_schema'}),
+    usually an app's schema.json. Returns (result dict, usage). Falls back
+    to parsing JSON text if no tool call comes back (or structured output
+    is turned off).
+    
+    With on_field the output is streamed and on_field(name, value) is
+    called as each top-level field is completed, before the rest of the
+    output has been generated.
+    """
+    structured_request(tool, kwargs)
+
+    on_delta = None
+    if on_field is not None:
+        partial = PartialJSONObject()
+
+        def on_delta(text):
+            for name in partial.feed(text):
+                on_field(name, partial.fields[name])
+
+    response, usage = create_message(system, label=label, client=client, on_delta=on_delta, **kwargs)
+    return parse_structured(response, tool, usage, label), usage
+
+
+def structured_request(tool, kwargs):
+    """Add tool and a forced tool_choice to messages.create kwargs (when structured output is on)"""
+    if ANTHROPIC_STRUCTURED_OUTPUT:
+        kwargs['tools'] = [tool]
+        kwargs['tool_choice'] = {'type': 'tool', 'name': tool['name']}
+    return kwargs
+
+
+def parse_structured(response, tool, usage=None, label='claude'):
+    """The tool input from a Claude response, or its JSON text parsed if
+    there's no tool call. Raises InvalidModelOutput if neither works."""
+    result = None
+    for block in response.content:
+        if block.type == 'tool_use' and block.name == tool['name'] and isinstance(block.input, dict):
+            result = block.input
+            break
+
+    if result is None:
+        text = ''.join(block.text for block in response.content if block.type == 'text')
+        # A streamed tool call cut off mid-object still gets a repair pass
+        text = text or ''.join(getattr(block, 'partial', '') for block in response.content if block.type == 'tool_use')
+        try:
+            result = parse_json_output(text)
+            if not isinstance(result, dict):
+                raise InvalidModelOutput(json.JSONDecodeError('Expected a JSON object', text, 0), text)
+        except InvalidModelOutput as e:
+            e.usage = usage  # the call was still billed
+            raise
+
+    missing = [field for field in tool['input_schema'].get('required', []) if field not in result]
+    if missing:
+        print(f"{label} output missing {', '.join(missing)} (stop reason: {response.stop_reason})")
+
+    return result
+
+
+# ===================
+# MESSAGE BATCHES
+# ===================
+
+def _retry_batch_call(label, send):
+    """Batch API call with the gateway's retry policy (no breaker or fallback -
+    a batch is pinned to the model it was submitted with). Raises
+    LLMUnavailable once retries run out."""
+    attempt = 0
+    while True:
+        try:
+            return send()
+        except (APIConnectionError, APIStatusError) as e:
+            if not _is_retryable(e):
+                raise
+            if attempt >= ANTHROPIC_MAX_RETRIES:
+                raise LLMUnavailable(f"Batch API unavailable: {e}") from e
+            delay = backoff_delay(attempt, ANTHROPIC_BACKOFF_BASE, ANTHROPIC_BACKOFF_MAX, _retry_after(e))
+            print(f"{label} batch call failed ({type(e).__name__}: {e}) - retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def create_batch(requests, label='claude', client=None):
+    """Submit many Claude calls as one Message Batch (half the price of
+    messages.create; results usually within minutes, at most 24 hours).
+    
+    requests is a list of (custom_id, system, kwargs), with kwargs as for
+    create_message (add the tool with structured_request). Returns the
+    batch ID.
+    """
+    client = client or get_anthropic_client()
+    batch = _retry_batch_call(label, lambda: client.beta.messages.batches.create(
+        requests=[
+            {
+                'custom_id': custom_id,
+                'params': {**kwargs, 'system': cacheable_system(system) if ANTHROPIC_PROMPT_CACHE else system}
+            }
+            for custom_id, system, kwargs in requests
+        ],
+        betas=BATCH_BETAS
+    ))
+    print(f"{label} batch {batch.id} submitted: {len(requests)} requests")
+    return batch.id
+
+
+def wait_for_batch(batch_id, timeout, label='claude', client=None):
+    """Poll until the batch has ended. Returns False if timeout passes first."""
+    client = client or get_anthropic_client()
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = _retry_batch_call(label, lambda: client.beta.messages.batches.retrieve(batch_id, betas=BATCH_BETAS))
+        if batch.processing_status == 'ended':
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(BATCH_POLL_INTERVAL, remaining))
+
+
+def batch_status(batch_id, label='claude', client=None):
+    """Processing status and request counts of a batch"""
+    client = client or get_anthropic_client()
+    batch = _retry_batch_call(label, lambda: client.beta.messages.batches.retrieve(batch_id, betas=BATCH_BETAS))
+    return {
+        'status': batch.processing_status,
+        'counts': batch.request_counts.model_dump()
+    }
+
+
+def batch_results(batch_id, tool=None, label='claude', client=None):
+    """Results of an ended batch as {custom_id: {'result', 'usage', 'error'}}.
+    
+    With tool, each result is the parsed tool input (as create_structured);
+    otherwise it's the message. Token usage is recorded like any other call.
+    """
+    client = client or get_anthropic_client()
+    results = {}
+    entries = _retry_batch_call(label, lambda: client.beta.messages.batches.results(batch_id, betas=BATCH_BETAS))
+    for entry in entries:
+        if entry.result.type != 'succeeded':
+            # errored results wrap an API error; canceled/expired just have the type
+            error = getattr(getattr(entry.result, 'error', None), 'error', None)
+            message = f"{error.type}: {error.message}" if error else f"Request {entry.result.type}"
+            results[entry.custom_id] = {'result': None, 'usage': None, 'error': message}
+            continue
+
+        message = entry.result.message
+        usage = response_usage(message)
+        _record_usage(message.model, usage, None)
+        usage['model'] = message.model
+        usage['batch'] = True
+        try:
+            result = parse_structured(message, tool, usage, label) if tool else message
+            results[entry.custom_id] = {'result': result, 'usage': usage, 'error': None}
+        except InvalidModelOutput as e:
+            results[entry.custom_id] = {'result': None, 'usage': usage, 'error': f"Claude returned invalid JSON: {e}"}
+    return results
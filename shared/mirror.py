@@ -0,0 +1,335 @@
+# Dot Shared Mirror
+# Optional local SQLite replica of the Projects, Clients and Updates tables
+#
+# A sync worker pulls changed records (LAST_MODIFIED_TIME() filter) into
+# SQLite so reads can be answered locally. Reads only use the mirror while
+# its last sync is within AIRTABLE_MIRROR_MAX_STALENESS; otherwise callers
+# fall back to Airtable. Run standalone with: python -m shared.mirror
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from .config import (
+    AIRTABLE_CLIENTS_TABLE, AIRTABLE_PROJECTS_TABLE, AIRTABLE_UPDATES_TABLE,
+    AIRTABLE_MIRROR_ENABLED, AIRTABLE_MIRROR_DB, AIRTABLE_MIRROR_MAX_STALENESS,
+    AIRTABLE_MIRROR_SYNC_INTERVAL, AIRTABLE_MIRROR_FULL_SYNC_INTERVAL
+)
+
+
+# Indexed columns per mirrored table, extracted from the record fields.
+# Updates sync before Projects: the Projects Update/Update due lookups don't
+# change LAST_MODIFIED_TIME(), so projects with new updates are re-pulled.
+MIRRORED_TABLES = {
+    AIRTABLE_UPDATES_TABLE: {
+        'project_record_id': lambda fields: (fields.get('Project Link') or [''])[0]
+    },
+    AIRTABLE_PROJECTS_TABLE: {
+        'job_number': lambda fields: fields.get('Job Number', ''),
+        'client_code': lambda fields: (fields.get('Job Number', '') or '').split(' ')[0],
+        'status': lambda fields: fields.get('Status', '')
+    },
+    AIRTABLE_CLIENTS_TABLE: {
+        'client_code': lambda fields: fields.get('Client code', '')
+    }
+}
+
+# Above this many touched projects, fall back to a full Projects sync
+MAX_LINKED_REFRESH = 50
+
+# Re-read modifications this far back on each incremental sync to cover clock skew
+SYNC_OVERLAP = 60.0
+
+_local = threading.local()
+_sync_thread = None
+_sync_thread_lock = threading.Lock()
+
+
+def is_enabled():
+    return AIRTABLE_MIRROR_ENABLED
+
+
+def _sql_table(table):
+    return f"mirror_{table.lower()}"
+
+
+def _connect():
+    """One connection per thread per process"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    conn = sqlite3.connect(AIRTABLE_MIRROR_DB, timeout=10.0, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    _create_schema(conn)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def _create_schema(conn):
+    for table, columns in MIRRORED_TABLES.items():
+        name = _sql_table(table)
+        column_sql = ''.join(f", {column} TEXT" for column in columns)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} "
+            f"(record_id TEXT PRIMARY KEY, fields TEXT NOT NULL, synced_at REAL NOT NULL{column_sql})"
+        )
+        for column in columns:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_{column} ON {name} ({column})")
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS mirror_sync_state (
+        table_name TEXT PRIMARY KEY,
+        last_sync REAL NOT NULL DEFAULT 0,
+        last_full_sync REAL NOT NULL DEFAULT 0,
+        claimed_until REAL NOT NULL DEFAULT 0
+    )''')
+
+
+# ===================
+# READS
+# ===================
+
+def is_fresh(table, max_staleness=None):
+    """True if the mirror is enabled and table was synced recently enough"""
+    if not AIRTABLE_MIRROR_ENABLED:
+        return False
+
+    if max_staleness is None:
+        max_staleness = AIRTABLE_MIRROR_MAX_STALENESS
+
+    try:
+        row = _connect().execute(
+            'SELECT last_sync FROM mirror_sync_state WHERE table_name = ?', (table,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Mirror unavailable: {e}")
+        return False
+
+    return bool(row) and time.time() - row[0] <= max_staleness
+
+
+def _to_record(row):
+    """Rows come back in Airtable's {'id', 'fields'} shape"""
+    return {'id': row[0], 'fields': json.loads(row[1])}
+
+
+def find_record(table, column, value):
+    """First mirrored record where column = value, or None"""
+    try:
+        row = _connect().execute(
+            f"SELECT record_id, fields FROM {_sql_table(table)} WHERE {column} = ? LIMIT 1", (value,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Mirror read failed: {e}")
+        return None
+
+    return _to_record(row) if row else None
+
+
+def select_records(table, order_by='record_id', **filters):
+    """Mirrored records matching every filter.
+
+    Each filter is column=value, or column=[values] for an IN match.
+    """
+    clauses = []
+    args = []
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f"{column} IN ({', '.join('?' for _ in value)})")
+            args.extend(value)
+        else:
+            clauses.append(f"{column} = ?")
+            args.append(value)
+
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = _connect().execute(
+        f"SELECT record_id, fields FROM {_sql_table(table)}{where} ORDER BY {order_by}", args
+    ).fetchall()
+    return [_to_record(row) for row in rows]
+
+
+def upsert(table, record, merge=False):
+    """Write-through a record Airtable just returned from a create/update.
+
+    merge=True layers the returned fields over the mirrored copy, for
+    PATCH responses that may not carry every field.
+    """
+    if not AIRTABLE_MIRROR_ENABLED or not record or 'id' not in record:
+        return
+
+    try:
+        conn = _connect()
+        if merge:
+            row = conn.execute(
+                f"SELECT fields FROM {_sql_table(table)} WHERE record_id = ?", (record['id'],)
+            ).fetchone()
+            if row:
+                record = {'id': record['id'], 'fields': {**json.loads(row[0]), **record.get('fields', {})}}
+        _write_rows(conn, table, [_row_values(table, record, time.time())])
+    except sqlite3.Error as e:
+        print(f"Mirror write-through failed: {e}")
+
+
+# ===================
+# SYNC
+# ===================
+
+def _claim(conn, table, now, lease):
+    """Claim the sync for table so only one worker on the host runs it"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('INSERT OR IGNORE INTO mirror_sync_state (table_name) VALUES (?)', (table,))
+        row = conn.execute(
+            'SELECT last_sync, last_full_sync, claimed_until FROM mirror_sync_state WHERE table_name = ?', (table,)
+        ).fetchone()
+        if row[2] > now:
+            conn.execute('COMMIT')
+            return None
+        conn.execute('UPDATE mirror_sync_state SET claimed_until = ? WHERE table_name = ?', (now + lease, table))
+        conn.execute('COMMIT')
+        return row[0], row[1]
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _row_values(table, record, synced_at):
+    fields = record.get('fields', {})
+    columns = MIRRORED_TABLES[table]
+    return [record['id'], json.dumps(fields), synced_at] + [extract(fields) for extract in columns.values()]
+
+
+def _write_rows(conn, table, rows):
+    columns = ['record_id', 'fields', 'synced_at'] + list(MIRRORED_TABLES[table])
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {_sql_table(table)} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})",
+        rows
+    )
+
+
+def _incremental_formula(conn, table, last_sync):
+    """Formula for records changed since last_sync, or None to force a full sync"""
+    since = datetime.fromtimestamp(last_sync - SYNC_OVERLAP, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    formula = f"IS_AFTER(LAST_MODIFIED_TIME(), '{since}')"
+
+    if table != AIRTABLE_PROJECTS_TABLE:
+        return formula
+
+    # Projects whose Updates changed since their last sync
+    linked = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT project_record_id FROM {_sql_table(AIRTABLE_UPDATES_TABLE)} "
+        f"WHERE synced_at >= ? AND project_record_id != ''",
+        (last_sync - SYNC_OVERLAP,)
+    )]
+    if len(linked) > MAX_LINKED_REFRESH:
+        return None
+    if linked:
+        record_ids = ', '.join(f"RECORD_ID()='{record_id}'" for record_id in linked)
+        formula = f"OR({formula}, {record_ids})"
+    return formula
+
+
+def sync_table(table, full=False):
+    """Pull changed records for one table into the mirror.
+
+    Incremental syncs fetch records modified since the last sync; a full
+    sync (first run, or every AIRTABLE_MIRROR_FULL_SYNC_INTERVAL) replaces
+    the table so deletions are picked up too. Returns records written, or
+    None if another worker is already syncing this table.
+    """
+    from .airtable import iter_records
+
+    conn = _connect()
+    started = time.time()
+    claim = _claim(conn, table, started, lease=max(AIRTABLE_MIRROR_SYNC_INTERVAL, 60.0) * 5)
+    if claim is None:
+        return None
+
+    last_sync, last_full_sync = claim
+    full = full or not last_sync or started - last_full_sync >= AIRTABLE_MIRROR_FULL_SYNC_INTERVAL
+
+    try:
+        formula = None
+        if not full:
+            formula = _incremental_formula(conn, table, last_sync)
+            full = formula is None
+
+        # Fetch everything first so a failed pull leaves the old mirror intact
+        rows = [_row_values(table, record, started) for record in iter_records(table, formula=formula)]
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if full:
+                conn.execute(f"DELETE FROM {_sql_table(table)}")
+            _write_rows(conn, table, rows)
+            conn.execute(
+                'UPDATE mirror_sync_state SET last_sync = ?, last_full_sync = ?, claimed_until = 0 WHERE table_name = ?',
+                (started, started if full else last_full_sync, table)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        print(f"Mirror {'full' if full else 'incremental'} sync of {table}: {len(rows)} records")
+        return len(rows)
+
+    except Exception:
+        conn.execute('UPDATE mirror_sync_state SET claimed_until = 0 WHERE table_name = ?', (table,))
+        raise
+
+
+def sync_all(full=False):
+    """Sync every mirrored table, logging (not raising) per-table failures"""
+    results = {}
+    for table in MIRRORED_TABLES:
+        try:
+            results[table] = sync_table(table, full=full)
+        except Exception as e:
+            print(f"Mirror sync of {table} failed: {e}")
+            results[table] = None
+    return results
+
+
+def _sync_loop(interval):
+    while True:
+        sync_all()
+        time.sleep(interval)
+
+
+def start_sync_worker(interval=None):
+    """Start the background sync thread for this process (no-op if disabled).
+
+    Safe to call from every gunicorn worker: the per-table claim means
+    only one of them syncs at a time.
+    """
+    global _sync_thread
+
+    if not AIRTABLE_MIRROR_ENABLED:
+        return None
+
+    with _sync_thread_lock:
+        if _sync_thread is None or not _sync_thread.is_alive():
+            _sync_thread = threading.Thread(
+                target=_sync_loop,
+                args=(interval or AIRTABLE_MIRROR_SYNC_INTERVAL,),
+                name='airtable-mirror-sync',
+                daemon=True
+            )
+            _sync_thread.start()
+
+    return _sync_thread
+
+
+if __name__ == '__main__':
+    import sys
+
+    if '--once' in sys.argv:
+        print(sync_all(full='--full' in sys.argv))
+    else:
+        _sync_loop(AIRTABLE_MIRROR_SYNC_INTERVAL)
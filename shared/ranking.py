@@ -0,0 +1,77 @@
+# Dot Shared Ranking
+# Lexical (BM25) ranking of active jobs against an incoming message
+
+import math
+import re
+from collections import Counter
+
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+JOB_NUMBER_PATTERN = re.compile(r'\b([A-Za-z]{3})[ _](\d{3})\b')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'have', 'hi', 'i',
+    'in', 'is', 'it', 'me', 'of', 'on', 'or', 'our', 'please', 're', 'so', 'that', 'the',
+    'this', 'to', 'we', 'with', 'you', 'your', 'fw', 'fwd', 'thanks', 'cheers'
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords. Job numbers like 'FIS 019'
+    also produce a joined 'fis019' token so an exact mention ranks first."""
+    text = text or ''
+    tokens = [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+    tokens.extend(f"{code.lower()}{number}" for code, number in JOB_NUMBER_PATTERN.findall(text))
+    return tokens
+
+
+def job_text(job):
+    """Searchable text for an active job (name counted twice as it's the strongest signal)"""
+    return f"{job['jobNumber']} {job['jobName']} {job['jobName']} {job.get('description', '')}"
+
+
+class BM25Index:
+    """Okapi BM25 over a small in-memory document list"""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = [Counter(tokenize(doc)) for doc in documents]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freq = Counter()
+        for doc in self.docs:
+            doc_freq.update(doc.keys())
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query):
+        """BM25 score of every document for query, in document order"""
+        terms = set(tokenize(query))
+        results = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in terms:
+                tf = doc.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+
+def shortlist_jobs(jobs, query, k=15):
+    """Top-k jobs for query, best first.
+
+    Returns (shortlist, scores) where scores maps job number to score.
+    Ties keep the original order, so with no signal the first k jobs are
+    returned.
+    """
+    if not jobs:
+        return [], {}
+
+    index = BM25Index([job_text(job) for job in jobs])
+    scores = index.scores(query)
+    order = sorted(range(len(jobs)), key=lambda i: (-scores[i], i))
+    return [jobs[i] for i in order[:k]], {jobs[i]['jobNumber']: round(scores[i], 3) for i in order}
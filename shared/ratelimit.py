@@ -0,0 +1,188 @@
+# Dot Shared Rate Limiting
+# Token bucket shared by every worker process on the host
+
+import os
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket whose state lives in a local SQLite file.
+
+    Each gunicorn worker is a separate process, so the bucket is kept on
+    disk and updated inside an IMMEDIATE transaction (SQLite's file lock).
+    Falls back to an in-process bucket if the file can't be used.
+    """
+
+    def __init__(self, path, rate, capacity, name='default'):
+        self.path = path
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.name = name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._blocked_until = 0.0
+        self._use_sqlite = True
+
+    def _connect(self):
+        """One connection per thread per process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL,
+            blocked_until REAL NOT NULL DEFAULT 0
+        )''')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _take(self, now):
+        """Try to take a token. Returns seconds to wait (0 = got one)."""
+        if self._use_sqlite:
+            try:
+                return self._take_sqlite(now)
+            except sqlite3.Error as e:
+                print(f"Rate limiter falling back to in-process bucket: {e}")
+                self._use_sqlite = False
+
+        with self._lock:
+            tokens, self._updated = self._refill(self._tokens, self._updated, now)
+            wait, self._tokens = self._spend(tokens, self._blocked_until, now)
+            return wait
+
+    def _take_sqlite(self, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated, blocked_until FROM buckets WHERE name = ?', (self.name,)
+            ).fetchone()
+            tokens, updated, blocked_until = row if row else (self.capacity, now, 0.0)
+
+            tokens, updated = self._refill(tokens, updated, now)
+            wait, tokens = self._spend(tokens, blocked_until, now)
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)',
+                (self.name, tokens, updated, blocked_until)
+            )
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _refill(self, tokens, updated, now):
+        elapsed = max(0.0, now - updated)
+        return min(self.capacity, tokens + elapsed * self.rate), now
+
+    def _spend(self, tokens, blocked_until, now):
+        if blocked_until > now:
+            return blocked_until - now, tokens
+        if tokens >= 1:
+            return 0.0, tokens - 1
+        return (1 - tokens) / self.rate, tokens
+
+    def acquire(self, timeout=None):
+        """Block until a token is available.
+
+        Returns seconds spent waiting, or raises TimeoutError if that
+        would exceed timeout.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        start = time.time()
+        while True:
+            now = time.time()
+            wait = self._take(now)
+            if wait <= 0:
+                return now - start
+            if timeout is not None and (now - start) + wait > timeout:
+                raise TimeoutError(f"Rate limiter '{self.name}' wait exceeded {timeout}s")
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=None):
+        """acquire() for asyncio callers - waits without blocking the event loop.
+
+        The SQLite transaction can sit on the file lock for up to 10s under
+        contention, so it runs in a worker thread.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        start = time.time()
+        while True:
+            now = time.time()
+            wait = await asyncio.to_thread(self._take, now)
+            if wait <= 0:
+                return now - start
+            if timeout is not None and (now - start) + wait > timeout:
+                raise TimeoutError(f"Rate limiter '{self.name}' wait exceeded {timeout}s")
+            await asyncio.sleep(wait)
+
+    async def block_for_async(self, seconds):
+        """block_for() for asyncio callers, off the event loop"""
+        await asyncio.to_thread(self.block_for, seconds)
+
+    def block_for(self, seconds):
+        """Stop every process taking tokens for the next `seconds` (e.g. after a 429)"""
+        until = time.time() + seconds
+
+        if self._use_sqlite:
+            try:
+                conn = self._connect()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute(
+                        'INSERT OR IGNORE INTO buckets (name, tokens, updated, blocked_until) VALUES (?, 0, ?, 0)',
+                        (self.name, time.time())
+                    )
+                    conn.execute(
+                        'UPDATE buckets SET tokens = 0, blocked_until = MAX(blocked_until, ?) WHERE name = ?',
+                        (until, self.name)
+                    )
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                return
+            except sqlite3.Error as e:
+                print(f"Rate limiter falling back to in-process bucket: {e}")
+                self._use_sqlite = False
+
+        with self._lock:
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, until)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """Seconds to wait before retry number `attempt` (0-based).
+
+    Honours a Retry-After value when the server sends one, otherwise
+    exponential backoff with full jitter.
+    """
+    if retry_after is not None:
+        return min(cap, max(0.0, retry_after))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header given in seconds (None if absent/invalid)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,36 @@
+# Regression tests for email compaction (shared/helpers.py)
+
+import sys
+import os
+
+# Add parent directory to path for shared imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.helpers import compact_email
+
+
+def test_greeting_is_not_a_sign_off():
+    content = "Kia ora\n\nPlease move TOW 086 to Craft.\nClient signed off the concepts today.\nLive date is now 3 March."
+    compacted, _ = compact_email(content)
+    assert "Client signed off the concepts today." in compacted
+    assert "Live date is now 3 March." in compacted
+
+
+def test_thanks_before_the_request_keeps_the_request():
+    content = (
+        "Hi Dot,\n\nThanks!\nCan you update FIS 019 please:\n"
+        "- client approved the scripts\n- moving to Craft\n- live date 5 Feb"
+    )
+    compacted, _ = compact_email(content)
+    assert "- client approved the scripts" in compacted
+    assert "- moving to Craft" in compacted
+    assert "- live date 5 Feb" in compacted
+
+
+def test_contact_block_after_sign_off_is_dropped():
+    content = (
+        "Hi Dot,\n\nPlease move SKY 012 to Craft.\n\nThanks,\nSarah\n"
+        "Account Director | Hunch\nm: 021 555 1234\nhunch.co.nz"
+    )
+    compacted, _ = compact_email(content)
+    assert compacted == "Hi Dot,\n\nPlease move SKY 012 to Craft.\n\nThanks,\nSarah"
@@ -8,31 +8,87 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, request, jsonify
-from anthropic import Anthropic
-import httpx
 import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from shared import (
-    ANTHROPIC_API_KEY,
-    ANTHROPIC_MODEL,
-    strip_markdown_json,
+    ANTHROPIC_SMALL_MODEL,
+    VALID_CLIENT_CODES,
+    compact_email,
+    split_quoted,
+    create_structured,
+    create_batch,
+    batch_status,
+    batch_results,
+    LLMUnavailable,
+    AirtableUnavailable,
+    model_for,
+    get_llm_stats,
     get_project_by_job_number,
-    get_active_jobs_for_client
+    get_cache_stats,
+    start_mirror_sync,
+    get_active_jobs_for_client,
+    shortlist_jobs
 )
+from shared.idempotency import idempotent, get_idempotency_stats
+from shared.jobs import async_job, init_jobs, get_jobs_stats
+from shared.llm import structured_request
+from shared.cache import PersistentCache
 
 app = Flask(__name__)
 
-# Anthropic client
-anthropic_client = Anthropic(
-    api_key=ANTHROPIC_API_KEY,
-    http_client=httpx.Client(timeout=60.0, follow_redirects=True)
-)
+# GET /jobs/<id> and background workers for ?async=true requests
+init_jobs(app)
+
+# Keep the local Airtable mirror warm (no-op unless AIRTABLE_MIRROR_ENABLED)
+start_mirror_sync()
 
 # Load prompt
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), 'prompt.txt')
 with open(PROMPT_PATH, 'r') as f:
     TRAFFIC_PROMPT = f.read()
 
+# Load output schema (the tool Claude must answer with)
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.json')
+with open(SCHEMA_PATH, 'r') as f:
+    TRAFFIC_SCHEMA = json.load(f)
+
+# Route trivially classifiable messages with rules instead of Claude
+TRAFFIC_FAST_PATH = os.environ.get('TRAFFIC_FAST_PATH', 'true').lower() == 'true'
+
+# Only the best-matching active jobs go into the prompt (0 sends them all)
+TRAFFIC_JOB_SHORTLIST = int(os.environ.get('TRAFFIC_JOB_SHORTLIST', 15))
+
+# Model tiering - classify with the small model and escalate to the main
+# model only when it isn't confident or its answer doesn't fit the schema
+TRAFFIC_MODEL_TIERING = os.environ.get('TRAFFIC_MODEL_TIERING', 'true').lower() == 'true'
+TRAFFIC_CLASSIFY_MODEL = model_for('traffic', 'classify', default=ANTHROPIC_SMALL_MODEL)
+TRAFFIC_ESCALATE_MODEL = model_for('traffic', 'escalate')
+if TRAFFIC_MODEL_TIERING and TRAFFIC_CLASSIFY_MODEL != TRAFFIC_ESCALATE_MODEL:
+    TRAFFIC_TIERS = [TRAFFIC_CLASSIFY_MODEL, TRAFFIC_ESCALATE_MODEL]
+else:
+    TRAFFIC_TIERS = [TRAFFIC_ESCALATE_MODEL]
+
+# Append each Claude-routed prompt and its routing to this JSONL file
+# (input for eval_tiers.py). Contains email text - off unless set.
+TRAFFIC_RECORD_PATH = os.environ.get('TRAFFIC_RECORD_PATH', '')
+
+# Stream Claude's routing and start the Airtable job lookup as soon as
+# route, confidence and jobNumber are out, while the rest is generated
+TRAFFIC_STREAMING = os.environ.get('TRAFFIC_STREAMING', 'true').lower() == 'true'
+TRAFFIC_LOOKUP_WORKERS = int(os.environ.get('TRAFFIC_LOOKUP_WORKERS', 4))
+
+# Bulk routing (/traffic/batch) - Claude calls go out as one Message Batch.
+# The request answers 202 as soon as it's submitted (batches take minutes,
+# well past the gunicorn worker timeout) and results are collected from
+# GET /traffic/batch/<batchId>.
+TRAFFIC_BATCH_MODEL = model_for('traffic', 'batch')
+TRAFFIC_BATCH_MAX = int(os.environ.get('TRAFFIC_BATCH_MAX', 2000))
+TRAFFIC_BATCH_DB = os.environ.get('TRAFFIC_BATCH_DB', '/tmp/dot-traffic-batches.sqlite')
+
 
 def extract_client_code_from_job(job_number):
     """Extract client code from job number (e.g., 'ONE 125' -> 'ONE')"""
@@ -65,7 +121,624 @@ def extract_client_code_from_email(email):
     return None
 
 
+def message_fields(data):
+    """The /traffic request fields (one message), with defaults"""
+    return {
+        'content': data.get('emailContent', ''),
+        'subject': data.get('subjectLine', ''),
+        'sender_email': data.get('senderEmail', ''),
+        'sender_name': data.get('senderName', ''),
+        'all_recipients': data.get('allRecipients', []),
+        'has_attachments': data.get('hasAttachments', False),
+        'attachment_names': data.get('attachmentNames', []),
+        'source': data.get('source', 'email')
+    }
+
+
+def fast_route_message(message):
+    """fast_route for a message_fields dict"""
+    return fast_route(
+        message['subject'], message['content'], message['sender_email'], message['sender_name'],
+        _as_list(message['all_recipients']), message['has_attachments'], _as_list(message['attachment_names']),
+        message['source']
+    )
+
+
+def build_routing_prompt(message, active_jobs):
+    """Claude's routing prompt for one message.
+
+    Compacts the message body and lists the active jobs that best match it.
+    Returns (full_content, compaction, shortlist).
+    """
+    all_recipients = message['all_recipients']
+    attachment_names = message['attachment_names']
+
+    # Strip quoted history, signatures and disclaimers before prompting
+    content, compaction = compact_email(message['content'])
+
+    # Shortlist the active jobs that best match the message
+    shortlist = active_jobs
+    if TRAFFIC_JOB_SHORTLIST and len(active_jobs) > TRAFFIC_JOB_SHORTLIST:
+        query = f"{message['subject']}\n{' '.join(_as_list(attachment_names))}\n{content}"
+        shortlist, _ = shortlist_jobs(active_jobs, query, k=TRAFFIC_JOB_SHORTLIST)
+
+    # Format active jobs for the prompt
+    active_jobs_text = ""
+    if active_jobs:
+        active_jobs_text = "\n".join([
+            f"- {job['jobNumber']} - {job['jobName']}: {job['description']}"
+            for job in shortlist
+        ])
+        if len(shortlist) < len(active_jobs):
+            active_jobs_text += (
+                f"\n({len(active_jobs)} active jobs in total - "
+                f"showing the {len(shortlist)} that best match this message)"
+            )
+    else:
+        active_jobs_text = "No active jobs found for this client"
+
+    # Build content for Claude
+    full_content = f"""Source: {message['source']}
+Subject: {message['subject']}
+
+From: {message['sender_name']} <{message['sender_email']}>
+Recipients: {', '.join(all_recipients) if isinstance(all_recipients, list) else all_recipients}
+Has Attachments: {message['has_attachments']}
+Attachment Names: {', '.join(attachment_names) if isinstance(attachment_names, list) else attachment_names}
+
+Active jobs for this client:
+{active_jobs_text}
+
+Message content:
+{content}"""
+
+    return full_content, compaction, shortlist
+
+
+def enrich_routing(routing, lookup=None):
+    """If routing names a high-confidence job, add its project details from
+    Airtable, or switch to clarify if the job doesn't exist.
+
+    lookup(job_number) returns the project (default get_project_by_job_number).
+    """
+    if routing.get('confidence') != 'high' or not routing.get('jobNumber'):
+        return routing
+
+    project = (lookup or get_project_by_job_number)(routing['jobNumber'])
+
+    if project:
+        # Enrich with project data
+        routing['jobName'] = project['jobName']
+        routing['clientName'] = project['clientName']
+        routing['currentRound'] = project['round']
+        routing['currentStage'] = project['stage']
+        routing['withClient'] = project['withClient']
+        routing['teamsChannelId'] = project['teamsChannelId']
+        routing['projectRecordId'] = project['recordId']
+    else:
+        # Job number not found - switch to clarify
+        routing['route'] = 'clarify'
+        routing['confidence'] = 'low'
+        routing['reason'] = f"Job {routing['jobNumber']} not found in system"
+        routing['clarifyEmail'] = f"""<p>Hi {routing.get('senderName', 'there')},</p>
+<p>I couldn't find job <strong>{routing['jobNumber']}</strong> in our system.</p>
+<p>Could you double-check the job number? Or reply <strong>TRIAGE</strong> if this is a new job.</p>
+<p>Dot</p>"""
+    return routing
+
+
+# ===================
+# FAST PATH
+# ===================
+
+# Three letters + space/underscore + three digits, e.g. FIS 019 or ONE_125
+JOB_NUMBER_PATTERN = re.compile(r'\b([A-Z]{3})[ _](\d{3})\b')
+
+# Client names as they appear in requests like "WIP for Sky please"
+CLIENT_NAMES = {
+    'ONE': 'One NZ',
+    'SKY': 'Sky',
+    'TOW': 'Tower Insurance',
+    'FIS': 'Fisher Funds',
+    'FST': 'Firestop',
+    'WKA': 'Healthline',
+    'LAB': 'Labour',
+    'EON': 'Eon Fibre'
+}
+CLIENT_NAME_PATTERNS = [
+    (re.compile(r'\bone ?nz\b', re.I), 'ONE'),
+    (re.compile(r'\bsky\b', re.I), 'SKY'),
+    (re.compile(r'\btower\b', re.I), 'TOW'),
+    (re.compile(r'\bfisher\b', re.I), 'FIS'),
+    (re.compile(r'\bfirestop\b', re.I), 'FST'),
+    (re.compile(r'\b(healthline|whakarongorau)\b', re.I), 'WKA'),
+    (re.compile(r'\blabour\b', re.I), 'LAB'),
+    (re.compile(r'\beon\b', re.I), 'EON')
+]
+
+WIP_PATTERN = re.compile(r'\b(wip|work in progress)\b', re.I)
+TRACKER_PATTERN = re.compile(r'\b(tracker|finance report)\b', re.I)
+TRIAGE_PATTERN = re.compile(r'\btriage\b', re.I)
+UPDATE_PATTERN = re.compile(r'\bupdate\b', re.I)
+REPLY_SUBJECT_PATTERN = re.compile(r'^\s*(re|aw|sv)\s*:', re.I)
+# Wording of Dot's own confirm / clarify emails (see EMAIL TEMPLATES in prompt.txt)
+DOT_PROMPT_PATTERN = re.compile(r'reply\s+(yes|triage|with the job number)\b', re.I)
+HANDOVER_PATTERN = re.compile(
+    r'(please find attached|attached is|attached are|here\'s the latest|here is the latest|for your review|for review|for approval)',
+    re.I
+)
+
+# Longest request (in words) treated as a short keyword request
+SHORT_REQUEST_WORDS = 25
+
+# One NZ Simplification (ONS) is told apart from ONE by topic or sender
+# (see CLIENT CODE MAPPING in prompt.txt) - those messages go to Claude
+ONS_KEYWORD = 'simplification'
+ONS_SENDER_NAMES = {'tracey barclay'}
+
+INTERNAL_DOMAIN = 'hunch.co.nz'
+
+_fast_path_lock = threading.Lock()
+_fast_path_stats = {'requests': 0, 'hits': 0, 'rules': {}}
+
+
+def reply_text(content):
+    """The new text of a message, without quoted history"""
+    return split_quoted(content)[0].strip()
+
+
+def find_job_numbers(text):
+    """Distinct valid job numbers in text, normalised to 'FIS 019' form"""
+    found = []
+    for code, number in JOB_NUMBER_PATTERN.findall(text or ''):
+        job_number = f"{code} {number}"
+        if code in VALID_CLIENT_CODES and job_number not in found:
+            found.append(job_number)
+    return found
+
+
+def find_client_codes(text):
+    """Client codes named in text (by name or uppercase code)"""
+    codes = [code for pattern, code in CLIENT_NAME_PATTERNS if pattern.search(text or '')]
+    for code in CLIENT_NAMES:
+        if re.search(rf'\b{code}\b', text or '') and code not in codes:
+            codes.append(code)
+    return codes
+
+
+def _as_list(value):
+    """Recipient/attachment lists sometimes arrive as one comma-separated string"""
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in re.split(r'[,;]', value or '') if item.strip()]
+
+
+def _is_ons_candidate(text, sender_name):
+    """Could this be One NZ Simplification rather than One NZ?"""
+    return ONS_KEYWORD in (text or '').lower() or (sender_name or '').strip().lower() in ONS_SENDER_NAMES
+
+
+def _fast_path_project(job_number):
+    """Project lookup for a fast-path rule - None (fall through to Claude)
+    if Airtable can't be asked, since the fast path is optional"""
+    try:
+        return get_project_by_job_number(job_number)
+    except AirtableUnavailable as e:
+        print(f"Fast path skipped {job_number}: {e}")
+        return None
+
+
+def _is_internal(email):
+    return (email or '').lower().endswith('@' + INTERNAL_DOMAIN)
+
+
+def _fast_routing(route, reason, intent, sender_email, sender_name, source, job_number=None, client_code=None):
+    """A high-confidence routing in the same shape Claude returns"""
+    return {
+        'route': route,
+        'confidence': 'high',
+        'jobNumber': job_number,
+        'clientCode': client_code,
+        'clientName': CLIENT_NAMES.get(client_code, ''),
+        'intent': intent,
+        'senderEmail': sender_email,
+        'senderName': sender_name.split(' ')[0] if sender_name else '',
+        'source': source,
+        'reason': reason,
+        'fastPath': True
+    }
+
+
+def _is_reply_to_dot(subject, content):
+    """An RE: subject, or one of Dot's confirm / clarify emails quoted below"""
+    quoted = re.sub(r'<[^>]+>', '', split_quoted(content)[1])
+    return bool(REPLY_SUBJECT_PATTERN.match(subject or '') or DOT_PROMPT_PATTERN.search(quoted))
+
+
+def _fast_clarify_reply(subject, content, reply, sender_email, sender_name, source):
+    """Bare YES / TRIAGE / job number sent back to a clarify or confirm email"""
+    lines = [line.strip() for line in reply.splitlines() if line.strip()]
+    if not lines or len(lines) > 3:  # allow a short sign-off
+        return None
+    if not _is_reply_to_dot(subject, content):
+        return None
+
+    answer = lines[0].strip(' .!').upper()
+
+    if answer == 'YES':
+        routing = _fast_routing('clarify-reply', 'Confirmed suggested job', 'confirm', sender_email, sender_name, source)
+        routing['confirmedJob'] = 'suggested'
+        return routing
+
+    if answer == 'TRIAGE':
+        return _fast_routing('triage', 'Reply asked for a new job to be triaged', 'New job triage', sender_email, sender_name, source)
+
+    job_numbers = find_job_numbers(answer.replace('_', ' '))
+    if len(job_numbers) == 1 and answer.replace('_', ' ') == job_numbers[0]:
+        if not _fast_path_project(job_numbers[0]):
+            return None
+        routing = _fast_routing('clarify-reply', 'Job number provided in reply', 'confirm', sender_email, sender_name, source)
+        routing['confirmedJob'] = job_numbers[0]
+        return routing
+
+    return None
+
+
+def _fast_report_request(subject, reply, sender_email, sender_name, source, has_attachments):
+    """Short 'WIP for Sky please' / 'Tower tracker' requests naming one client"""
+    text = f"{subject}\n{reply}"
+    if has_attachments or len(text.split()) > SHORT_REQUEST_WORDS or _is_ons_candidate(text, sender_name):
+        return None
+
+    wants_wip = bool(WIP_PATTERN.search(text))
+    wants_tracker = bool(TRACKER_PATTERN.search(text))
+    if wants_wip == wants_tracker:
+        return None
+
+    client_codes = find_client_codes(text)
+    if not client_codes and not _is_internal(sender_email):
+        sender_client = extract_client_code_from_email(sender_email)
+        client_codes = [sender_client] if sender_client else []
+    if len(client_codes) != 1:
+        return None
+
+    client_code = client_codes[0]
+    if wants_wip:
+        return _fast_routing('wip', f"Explicit WIP request for {CLIENT_NAMES[client_code]}", 'WIP report requested',
+                             sender_email, sender_name, source, client_code=client_code)
+    return _fast_routing('tracker', f"Explicit tracker request for {CLIENT_NAMES[client_code]}", 'Finance tracker requested',
+                         sender_email, sender_name, source, client_code=client_code)
+
+
+def _fast_job_request(subject, reply, sender_email, sender_name, all_recipients, attachment_names, source):
+    """Internal update or handover with one job number in the attachments or subject"""
+    # Job number in filename beats job number in subject
+    job_numbers = find_job_numbers(' '.join(attachment_names)) or find_job_numbers(subject)
+    if len(job_numbers) != 1:
+        return None
+    job_number = job_numbers[0]
+
+    if source != 'teams' and not _is_internal(sender_email):
+        return None
+
+    external_recipients = [r for r in all_recipients if r and not _is_internal(r)]
+    first_line = reply.splitlines()[0] if reply else ''
+
+    if attachment_names and external_recipients and HANDOVER_PATTERN.search(f"{subject}\n{reply}"):
+        route, intent, reason = 'work-to-client', 'Sending deliverable to client', 'External recipient, attachment with job number, handover language'
+    elif not external_recipients and (UPDATE_PATTERN.search(subject) or UPDATE_PATTERN.search(first_line)):
+        route, intent, reason = 'update', 'Status update', 'Job number in subject, explicit update request'
+    else:
+        return None
+
+    # Validate against the project index before acting on it
+    project = _fast_path_project(job_number)
+    if not project:
+        return None
+
+    return _fast_routing(route, reason, intent, sender_email, sender_name, source,
+                         job_number=job_number, client_code=extract_client_code_from_job(job_number))
+
+
+def _fast_triage_request(subject, reply, sender_email, sender_name, attachment_names, source):
+    """Explicit 'please triage' with no job number anywhere"""
+    if not TRIAGE_PATTERN.search(subject):
+        return None
+    if find_job_numbers(subject) or find_job_numbers(' '.join(attachment_names)) or find_job_numbers(reply):
+        return None
+    if _is_ons_candidate(f"{subject}\n{reply}", sender_name):
+        return None
+
+    client_codes = find_client_codes(subject)
+    if not client_codes and not _is_internal(sender_email):
+        sender_client = extract_client_code_from_email(sender_email)
+        client_codes = [sender_client] if sender_client else []
+    client_code = client_codes[0] if len(client_codes) == 1 else None
+
+    return _fast_routing('triage', 'Explicit triage request', 'New job triage',
+                         sender_email, sender_name, source, client_code=client_code)
+
+
+def fast_route(subject, content, sender_email, sender_name, all_recipients, has_attachments, attachment_names, source):
+    """Rule-based routing for trivially classifiable messages.
+
+    Returns a high-confidence routing, or None to fall through to Claude.
+    Rules only fire on unambiguous input; anything else goes to the model.
+    """
+    reply = reply_text(content)
+
+    rules = [
+        ('clarify-reply', lambda: _fast_clarify_reply(subject, content, reply, sender_email, sender_name, source)),
+        ('report', lambda: _fast_report_request(subject, reply, sender_email, sender_name, source, has_attachments)),
+        ('job-number', lambda: _fast_job_request(subject, reply, sender_email, sender_name, all_recipients, attachment_names, source)),
+        ('triage', lambda: _fast_triage_request(subject, reply, sender_email, sender_name, attachment_names, source))
+    ]
+
+    for name, rule in rules:
+        routing = rule()
+        if routing:
+            routing['fastPathRule'] = name
+            return routing
+    return None
+
+
+def record_fast_path(routing):
+    """Count a /traffic request and whether the fast path handled it"""
+    with _fast_path_lock:
+        _fast_path_stats['requests'] += 1
+        if routing:
+            _fast_path_stats['hits'] += 1
+            rule = routing['fastPathRule']
+            _fast_path_stats['rules'][rule] = _fast_path_stats['rules'].get(rule, 0) + 1
+
+
+def get_fast_path_stats():
+    """Fast path hit rate for this process"""
+    with _fast_path_lock:
+        stats = {**_fast_path_stats, 'rules': dict(_fast_path_stats['rules'])}
+    stats['enabled'] = TRAFFIC_FAST_PATH
+    stats['hitRate'] = round(stats['hits'] / stats['requests'], 3) if stats['requests'] else 0.0
+    return stats
+
+
+# ===================
+# JOB SHORTLIST
+# ===================
+
+_shortlist_lock = threading.Lock()
+_shortlist_stats = {
+    'requests': 0,
+    'truncated': 0,
+    'jobsTotal': 0,
+    'jobsSent': 0,
+    'matches': 0,
+    'matchesInShortlist': 0
+}
+
+
+def record_shortlist(active_jobs, shortlist, routing):
+    """Track prompt savings and whether Claude's job was one we sent"""
+    chosen = routing.get('jobNumber') or (routing.get('suggestedJob') or {}).get('jobNumber')
+    active_numbers = {job['jobNumber'] for job in active_jobs}
+    sent_numbers = {job['jobNumber'] for job in shortlist}
+
+    with _shortlist_lock:
+        _shortlist_stats['requests'] += 1
+        _shortlist_stats['truncated'] += len(shortlist) < len(active_jobs)
+        _shortlist_stats['jobsTotal'] += len(active_jobs)
+        _shortlist_stats['jobsSent'] += len(shortlist)
+        if chosen in active_numbers:
+            _shortlist_stats['matches'] += 1
+            _shortlist_stats['matchesInShortlist'] += chosen in sent_numbers
+
+
+def get_shortlist_stats():
+    """Shortlist size reduction and recall (chosen job was in the shortlist)"""
+    with _shortlist_lock:
+        stats = dict(_shortlist_stats)
+    stats['size'] = TRAFFIC_JOB_SHORTLIST
+    stats['sentRatio'] = round(stats['jobsSent'] / stats['jobsTotal'], 3) if stats['jobsTotal'] else 1.0
+    stats['recall'] = round(stats['matchesInShortlist'] / stats['matches'], 3) if stats['matches'] else 1.0
+    return stats
+
+
+# ===================
+# MODEL TIERING
+# ===================
+
+_tiering_lock = threading.Lock()
+_tiering_stats = {
+    'requests': 0,
+    'escalations': 0,
+    'reasons': {},
+    'answeredBy': {}
+}
+
+
+def escalation_reason(routing):
+    """Why a tier's routing can't be used as-is (None if it can)"""
+    missing = [field for field in TRAFFIC_SCHEMA['input_schema']['required'] if not routing.get(field)]
+    if missing:
+        return 'missing-fields'
+    if routing['route'] not in TRAFFIC_SCHEMA['input_schema']['properties']['route']['enum']:
+        return 'invalid-route'
+    if routing['confidence'] != 'high':
+        return f"{routing['confidence']}-confidence"
+    return None
+
+
+def route_with_claude(full_content, tiers=None, on_tier=None):
+    """Ask Claude for a routing, cheapest tier first.
+
+    Each tier but the last hands over to the next if its answer isn't high
+    confidence, doesn't fit the schema or can't be parsed. The last tier's
+    answer is used whatever it says. Returns the routing with a 'tiering'
+    entry (model used, escalation reasons, usage of every call).
+    on_tier, if given, is called as each tier starts and returns the
+    on_field callback that streams that tier's output.
+    """
+    tiers = tiers or TRAFFIC_TIERS
+    calls = []
+    reasons = []
+
+    for i, model in enumerate(tiers):
+        last = i == len(tiers) - 1
+        start = time.monotonic()
+        try:
+            routing, usage = create_structured(
+                tool=TRAFFIC_SCHEMA,
+                label='Traffic',
+                on_field=on_tier() if on_tier else None,
+                model=model,
+                max_tokens=1500,
+                temperature=0.1,
+                system=TRAFFIC_PROMPT,
+                messages=[
+                    {'role': 'user', 'content': full_content}
+                ]
+            )
+        except (json.JSONDecodeError, LLMUnavailable) as e:
+            if last:
+                raise
+            if getattr(e, 'usage', None):
+                calls.append(e.usage)
+            reason = 'invalid-json' if isinstance(e, json.JSONDecodeError) else 'unavailable'
+        else:
+            usage['elapsedMs'] = round((time.monotonic() - start) * 1000)
+            calls.append(usage)
+            reason = None if last else escalation_reason(routing)
+            if reason is None:
+                break
+
+        print(f"Traffic escalating from {model} to {tiers[i + 1]}: {reason}")
+        reasons.append(reason)
+
+    routing['usage'] = usage
+    routing['tiering'] = {
+        'model': model,
+        'tier': i,
+        'escalations': reasons,
+        'calls': calls
+    }
+    record_tiering(routing)
+    return routing
+
+
+def record_tiering(routing):
+    """Count which tier answered and why earlier tiers were passed over"""
+    tiering = routing['tiering']
+    with _tiering_lock:
+        _tiering_stats['requests'] += 1
+        _tiering_stats['escalations'] += bool(tiering['escalations'])
+        for reason in tiering['escalations']:
+            _tiering_stats['reasons'][reason] = _tiering_stats['reasons'].get(reason, 0) + 1
+        model = tiering['model']
+        _tiering_stats['answeredBy'][model] = _tiering_stats['answeredBy'].get(model, 0) + 1
+
+
+def get_tiering_stats():
+    """Escalation rate and which model answered, for this process"""
+    with _tiering_lock:
+        stats = {
+            **_tiering_stats,
+            'reasons': dict(_tiering_stats['reasons']),
+            'answeredBy': dict(_tiering_stats['answeredBy'])
+        }
+    stats['tiers'] = TRAFFIC_TIERS
+    stats['escalationRate'] = round(stats['escalations'] / stats['requests'], 3) if stats['requests'] else 0.0
+    return stats
+
+
+_record_lock = threading.Lock()
+
+
+def record_routing(full_content, routing):
+    """Append a Claude-routed prompt and its answer to TRAFFIC_RECORD_PATH"""
+    if not TRAFFIC_RECORD_PATH:
+        return
+
+    line = json.dumps({
+        'recordedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'content': full_content,
+        'route': routing.get('route'),
+        'confidence': routing.get('confidence'),
+        'jobNumber': routing.get('jobNumber') or (routing.get('suggestedJob') or {}).get('jobNumber'),
+        'model': routing['tiering']['model']
+    })
+    try:
+        with _record_lock, open(TRAFFIC_RECORD_PATH, 'a') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f"Couldn't record routing to {TRAFFIC_RECORD_PATH}: {e}")
+
+
+# ===================
+# EARLY ENRICHMENT
+# ===================
+
+_lookup_pool = ThreadPoolExecutor(max_workers=TRAFFIC_LOOKUP_WORKERS, thread_name_prefix='traffic-lookup')
+
+_streaming_lock = threading.Lock()
+_streaming_stats = {
+    'enrichments': 0,
+    'early': 0
+}
+
+
+class EarlyProjectLookup:
+    """Starts get_project_by_job_number for a streamed routing as soon as
+    route, confidence (high) and jobNumber have been generated, so the
+    Airtable round trip overlaps the rest of Claude's answer.
+
+    If a later tier or the final answer names a different job, that job
+    is looked up when it's needed.
+    """
+
+    def __init__(self):
+        self._lookups = {}
+
+    def tier(self):
+        """on_field callback for one tier's stream. Fields don't carry over
+        between tiers, so a lookup only starts for a job and confidence
+        named in the same answer."""
+        fields = {}
+
+        def on_field(name, value):
+            fields[name] = value
+            job_number = fields.get('jobNumber')
+            if (
+                'route' in fields
+                and fields.get('confidence') == 'high'
+                and job_number
+                and job_number not in self._lookups
+            ):
+                self._lookups[job_number] = _lookup_pool.submit(get_project_by_job_number, job_number)
+
+        return on_field
+
+    def project(self, job_number):
+        """Project for job_number, waiting on the early lookup if there was one"""
+        lookup = self._lookups.get(job_number)
+        with _streaming_lock:
+            _streaming_stats['enrichments'] += 1
+            _streaming_stats['early'] += lookup is not None
+        if lookup is None:
+            return get_project_by_job_number(job_number)
+        return lookup.result()
+
+
+def get_streaming_stats():
+    """How often enrichment was already under way when Claude finished"""
+    with _streaming_lock:
+        stats = dict(_streaming_stats)
+    stats['enabled'] = TRAFFIC_STREAMING
+    stats['earlyRate'] = round(stats['early'] / stats['enrichments'], 3) if stats['enrichments'] else 0.0
+    return stats
+
+
 @app.route('/traffic', methods=['POST'])
+@async_job('traffic')
+@idempotent('traffic')
 def traffic():
     """Route incoming emails/messages to the correct handler.
     
@@ -87,103 +760,60 @@ def traffic():
     """
     try:
         data = request.get_json()
+        message = message_fields(data)
         
         # Required field
-        content = data.get('emailContent', '')
-        if not content:
+        if not message['content']:
             return jsonify({'error': 'No content provided'}), 400
         
-        # Optional fields
-        subject = data.get('subjectLine', '')
-        sender_email = data.get('senderEmail', '')
-        sender_name = data.get('senderName', '')
-        all_recipients = data.get('allRecipients', [])
-        has_attachments = data.get('hasAttachments', False)
-        attachment_names = data.get('attachmentNames', [])
-        source = data.get('source', 'email')
-        
-        # Try to identify client from sender email
-        likely_client_code = extract_client_code_from_email(sender_email)
-        
-        # Get active jobs for this client (if identified)
-        active_jobs = []
-        if likely_client_code:
-            active_jobs = get_active_jobs_for_client(likely_client_code)
-        
-        # Format active jobs for the prompt
-        active_jobs_text = ""
-        if active_jobs:
-            active_jobs_text = "\n".join([
-                f"- {job['jobNumber']} - {job['jobName']}: {job['description']}"
-                for job in active_jobs
-            ])
-        else:
-            active_jobs_text = "No active jobs found for this client"
+        # Trivial requests are routed by rules without calling Claude
+        routing = None
+        lookup = None
+        if TRAFFIC_FAST_PATH:
+            routing = fast_route_message(message)
+            record_fast_path(routing)
         
-        # Build content for Claude
-        full_content = f"""Source: {source}
-Subject: {subject}
-
-From: {sender_name} <{sender_email}>
-Recipients: {', '.join(all_recipients) if isinstance(all_recipients, list) else all_recipients}
-Has Attachments: {has_attachments}
-Attachment Names: {', '.join(attachment_names) if isinstance(attachment_names, list) else attachment_names}
+        if routing is None:
+            # Get active jobs for the client identified from the sender's email (if any)
+            likely_client_code = extract_client_code_from_email(message['sender_email'])
+            active_jobs = []
+            if likely_client_code:
+                active_jobs = get_active_jobs_for_client(likely_client_code)
 
-Active jobs for this client:
-{active_jobs_text}
+            full_content, compaction, shortlist = build_routing_prompt(message, active_jobs)
 
-Message content:
-{content}"""
-        
-        # Call Claude for routing decision
-        response = anthropic_client.messages.create(
-            model=ANTHROPIC_MODEL,
-            max_tokens=1500,
-            temperature=0.1,
-            system=TRAFFIC_PROMPT,
-            messages=[
-                {'role': 'user', 'content': full_content}
-            ]
-        )
-        
-        # Parse response
-        result_text = response.content[0].text
-        result_text = strip_markdown_json(result_text)
-        routing = json.loads(result_text)
+            # Call Claude for routing decision (small model first, escalating if unsure),
+            # looking the job up in Airtable while the rest of the answer streams in
+            if TRAFFIC_STREAMING:
+                lookup = EarlyProjectLookup()
+            routing = route_with_claude(full_content, on_tier=lookup.tier if lookup else None)
+            routing['compaction'] = compaction
+            record_routing(full_content, routing)
+            record_shortlist(active_jobs, shortlist, routing)
         
         # If high confidence with job number, validate and enrich from Airtable
-        if routing.get('confidence') == 'high' and routing.get('jobNumber'):
-            project = get_project_by_job_number(routing['jobNumber'])
-            
-            if project:
-                # Enrich with project data
-                routing['jobName'] = project['jobName']
-                routing['clientName'] = project['clientName']
-                routing['currentRound'] = project['round']
-                routing['currentStage'] = project['stage']
-                routing['withClient'] = project['withClient']
-                routing['teamsChannelId'] = project['teamsChannelId']
-                routing['projectRecordId'] = project['recordId']
-            else:
-                # Job number not found - switch to clarify
-                routing['route'] = 'clarify'
-                routing['confidence'] = 'low'
-                routing['reason'] = f"Job {routing['jobNumber']} not found in system"
-                routing['clarifyEmail'] = f"""<p>Hi {routing.get('senderName', 'there')},</p>
-<p>I couldn't find job <strong>{routing['jobNumber']}</strong> in our system.</p>
-<p>Could you double-check the job number? Or reply <strong>TRIAGE</strong> if this is a new job.</p>
-<p>Dot</p>"""
+        enrich_routing(routing, lookup.project if lookup else None)
         
         # Add source to response
-        routing['source'] = source
+        routing['source'] = message['source']
         
         return jsonify(routing)
         
+    except LLMUnavailable as e:
+        return jsonify({
+            'error': 'Claude unavailable',
+            'details': str(e)
+        }), 503
+    except AirtableUnavailable as e:
+        return jsonify({
+            'error': 'Airtable unavailable',
+            'details': str(e)
+        }), 503
     except json.JSONDecodeError as e:
         return jsonify({
             'error': 'Claude returned invalid JSON',
             'details': str(e),
-            'raw_response': result_text if 'result_text' in locals() else 'No response'
+            'raw_response': getattr(e, 'raw_response', 'No response')
         }), 500
     except Exception as e:
         return jsonify({
@@ -192,13 +822,276 @@ Message content:
         }), 500
 
 
+# ===================
+# BATCH ROUTING
+# ===================
+
+# Pending batches (message order, compaction etc.) for whichever worker collects
+# the results, then the collected results for later polls
+_batches = PersistentCache(TRAFFIC_BATCH_DB, ttl=2 * 24 * 3600, name='traffic_batches')
+_batch_collect_lock = threading.Lock()
+
+_batch_lock = threading.Lock()
+_batch_stats = {
+    'requests': 0,
+    'messages': 0,
+    'fastPath': 0,
+    'clientGroups': 0,
+    'batches': 0
+}
+
+
+def submit_routing_batch(messages):
+    """Route what the fast path can and submit the rest as one Message Batch.
+
+    Messages are grouped by the client detected from the sender so each
+    client's active jobs are fetched once. Returns (batch_id, context);
+    batch_id is None if nothing needed Claude.
+    """
+    routed = {}
+    groups = {}
+    for index, data in enumerate(messages):
+        message = message_fields(data if isinstance(data, dict) else {})
+        if not message['content']:
+            routed[index] = {'error': 'No content provided'}
+            continue
+
+        routing = None
+        if TRAFFIC_FAST_PATH:
+            routing = fast_route_message(message)
+            record_fast_path(routing)
+        if routing:
+            routed[index] = routing
+        else:
+            groups.setdefault(extract_client_code_from_email(message['sender_email']), []).append((index, message))
+
+    requests = []
+    pending = {}
+    for client_code, group in groups.items():
+        active_jobs = get_active_jobs_for_client(client_code) if client_code else []
+        for index, message in group:
+            full_content, compaction, _ = build_routing_prompt(message, active_jobs)
+            custom_id = f"msg-{index}"
+            requests.append((custom_id, TRAFFIC_PROMPT, structured_request(TRAFFIC_SCHEMA, {
+                'model': TRAFFIC_BATCH_MODEL,
+                'max_tokens': 1500,
+                'temperature': 0.1,
+                'messages': [{'role': 'user', 'content': full_content}]
+            })))
+            pending[custom_id] = {
+                'index': index,
+                'compaction': compaction,
+                'prompt': full_content if TRAFFIC_RECORD_PATH else None
+            }
+
+    context = {
+        'ids': [data.get('id') if isinstance(data, dict) else None for data in messages],
+        'sources': [data.get('source', 'email') if isinstance(data, dict) else 'email' for data in messages],
+        'routed': routed,
+        'pending': pending
+    }
+    batch_id = create_batch(requests, label='Traffic') if requests else None
+
+    with _batch_lock:
+        _batch_stats['requests'] += 1
+        _batch_stats['messages'] += len(messages)
+        _batch_stats['fastPath'] += sum(1 for routing in routed.values() if 'error' not in routing)
+        _batch_stats['clientGroups'] += len(groups)
+        _batch_stats['batches'] += batch_id is not None
+
+    return batch_id, context
+
+
+def collect_routing_batch(batch_id, context):
+    """Per-message routings for a finished batch, in request order.
+
+    Each job number is looked up in Airtable once, in parallel, and the
+    routings are enriched like single /traffic responses.
+    """
+    results = batch_results(batch_id, tool=TRAFFIC_SCHEMA, label='Traffic') if batch_id else {}
+
+    routings = [None] * len(context['ids'])
+    for index, routing in context['routed'].items():
+        routings[int(index)] = routing
+
+    for custom_id, item in context['pending'].items():
+        outcome = results.get(custom_id) or {'result': None, 'usage': None, 'error': 'Missing from batch results'}
+        if outcome['error']:
+            routings[item['index']] = {'error': outcome['error']}
+            continue
+
+        routing = outcome['result']
+        routing['usage'] = outcome['usage']
+        routing['compaction'] = item['compaction']
+        routing['tiering'] = {
+            'model': outcome['usage']['model'],
+            'tier': 0,
+            'escalations': [],
+            'calls': [outcome['usage']]
+        }
+        if item['prompt']:
+            record_routing(item['prompt'], routing)
+        routings[item['index']] = routing
+
+    # One Airtable lookup per distinct job, all at once
+    job_numbers = {
+        routing['jobNumber'] for routing in routings
+        if 'error' not in routing and routing.get('confidence') == 'high' and routing.get('jobNumber')
+    }
+    lookups = {job_number: _lookup_pool.submit(get_project_by_job_number, job_number) for job_number in job_numbers}
+
+    for index, routing in enumerate(routings):
+        if 'error' not in routing:
+            enrich_routing(routing, lambda job_number: lookups[job_number].result())
+            routing['source'] = context['sources'][index]
+        routing['index'] = index
+        if context['ids'][index] is not None:
+            routing['id'] = context['ids'][index]
+
+    return routings
+
+
+def _batch_response(batch_id, context, status=None):
+    """200 with every routing if the batch has ended, else 202 with progress.
+
+    Routings are collected, enriched and recorded once, when the batch is
+    first seen to have ended, and later polls are answered from _batches.
+    """
+    if not batch_id:
+        results = collect_routing_batch(batch_id, context)
+    elif context.get('results') is not None:
+        results = context['results']
+    else:
+        status = status or batch_status(batch_id, label='Traffic')
+        if status['status'] != 'ended':
+            status_url = f"{request.script_root}/traffic/batch/{batch_id}"
+            response = jsonify({
+                'batchId': batch_id,
+                'status': status['status'],
+                'counts': status['counts'],
+                'statusUrl': status_url
+            })
+            response.status_code = 202
+            response.headers['Location'] = status_url
+            return response
+
+        with _batch_collect_lock:
+            cached = _batches.get(batch_id) or context
+            if cached.get('results') is None:
+                cached['results'] = collect_routing_batch(batch_id, cached)
+                _batches.set(batch_id, cached)
+            results = cached['results']
+
+    return jsonify({
+        'batchId': batch_id,
+        'status': 'ended',
+        'results': results
+    })
+
+
+@app.route('/traffic/batch', methods=['POST'])
+@async_job('traffic-batch')
+@idempotent('traffic-batch', key_fields=('messages',))
+def traffic_batch():
+    """Route many messages at once (e.g. a mailbox backlog).
+
+    Accepts:
+        - messages: List of /traffic request bodies, each optionally with
+          an 'id' that is echoed back
+
+    Returns:
+        - results: One routing per message, in order, each with 'index'
+          (and 'id'), or an 'error' for that message
+        - If any message needs Claude: 202 with batchId and statusUrl
+          (GET /traffic/batch/<batchId>) to collect the results from
+    """
+    try:
+        data = request.get_json()
+        messages = data.get('messages') if isinstance(data, dict) else None
+
+        if not isinstance(messages, list) or not messages:
+            return jsonify({'error': 'No messages provided'}), 400
+        if len(messages) > TRAFFIC_BATCH_MAX:
+            return jsonify({'error': f"Too many messages (max {TRAFFIC_BATCH_MAX})"}), 400
+
+        batch_id, context = submit_routing_batch(messages)
+        if batch_id:
+            _batches.set(batch_id, context)
+            # Just submitted - answer now rather than holding the worker
+            return _batch_response(batch_id, context, status={
+                'status': 'in_progress',
+                'counts': {'processing': len(context['pending']), 'succeeded': 0, 'errored': 0, 'canceled': 0, 'expired': 0}
+            })
+
+        return _batch_response(batch_id, context)
+
+    except LLMUnavailable as e:
+        return jsonify({
+            'error': 'Claude unavailable',
+            'details': str(e)
+        }), 503
+    except AirtableUnavailable as e:
+        return jsonify({
+            'error': 'Airtable unavailable',
+            'details': str(e)
+        }), 503
+    except Exception as e:
+        return jsonify({
+            'error': 'Internal server error',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/traffic/batch/<batch_id>', methods=['GET'])
+def traffic_batch_results(batch_id):
+    """Routings for a batch submitted to /traffic/batch (202 until it has ended)"""
+    context = _batches.get(batch_id)
+    if context is None:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    try:
+        return _batch_response(batch_id, context)
+    except LLMUnavailable as e:
+        return jsonify({
+            'error': 'Claude unavailable',
+            'details': str(e)
+        }), 503
+    except AirtableUnavailable as e:
+        return jsonify({
+            'error': 'Airtable unavailable',
+            'details': str(e)
+        }), 503
+    except Exception as e:
+        return jsonify({
+            'error': 'Internal server error',
+            'details': str(e)
+        }), 500
+
+
+def get_batch_stats():
+    """Bulk routing counts for this process"""
+    with _batch_lock:
+        stats = dict(_batch_stats)
+    stats['model'] = TRAFFIC_BATCH_MODEL
+    return stats
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'Dot Traffic',
-        'version': '2.0'
+        'version': '2.0',
+        'cache': get_cache_stats(),
+        'llm': get_llm_stats(),
+        'fastPath': get_fast_path_stats(),
+        'shortlist': get_shortlist_stats(),
+        'tiering': get_tiering_stats(),
+        'streaming': get_streaming_stats(),
+        'batch': get_batch_stats(),
+        'idempotency': get_idempotency_stats(),
+        'jobs': get_jobs_stats()
     })
 
 
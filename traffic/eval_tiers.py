@@ -0,0 +1,142 @@
+# Dot Traffic model tier evaluation
+# Replays recorded Traffic prompts against each model tier and compares
+# routing accuracy with latency and cost.
+#
+#   TRAFFIC_RECORD_PATH=/var/dot/traffic.jsonl  (on the live app, to collect prompts)
+#   python traffic/eval_tiers.py /var/dot/traffic.jsonl [--tiers small,large,tiered] [--limit 200]
+#
+# Each record is scored against its 'expected' {route, jobNumber} if present
+# (add these by hand to correct mistakes), otherwise against the routing
+# recorded live.
+
+import sys
+import os
+import argparse
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import route_with_claude, TRAFFIC_CLASSIFY_MODEL, TRAFFIC_ESCALATE_MODEL
+
+
+# USD per million tokens (input, output). Cache reads are billed at 10% of
+# input and cache writes at 125%.
+MODEL_PRICES = {
+    'claude-3-haiku-20240307': (0.25, 1.25),
+    'claude-3-5-haiku-20241022': (0.80, 4.00),
+    'claude-3-5-sonnet-20241022': (3.00, 15.00),
+    'claude-3-7-sonnet-20250219': (3.00, 15.00),
+    'claude-sonnet-4-20250514': (3.00, 15.00),
+    'claude-opus-4-20250514': (15.00, 75.00)
+}
+
+TIERS = {
+    'small': [TRAFFIC_CLASSIFY_MODEL],
+    'large': [TRAFFIC_ESCALATE_MODEL],
+    'tiered': [TRAFFIC_CLASSIFY_MODEL, TRAFFIC_ESCALATE_MODEL]
+}
+
+
+def load_records(path, limit=None):
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records[:limit] if limit else records
+
+
+def expected_routing(record):
+    expected = record.get('expected') or {}
+    return expected.get('route', record.get('route')), expected.get('jobNumber', record.get('jobNumber'))
+
+
+def call_cost(usage):
+    """USD cost of one call, or None if the model's price isn't known"""
+    prices = MODEL_PRICES.get(usage.get('model'))
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    return (
+        usage['inputTokens'] * input_price
+        + usage['cacheReadTokens'] * input_price * 0.1
+        + usage['cacheWriteTokens'] * input_price * 1.25
+        + usage['outputTokens'] * output_price
+    ) / 1e6
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+
+def evaluate(records, models):
+    """Route every record with this tier list and score it"""
+    route_hits = 0
+    job_hits = 0
+    job_total = 0
+    errors = 0
+    escalations = 0
+    latencies = []
+    cost = 0.0
+    unpriced = set()
+
+    for record in records:
+        route, job_number = expected_routing(record)
+        start = time.perf_counter()
+        try:
+            routing = route_with_claude(record['content'], tiers=models)
+        except Exception as e:
+            print(f"  error: {e}")
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+        escalations += bool(routing['tiering']['escalations'])
+        for usage in routing['tiering']['calls']:
+            call = call_cost(usage)
+            if call is None:
+                unpriced.add(usage.get('model'))
+            else:
+                cost += call
+
+        route_hits += routing.get('route') == route
+        if job_number:
+            job_total += 1
+            chosen = routing.get('jobNumber') or (routing.get('suggestedJob') or {}).get('jobNumber')
+            job_hits += chosen == job_number
+
+    scored = len(records)
+    return {
+        'routeAccuracy': route_hits / scored if scored else 0.0,
+        'jobAccuracy': job_hits / job_total if job_total else None,
+        'escalationRate': escalations / scored if scored else 0.0,
+        'errors': errors,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'costPer1000': cost / scored * 1000 if scored else 0.0,
+        'unpriced': unpriced
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare Traffic model tiers on recorded prompts')
+    parser.add_argument('records', help='JSONL written via TRAFFIC_RECORD_PATH')
+    parser.add_argument('--tiers', default='small,large,tiered', help='Comma-separated tiers to run')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N records')
+    args = parser.parse_args()
+
+    records = load_records(args.records, args.limit)
+    print(f"{len(records)} records - small={TRAFFIC_CLASSIFY_MODEL} large={TRAFFIC_ESCALATE_MODEL}")
+    print(f"{'tier':>7}  {'route':>6}  {'job':>6}  {'escal.':>6}  {'errors':>6}  {'p50 s':>6}  {'p95 s':>6}  {'$/1000':>7}")
+
+    for tier in args.tiers.split(','):
+        result = evaluate(records, TIERS[tier])
+        job = f"{result['jobAccuracy']:.1%}" if result['jobAccuracy'] is not None else '-'
+        print(
+            f"{tier:>7}  {result['routeAccuracy']:>6.1%}  {job:>6}  {result['escalationRate']:>6.1%}  "
+            f"{result['errors']:>6}  {result['p50']:>6.2f}  {result['p95']:>6.2f}  {result['costPer1000']:>7.2f}"
+        )
+        if result['unpriced']:
+            print(f"         (no price for {', '.join(sorted(result['unpriced']))} - cost excludes it)")
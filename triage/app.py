@@ -8,33 +8,43 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, request, jsonify
-from anthropic import Anthropic
-import httpx
 import json
 
 from shared import (
-    ANTHROPIC_API_KEY,
-    ANTHROPIC_MODEL,
-    strip_markdown_json,
+    compact_email,
+    create_structured,
+    LLMUnavailable,
+    AirtableUnavailable,
+    model_for,
+    get_llm_stats,
     increment_client_job_number,
     create_project
 )
+from shared.idempotency import idempotent, get_idempotency_stats
+from shared.jobs import async_job, init_jobs, get_jobs_stats
 
 app = Flask(__name__)
 
-# Anthropic client
-anthropic_client = Anthropic(
-    api_key=ANTHROPIC_API_KEY,
-    http_client=httpx.Client(timeout=60.0, follow_redirects=True)
-)
+# GET /jobs/<id> and background workers for ?async=true requests
+init_jobs(app)
 
 # Load prompt
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), 'prompt.txt')
 with open(PROMPT_PATH, 'r') as f:
     TRIAGE_PROMPT = f.read()
 
+# Load output schema (the tool Claude must answer with)
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.json')
+with open(SCHEMA_PATH, 'r') as f:
+    TRIAGE_SCHEMA = json.load(f)
+
+# Model for this app (TRIAGE_MODEL, else ANTHROPIC_MODEL)
+TRIAGE_MODEL = model_for('triage')
+
 
 @app.route('/triage', methods=['POST'])
+@async_job('triage')
+@idempotent('triage')
 def triage():
     """Process new job triage.
     
@@ -54,9 +64,14 @@ def triage():
         if not email_content:
             return jsonify({'error': 'No email content provided'}), 400
         
+        # Strip quoted history, signatures and disclaimers (forwarded briefs are kept)
+        email_content, compaction = compact_email(email_content)
+        
         # Call Claude for triage analysis
-        response = anthropic_client.messages.create(
-            model=ANTHROPIC_MODEL,
+        analysis, usage = create_structured(
+            tool=TRIAGE_SCHEMA,
+            label='Triage',
+            model=TRIAGE_MODEL,
             max_tokens=2000,
             temperature=0.2,
             system=TRIAGE_PROMPT,
@@ -65,11 +80,6 @@ def triage():
             ]
         )
         
-        # Parse response
-        content = response.content[0].text
-        content = strip_markdown_json(content)
-        analysis = json.loads(content)
-        
         # Get job number and client info from Airtable
         client_code = analysis.get('clientCode', 'TBC')
         
@@ -103,14 +113,26 @@ def triage():
             'sharepointUrl': sharepoint_url,
             'jobRecordId': job_record_id,
             'emailBody': analysis.get('emailBody', ''),
-            'fullAnalysis': analysis
+            'fullAnalysis': analysis,
+            'usage': usage,
+            'compaction': compaction
         })
         
+    except LLMUnavailable as e:
+        return jsonify({
+            'error': 'Claude unavailable',
+            'details': str(e)
+        }), 503
+    except AirtableUnavailable as e:
+        return jsonify({
+            'error': 'Airtable unavailable',
+            'details': str(e)
+        }), 503
     except json.JSONDecodeError as e:
         return jsonify({
             'error': 'Claude returned invalid JSON',
             'details': str(e),
-            'raw_response': content if 'content' in locals() else 'No response'
+            'raw_response': getattr(e, 'raw_response', 'No response')
         }), 500
     except Exception as e:
         return jsonify({
@@ -125,7 +147,10 @@ def health():
     return jsonify({
         'status': 'healthy',
         'service': 'Dot Triage',
-        'version': '2.0'
+        'version': '2.0',
+        'llm': get_llm_stats(),
+        'idempotency': get_idempotency_stats(),
+        'jobs': get_jobs_stats()
     })
 
 
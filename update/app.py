@@ -8,34 +8,47 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, request, jsonify
-from anthropic import Anthropic
-import httpx
 import json
 
 from shared import (
-    ANTHROPIC_API_KEY,
-    ANTHROPIC_MODEL,
-    strip_markdown_json,
+    compact_email,
+    create_structured,
+    LLMUnavailable,
+    AirtableUnavailable,
+    model_for,
+    get_llm_stats,
     get_project_by_job_number,
+    get_cache_stats,
+    start_mirror_sync,
     create_update,
-    update_project_fields
+    update_project_fields_by_id
 )
+from shared.jobs import async_job, init_jobs, get_jobs_stats
 
 app = Flask(__name__)
 
-# Anthropic client
-anthropic_client = Anthropic(
-    api_key=ANTHROPIC_API_KEY,
-    http_client=httpx.Client(timeout=60.0, follow_redirects=True)
-)
+# GET /jobs/<id> and background workers for ?async=true requests
+init_jobs(app)
+
+# Keep the local Airtable mirror warm (no-op unless AIRTABLE_MIRROR_ENABLED)
+start_mirror_sync()
 
 # Load prompt
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), 'prompt.txt')
 with open(PROMPT_PATH, 'r') as f:
     UPDATE_PROMPT = f.read()
 
+# Load output schema (the tool Claude must answer with)
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.json')
+with open(SCHEMA_PATH, 'r') as f:
+    UPDATE_SCHEMA = json.load(f)
+
+# Model for this app (UPDATE_MODEL, else ANTHROPIC_MODEL)
+UPDATE_MODEL = model_for('update')
+
 
 @app.route('/update', methods=['POST'])
+@async_job('update')
 def update():
     """Process job updates.
     
@@ -71,6 +84,9 @@ def update():
                 'message': f"Could not find job {job_number} in the system"
             }), 404
         
+        # Strip quoted history, signatures and disclaimers
+        email_content, compaction = compact_email(email_content)
+        
         # Build content for Claude
         update_content = f"""Job Number: {job_number}
 Client Name: {project['clientName']}
@@ -79,8 +95,10 @@ Email/Message Content:
 {email_content}"""
         
         # Call Claude for update analysis
-        response = anthropic_client.messages.create(
-            model=ANTHROPIC_MODEL,
+        analysis, usage = create_structured(
+            tool=UPDATE_SCHEMA,
+            label='Update',
+            model=UPDATE_MODEL,
             max_tokens=1500,
             temperature=0.2,
             system=UPDATE_PROMPT,
@@ -89,11 +107,6 @@ Email/Message Content:
             ]
         )
         
-        # Parse response
-        content = response.content[0].text
-        content = strip_markdown_json(content)
-        analysis = json.loads(content)
-        
         # Check for errors from Claude
         if analysis.get('error'):
             return jsonify(analysis), 400
@@ -122,21 +135,33 @@ Email/Message Content:
             project_fields = {k: v for k, v in analysis['projectUpdates'].items() 
                            if k not in ['Update', 'Update due']}
             if project_fields:
-                project_updated = update_project_fields(job_number, project_fields)
+                project_updated = update_project_fields_by_id(project['recordId'], project_fields, job_number=job_number)
         
         # Add results to response
         analysis['updateCreated'] = update_created
         analysis['projectUpdated'] = project_updated
         analysis['teamsChannelId'] = project['teamsChannelId']
         analysis['projectRecordId'] = project['recordId']
+        analysis['usage'] = usage
+        analysis['compaction'] = compaction
         
         return jsonify(analysis)
         
+    except LLMUnavailable as e:
+        return jsonify({
+            'error': 'Claude unavailable',
+            'details': str(e)
+        }), 503
+    except AirtableUnavailable as e:
+        return jsonify({
+            'error': 'Airtable unavailable',
+            'details': str(e)
+        }), 503
     except json.JSONDecodeError as e:
         return jsonify({
             'error': 'Claude returned invalid JSON',
             'details': str(e),
-            'raw_response': content if 'content' in locals() else 'No response'
+            'raw_response': getattr(e, 'raw_response', 'No response')
         }), 500
     except Exception as e:
         return jsonify({
@@ -151,7 +176,10 @@ def health():
     return jsonify({
         'status': 'healthy',
         'service': 'Dot Update',
-        'version': '2.0'
+        'version': '2.0',
+        'cache': get_cache_stats(),
+        'llm': get_llm_stats(),
+        'jobs': get_jobs_stats()
     })
 
 
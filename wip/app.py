@@ -7,52 +7,154 @@ import os
 # Add parent directory to path for shared imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, request, jsonify
-import httpx
+from flask import Flask, request, jsonify, Response
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from zoneinfo import ZoneInfo
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+import zipfile
+from functools import lru_cache
 
-from shared.config import AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_CLIENTS_TABLE, AIRTABLE_PROJECTS_TABLE
+from shared.config import AIRTABLE_API_KEY, AIRTABLE_CLIENTS_TABLE, AIRTABLE_PROJECTS_TABLE, VALID_CLIENT_CODES
 from shared.helpers import format_date_display
+from shared.airtable import iter_records, find_record
+from shared.cache import PersistentCache
+from shared.compression import init_compression
+from shared import mirror
 
 app = Flask(__name__)
 
+# gzip/br responses negotiated via Accept-Encoding
+init_compression(app, min_size=int(os.environ.get('WIP_COMPRESS_MIN_SIZE', 1024)))
 
-def _get_headers():
-    """Get standard Airtable headers"""
+# Keep the local Airtable mirror warm (no-op unless AIRTABLE_MIRROR_ENABLED)
+mirror.start_sync_worker()
+
+# WIP email template, compiled once per worker. Autoescaping keeps job
+# names containing < or & from breaking the markup.
+_jinja = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    autoescape=select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False
+)
+WIP_TEMPLATE = _jinja.get_template('wip_email.html')
+
+# Strip layout whitespace, HTML comments and repeated style declarations
+# from rendered WIPs. Styles stay inline (and MSO conditionals untouched)
+# because Outlook ignores most <style> rules.
+WIP_MINIFY = os.environ.get('WIP_MINIFY', 'true').lower() == 'true'
+
+# Template edits and the minify setting both change the rendered output
+WIP_RENDER_VERSION = hashlib.sha256(
+    (_jinja.loader.get_source(_jinja, 'wip_email.html')[0] + str(WIP_MINIFY)).encode('utf-8')
+).hexdigest()[:12]
+
+# Streamed text/html responses are sent in chunks of at least this many characters
+WIP_STREAM_CHUNK = int(os.environ.get('WIP_STREAM_CHUNK', 8192))
+
+# Field projections - only request what the WIP email renders
+CLIENT_INFO_FIELDS = ['Client', 'Client code', 'Wip headers']
+ACTIVE_PROJECT_FIELDS = [
+    'Job Number', 'Project Name', 'Description', 'Stage', 'Status', 'With Client?',
+    'Update', 'Update due', 'Live Date', 'Client', 'Project Owner'
+]
+COMPLETED_PROJECT_FIELDS = ['Job Number', 'Project Name', 'Description']
+WIP_SCAN_FIELDS = ACTIVE_PROJECT_FIELDS + ['Status Changed']
+
+# The three WIP queries run in parallel under one combined deadline
+WIP_FETCH_DEADLINE = float(os.environ.get('WIP_FETCH_DEADLINE', 30.0))
+_fetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('WIP_FETCH_WORKERS', 12)),
+    thread_name_prefix='wip-fetch'
+)
+
+# Rendered WIP cache, shared by all workers. Entries younger than
+# WIP_CACHE_MAX_AGE are served without querying Airtable; older ones are
+# re-queried and only re-rendered if the source records changed.
+WIP_CACHE_DB = os.environ.get('WIP_CACHE_DB', '/tmp/dot-wip-cache.sqlite')
+WIP_CACHE_MAX_AGE = float(os.environ.get('WIP_CACHE_MAX_AGE', 120.0))
+_wip_cache = PersistentCache(WIP_CACHE_DB, ttl=7 * 24 * 3600, name='wip_rendered')
+
+# Weekly warm-up so every client's WIP is pre-rendered before the Monday send
+WIP_WARMUP_ENABLED = os.environ.get('WIP_WARMUP_ENABLED', 'false').lower() == 'true'
+WIP_WARMUP_DAY = os.environ.get('WIP_WARMUP_DAY', 'Mon')
+WIP_WARMUP_TIME = os.environ.get('WIP_WARMUP_TIME', '07:00')
+WIP_WARMUP_TZ = os.environ.get('WIP_WARMUP_TZ', 'Pacific/Auckland')
+
+
+def _client_info(record):
+    """Client name, code and WIP header image URL from a Clients record"""
+    fields = record.get('fields', {})
+    
+    wip_header = fields.get('Wip headers', [])
+    header_url = wip_header[0].get('url', '') if wip_header else ''
+    
     return {
-        'Authorization': f'Bearer {AIRTABLE_API_KEY}',
-        'Content-Type': 'application/json'
+        'client_name': fields.get('Client', ''),
+        'client_code': fields.get('Client code', ''),
+        'header_url': header_url
     }
 
 
+def _active_project(record):
+    """WIP job details from an active Projects record"""
+    fields = record.get('fields', {})
+    return {
+        'job_number': fields.get('Job Number', ''),
+        'job_name': fields.get('Project Name', ''),
+        'description': fields.get('Description', ''),
+        'stage': fields.get('Stage', ''),
+        'status': fields.get('Status', ''),
+        'with_client': fields.get('With Client?', False),
+        'update_summary': fields.get('Update', ''),
+        'update_due': fields.get('Update due', ''),
+        'live_date': fields.get('Live Date', ''),
+        'client': fields.get('Client', ''),
+        'project_owner': fields.get('Project Owner', '')
+    }
+
+
+def _completed_project(record):
+    """WIP summary from a completed Projects record"""
+    fields = record.get('fields', {})
+    return {
+        'job_number': fields.get('Job Number', ''),
+        'job_name': fields.get('Project Name', ''),
+        'description': fields.get('Description', '')
+    }
+
+
+def _completed_since():
+    """Completed projects show for 6 weeks after their Status Changed date"""
+    return (datetime.now() - timedelta(days=42)).strftime('%Y-%m-%d')
+
+
 def get_client_info(client_code):
     """Fetch client info including WIP header image from Clients table"""
     if not AIRTABLE_API_KEY:
         return None
     
     try:
-        filter_formula = f"{{Client code}}='{client_code}'"
-        url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_CLIENTS_TABLE}"
-        params = {'filterByFormula': filter_formula}
-        
-        response = httpx.get(url, headers=_get_headers(), params=params, timeout=30.0)
-        response.raise_for_status()
+        record = None
+        if mirror.is_fresh(AIRTABLE_CLIENTS_TABLE):
+            record = mirror.find_record(AIRTABLE_CLIENTS_TABLE, 'client_code', client_code)
         
-        records = response.json().get('records', [])
+        if not record:
+            filter_formula = f"{{Client code}}='{client_code}'"
+            record = find_record(AIRTABLE_CLIENTS_TABLE, filter_formula, fields=CLIENT_INFO_FIELDS, timeout=30.0)
         
-        if not records:
+        if not record:
             return None
         
-        fields = records[0].get('fields', {})
-        
-        wip_header = fields.get('Wip headers', [])
-        header_url = wip_header[0].get('url', '') if wip_header else ''
-        
-        return {
-            'client_name': fields.get('Client', ''),
-            'client_code': fields.get('Client code', ''),
-            'header_url': header_url
-        }
+        return _client_info(record)
         
     except Exception as e:
         print(f"Error fetching client info: {e}")
@@ -86,68 +188,285 @@ def normalize_client_code(client_code):
     return client_code
 
 
-def get_client_projects(client_code):
-    """Fetch all active projects for a client from Airtable"""
+def _active_project_records(client_code):
+    """Active project records - from the local mirror when fresh, else Airtable"""
+    if mirror.is_fresh(AIRTABLE_PROJECTS_TABLE):
+        return mirror.select_records(
+            AIRTABLE_PROJECTS_TABLE, order_by='job_number',
+            client_code=client_code, status=['In Progress', 'On Hold']
+        )
+    
+    # Filter by client code (Job Number prefix) and active status
+    filter_formula = f"AND(FIND('{client_code}', {{Job Number}})=1, OR({{Status}}='In Progress', {{Status}}='On Hold'))"
+    return iter_records(AIRTABLE_PROJECTS_TABLE, formula=filter_formula, fields=ACTIVE_PROJECT_FIELDS, timeout=30.0)
+
+
+def _completed_project_records(client_code, since):
+    """Projects completed since `since` (YYYY-MM-DD), most recent first"""
+    if mirror.is_fresh(AIRTABLE_PROJECTS_TABLE):
+        records = mirror.select_records(AIRTABLE_PROJECTS_TABLE, client_code=client_code, status='Completed')
+        records = [r for r in records if (r['fields'].get('Status Changed') or '')[:10] > since]
+        return sorted(records, key=lambda r: r['fields'].get('Status Changed', ''), reverse=True)
+    
+    completed_filter = f"AND(FIND('{client_code}', {{Job Number}})=1, {{Status}}='Completed', IS_AFTER({{Status Changed}}, '{since}'))"
+    completed_sort = [{'field': 'Status Changed', 'direction': 'desc'}]
+    return iter_records(
+        AIRTABLE_PROJECTS_TABLE, formula=completed_filter, fields=COMPLETED_PROJECT_FIELDS,
+        sort=completed_sort, timeout=30.0
+    )
+
+
+def get_active_projects(client_code):
+    """Fetch active (In Progress, On Hold) projects for a client.
+    
+    Errors are raised so fetch_wip_data can report them.
+    """
+    return [_active_project(record) for record in _active_project_records(client_code)]
+
+
+def get_completed_projects(client_code):
+    """Fetch recently completed projects (Status Changed in last 6 weeks).
+    
+    Errors are raised so fetch_wip_data can report them.
+    """
+    return [_completed_project(record) for record in _completed_project_records(client_code, _completed_since())]
+
+
+def fetch_wip_data(client_code, deadline=None):
+    """Fetch active projects, completed projects and client info concurrently.
+    
+    All three queries share one deadline, so WIP waits roughly one Airtable
+    round trip instead of three. Anything that fails or misses the deadline
+    comes back empty and is named in 'missing' so the caller can still
+    render a partial WIP.
+    """
+    if deadline is None:
+        deadline = WIP_FETCH_DEADLINE
+    
+    result = {'active': [], 'completed': [], 'client_info': None, 'missing': []}
+    
     if not AIRTABLE_API_KEY:
-        return [], []
+        return result
     
-    try:
-        # Filter by client code (Job Number prefix) and active status
-        filter_formula = f"AND(FIND('{client_code}', {{Job Number}})=1, OR({{Status}}='In Progress', {{Status}}='On Hold'))"
-        
-        url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_PROJECTS_TABLE}"
-        params = {'filterByFormula': filter_formula}
-        
-        response = httpx.get(url, headers=_get_headers(), params=params, timeout=30.0)
-        response.raise_for_status()
-        
-        records = response.json().get('records', [])
-        
-        active_projects = []
-        for record in records:
-            fields = record.get('fields', {})
-            active_projects.append({
-                'job_number': fields.get('Job Number', ''),
-                'job_name': fields.get('Project Name', ''),
-                'description': fields.get('Description', ''),
-                'stage': fields.get('Stage', ''),
-                'status': fields.get('Status', ''),
-                'with_client': fields.get('With Client?', False),
-                'update_summary': fields.get('Update', ''),
-                'update_due': fields.get('Update due', ''),
-                'live_date': fields.get('Live Date', ''),
-                'client': fields.get('Client', ''),
-                'project_owner': fields.get('Project Owner', '')
-            })
-        
-        # Get recently completed projects (Status = Completed, Status Changed in last 6 weeks)
-        six_weeks_ago = (datetime.now() - timedelta(days=42)).strftime('%Y-%m-%d')
-        completed_filter = f"AND(FIND('{client_code}', {{Job Number}})=1, {{Status}}='Completed', IS_AFTER({{Status Changed}}, '{six_weeks_ago}'))"
-        
-        completed_params = {'filterByFormula': completed_filter, 'sort[0][field]': 'Status Changed', 'sort[0][direction]': 'desc'}
-        completed_response = httpx.get(url, headers=_get_headers(), params=completed_params, timeout=30.0)
-        completed_response.raise_for_status()
-        
-        completed_records = completed_response.json().get('records', [])
+    futures = {
+        _fetch_executor.submit(get_active_projects, client_code): 'active',
+        _fetch_executor.submit(get_completed_projects, client_code): 'completed',
+        _fetch_executor.submit(get_client_info, client_code): 'client_info'
+    }
+    
+    done, not_done = wait(futures, timeout=deadline)
+    
+    for future in not_done:
+        future.cancel()
+        print(f"WIP fetch of {futures[future]} for {client_code} missed the {deadline}s deadline")
+        result['missing'].append(futures[future])
+    
+    for future in done:
+        name = futures[future]
+        try:
+            result[name] = future.result()
+        except Exception as e:
+            print(f"Airtable error fetching WIP {name} for {client_code}: {e}")
+            result['missing'].append(name)
+    
+    return result
+
+
+def fetch_all_wip_data(client_codes):
+    """Fetch WIP data for many clients with one project scan and one Clients query.
+    
+    Active and recently completed projects for every client come from a
+    single paginated scan, grouped in memory by job number prefix, instead
+    of three filtered queries per client. Errors are raised.
+    Returns {client_code: {'active', 'completed', 'client_info', 'missing'}}.
+    """
+    since = _completed_since()
+    data = {code: {'active': [], 'completed': [], 'client_info': None, 'missing': []} for code in client_codes}
+    
+    if mirror.is_fresh(AIRTABLE_PROJECTS_TABLE):
+        records = mirror.select_records(
+            AIRTABLE_PROJECTS_TABLE, order_by='job_number',
+            client_code=list(client_codes), status=['In Progress', 'On Hold', 'Completed']
+        )
+    else:
+        scan_filter = (
+            "OR({Status}='In Progress', {Status}='On Hold', "
+            f"AND({{Status}}='Completed', IS_AFTER({{Status Changed}}, '{since}')))"
+        )
+        records = iter_records(AIRTABLE_PROJECTS_TABLE, formula=scan_filter, fields=WIP_SCAN_FIELDS, timeout=30.0)
+    
+    completed_records = {code: [] for code in client_codes}
+    for record in records:
+        fields = record.get('fields', {})
+        code = (fields.get('Job Number', '') or '').split(' ')[0]
+        if code not in data:
+            continue
         
-        completed_projects = []
-        for record in completed_records:
-            fields = record.get('fields', {})
-            completed_projects.append({
-                'job_number': fields.get('Job Number', ''),
-                'job_name': fields.get('Project Name', ''),
-                'description': fields.get('Description', '')
-            })
+        if fields.get('Status') == 'Completed':
+            if (fields.get('Status Changed') or '')[:10] > since:
+                completed_records[code].append(record)
+        else:
+            data[code]['active'].append(_active_project(record))
+    
+    for code, client_completed in completed_records.items():
+        client_completed.sort(key=lambda r: r['fields'].get('Status Changed', ''), reverse=True)
+        data[code]['completed'] = [_completed_project(record) for record in client_completed]
+    
+    # Headers for every client in one query
+    if mirror.is_fresh(AIRTABLE_CLIENTS_TABLE):
+        client_records = mirror.select_records(AIRTABLE_CLIENTS_TABLE, client_code=list(client_codes))
+    else:
+        codes_filter = ', '.join(f"{{Client code}}='{code}'" for code in client_codes)
+        client_records = iter_records(
+            AIRTABLE_CLIENTS_TABLE, formula=f"OR({codes_filter})", fields=CLIENT_INFO_FIELDS, timeout=30.0
+        )
+    
+    for record in client_records:
+        info = _client_info(record)
+        if info['client_code'] in data:
+            data[info['client_code']]['client_info'] = info
+    
+    return data
+
+
+# ===================
+# RENDERED WIP CACHE
+# ===================
+
+def wip_fingerprint(client_code, active_projects, completed_projects, client_info):
+    """Content fingerprint of everything a WIP render depends on (also its ETag)"""
+    source = [
+        client_code,
+        WIP_RENDER_VERSION,  # template/minify changes invalidate cached renders
+        datetime.now().strftime('%d %B %Y'),  # the email is dated
+        active_projects,
+        completed_projects,
+        client_info
+    ]
+    payload = json.dumps(source, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def get_cached_wip(client_code):
+    """Cached {'fingerprint', 'result', 'storedAt'} for a client, or None"""
+    try:
+        return _wip_cache.get(f"wip:{client_code}")
+    except Exception as e:
+        print(f"WIP cache read failed: {e}")
+        return None
+
+
+def store_wip(client_code, fingerprint, result):
+    try:
+        _wip_cache.set(f"wip:{client_code}", {'fingerprint': fingerprint, 'result': result, 'storedAt': time.time()})
+    except Exception as e:
+        print(f"WIP cache write failed: {e}")
+
+
+def warm_wip_cache(client_codes=None):
+    """Pre-render and cache WIP for every client using one Airtable scan.
+    
+    Returns the client codes that were rendered.
+    """
+    client_codes = client_codes or VALID_CLIENT_CODES
+    all_data = fetch_all_wip_data(client_codes)
+    
+    warmed = []
+    for code in client_codes:
+        client_data = all_data[code]
+        if not client_data['active'] and not client_data['completed']:
+            continue
         
-        return active_projects, completed_projects
+        fingerprint = wip_fingerprint(code, client_data['active'], client_data['completed'], client_data['client_info'])
+        cached = get_cached_wip(code)
+        if cached and cached['fingerprint'] == fingerprint:
+            result = cached['result']
+        else:
+            result = build_client_wip(code, client_data['active'], client_data['completed'], client_data['client_info'])
         
-    except Exception as e:
-        print(f"Airtable error: {e}")
-        return [], []
+        store_wip(code, fingerprint, result)
+        warmed.append(code)
+    
+    print(f"Warmed WIP cache for {len(warmed)} clients: {', '.join(warmed)}")
+    return warmed
+
+
+def _warmup_now():
+    try:
+        return datetime.now(ZoneInfo(WIP_WARMUP_TZ))
+    except Exception:
+        return datetime.now()
+
+
+def _warmup_loop():
+    """Run warm_wip_cache once per week at WIP_WARMUP_DAY/WIP_WARMUP_TIME.
+    
+    Every worker runs this loop; claiming the week's slot in the shared
+    cache means only one of them does the warm-up.
+    """
+    while True:
+        now = _warmup_now()
+        if now.strftime('%a').lower() == WIP_WARMUP_DAY[:3].lower() and now.strftime('%H:%M') >= WIP_WARMUP_TIME:
+            try:
+                if _wip_cache.add(f"warmup:{now.strftime('%Y-%m-%d')}", True, ttl=8 * 24 * 3600):
+                    warm_wip_cache()
+            except Exception as e:
+                print(f"WIP warm-up failed: {e}")
+        time.sleep(60)
 
 
-def build_job_html(job):
-    """Build HTML block for a single job"""
+def start_warmup_scheduler():
+    """Start the weekly warm-up thread (no-op unless WIP_WARMUP_ENABLED)"""
+    if not WIP_WARMUP_ENABLED:
+        return None
+    
+    thread = threading.Thread(target=_warmup_loop, name='wip-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+# Comments other than Outlook's <!--[if mso]> conditionals
+_HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+_STYLE_ATTR = re.compile(r'style="([^"]*)"')
+# Whitespace spanning a line break, or at the edge of a rendered piece next to a tag
+_LAYOUT_WHITESPACE = re.compile(r'\s*\n\s*|\A\s+(?=<)|(?<=>)\s+\Z')
+
+
+@lru_cache(maxsize=256)
+def _minify_style(style):
+    """Normalise an inline style, dropping repeated declarations"""
+    declarations = []
+    for declaration in style.split(';'):
+        prop, _, value = declaration.partition(':')
+        declaration = f"{prop.strip().lower()}:{' '.join(value.split())}"
+        if prop.strip() and declaration not in declarations:
+            declarations.append(declaration)
+    return ';'.join(declarations)
+
+
+def _collapse_whitespace(match):
+    """Drop template indentation next to tags, keep a single space in text"""
+    text = match.string
+    before = text[match.start() - 1] if match.start() > 0 else None
+    after = text[match.end()] if match.end() < len(text) else None
+    if before == '>' or after == '<' or before is None and after is None:
+        return ''
+    return ' '
+
+
+def minify_html(html):
+    """Minify rendered WIP HTML without changing how mail clients show it.
+    
+    Only whitespace runs that span a line break are touched, so spacing
+    inside text and between inline tags is preserved.
+    """
+    html = _HTML_COMMENT.sub('', html)
+    html = _STYLE_ATTR.sub(lambda match: f'style="{_minify_style(match.group(1))}"', html)
+    return _LAYOUT_WHITESPACE.sub(_collapse_whitespace, html)
+
+
+def _job_view(job):
+    """Display values for a single job row"""
     # Handle lookup fields that return as arrays
     update_summary = job['update_summary']
     if isinstance(update_summary, list):
@@ -169,144 +488,136 @@ def build_job_html(job):
     elif live_date.lower() not in ['tbc', 'early', 'late', 'mid'] and not any(x in live_date.lower() for x in ['early', 'late', 'mid']):
         live_date = format_date_display(live_date) or live_date
     
-    return f'''
-    <tr>
-      <td style="padding: 15px 20px; border-bottom: 1px solid #eee;">
-        <p style="margin: 0 0 5px 0; font-size: 16px; font-weight: bold; color: #333;">
-          {job['job_number']} — {job['job_name']}
-        </p>
-        <p style="margin: 0 0 10px 0; font-size: 14px; color: #666; line-height: 1.4;">
-          {job['description']}
-        </p>
-        <table cellpadding="0" cellspacing="0" style="font-size: 13px; color: #888;">
-          <tr><td style="padding: 2px 10px 2px 0;"><strong>Owner:</strong></td><td>{job['project_owner']}</td></tr>
-          <tr><td style="padding: 2px 10px 2px 0;"><strong>Update:</strong></td><td>{update_summary}</td></tr>
-          <tr><td style="padding: 2px 10px 2px 0;"><strong>Due on:</strong></td><td>{update_due}</td></tr>
-          <tr><td style="padding: 2px 10px 2px 0;"><strong>Live by:</strong></td><td>{live_date}</td></tr>
-          <tr><td style="padding: 2px 10px 2px 0;"><strong>Job stage:</strong></td><td>{job['stage']}</td></tr>
-        </table>
-      </td>
-    </tr>'''
-
-
-def build_section_html(title, jobs, color="#ED1C24"):
-    """Build HTML section with header and jobs"""
-    if not jobs:
-        return ''
-    
-    section = f'''
-    <tr>
-      <td style="padding: 20px 20px 0 20px;">
-        <div style="background-color: {color}; color: #ffffff; padding: 8px 15px; font-size: 14px; font-weight: bold; border-radius: 3px;">
-          {title}
-        </div>
-      </td>
-    </tr>'''
-    
-    for job in jobs:
-        section += build_job_html(job)
+    return {**job, 'update_summary': update_summary, 'update_due': update_due, 'live_date': live_date}
+
+
+def _wip_context(client_name, projects, completed_projects, header_url):
+    """Template variables for a WIP email"""
+    jobs = [_job_view(p) for p in projects]
     
-    return section
+    # Sort projects into categories
+    return {
+        'client_name': client_name,
+        'header_url': header_url,
+        'today': datetime.now().strftime('%d %B %Y'),
+        'with_us': [p for p in jobs if p['status'] == 'In Progress' and not p['with_client']],
+        'with_you': [p for p in jobs if p['status'] == 'In Progress' and p['with_client']],
+        'on_hold': [p for p in jobs if p['status'] == 'On Hold'],
+        'completed_projects': completed_projects
+    }
 
 
-def build_completed_section(completed_projects):
-    """Build HTML section for recently completed projects"""
-    if not completed_projects:
-        return ''
+def generate_wip_email(client_name, projects, completed_projects, header_url=''):
+    """Yield the WIP email HTML a section at a time.
     
-    items = "".join([
-        f"<li style='margin-bottom: 8px;'><strong style='color: #ED1C24;'>{p['job_number']}</strong> — {p['job_name']} — {p['description']}</li>"
-        for p in completed_projects
-    ])
+    Each job section comes out of the template as one piece; the small
+    pieces between them are buffered up to WIP_STREAM_CHUNK characters.
+    """
+    pieces = WIP_TEMPLATE.generate(**_wip_context(client_name, projects, completed_projects, header_url))
+    
+    buffer = []
+    size = 0
+    for piece in pieces:
+        if WIP_MINIFY:
+            piece = minify_html(piece)
+        buffer.append(piece)
+        size += len(piece)
+        if size >= WIP_STREAM_CHUNK:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
     
-    return f'''
-    <tr>
-      <td style="padding: 20px;">
-        <div style="border-top: 2px solid #eee; padding-top: 20px;">
-          <p style="margin: 0 0 12px 0; font-size: 14px; font-weight: bold; color: #333;">✅ RECENTLY COMPLETED</p>
-          <ul style="margin: 0; padding-left: 20px; color: #666; font-size: 14px;">
-            {items}
-          </ul>
-        </div>
-      </td>
-    </tr>'''
+    if buffer:
+        yield ''.join(buffer)
 
 
 def build_wip_email(client_name, projects, completed_projects, header_url=''):
-    """Build complete WIP email HTML"""
-    today = datetime.now().strftime('%d %B %Y')
+    """Build complete WIP email HTML from the precompiled template"""
+    return ''.join(generate_wip_email(client_name, projects, completed_projects, header_url))
+
+
+def _client_name(client_code, active_projects, client_info):
+    """Client name from first project or client info"""
+    if active_projects:
+        return active_projects[0].get('client', client_code)
+    if client_info:
+        return client_info.get('client_name', client_code)
+    return client_code
+
+
+def build_client_wip(client_code, active_projects, completed_projects, client_info, html=None):
+    """Render one client's WIP and wrap it in the /wip response fields"""
+    header_url = client_info.get('header_url', '') if client_info else ''
+    client_name = _client_name(client_code, active_projects, client_info)
     
-    # Sort projects into categories
-    with_us = [p for p in projects if p['status'] == 'In Progress' and not p['with_client']]
-    with_you = [p for p in projects if p['status'] == 'In Progress' and p['with_client']]
-    on_hold = [p for p in projects if p['status'] == 'On Hold']
+    # Build HTML
+    if html is None:
+        html = build_wip_email(client_name, active_projects, completed_projects, header_url)
     
-    # Build header - use image if available, otherwise text
-    if header_url:
-        header_content = f'''<img src="{header_url}" width="600" style="width: 100%; max-width: 600px; height: auto; display: block;" alt="{client_name} WIP Header">'''
+    return {
+        'clientCode': client_code,
+        'clientName': client_name,
+        'activeCount': len(active_projects),
+        'completedCount': len(completed_projects),
+        'html': html
+    }
+
+
+def _wip_headers(response, result, fingerprint, cache_status):
+    """ETag and WIP metadata headers. The ETag is weak so it holds for the
+    gzip/br encodings of the same body too."""
+    response.set_etag(fingerprint, weak=True)
+    response.headers['X-WIP-Cache'] = cache_status
+    response.headers['X-WIP-Client-Code'] = result['clientCode']
+    if result.get('partial'):
+        response.headers['X-WIP-Missing'] = ','.join(result['missing'])
+    return response
+
+
+def _wip_response(result, fingerprint, cache_status, output_format='json'):
+    """JSON (or text/html) response with an ETag, or 304 if the caller
+    already has this version"""
+    if request.if_none_match.contains_weak(fingerprint):
+        response = Response(status=304)
+    elif output_format == 'html':
+        response = Response(result['html'], mimetype='text/html')
     else:
-        header_content = f'''<span style="font-size: 28px; font-weight: bold; color: #ED1C24;">HUNCH — WIP</span>'''
-    
-    html = f'''<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1.0">
-  <meta http-equiv="X-UA-Compatible" content="IE=edge">
-  <!--[if mso]>
-  <style type="text/css">
-    table {{border-collapse: collapse; border-spacing: 0; margin: 0;}}
-    div, td {{padding: 0;}}
-    div {{margin: 0 !important;}}
-  </style>
-  <noscript>
-    <xml>
-      <o:OfficeDocumentSettings>
-        <o:PixelsPerInch>96</o:PixelsPerInch>
-      </o:OfficeDocumentSettings>
-    </xml>
-  </noscript>
-  <![endif]-->
-  <style>
-    @media screen and (max-width: 600px) {{
-      .wrapper {{
-        width: 100% !important;
-        padding: 12px !important;
-      }}
-    }}
-  </style>
-</head>
-<body style="margin: 0; padding: 20px; font-family: Calibri, Arial, sans-serif; background-color: #f5f5f5; width: 100% !important; -webkit-text-size-adjust: 100%; -ms-text-size-adjust: 100%;">
-  
-  <table class="wrapper" width="600" cellpadding="0" cellspacing="0" style="width: 600px; max-width: 100%; margin: 0 auto; background-color: #ffffff;">
-    
-    <!-- Header -->
-    <tr>
-      <td style="border-bottom: 4px solid #ED1C24; padding: 20px;">
-        {header_content}
-        <p style="margin: 15px 0 0 0; font-size: 22px; font-weight: bold; color: #333;">{client_name}: WIP</p>
-        <p style="margin: 5px 0 0 0; font-size: 12px; color: #999;">{today}</p>
-      </td>
-    </tr>
-    
-    {build_section_html("IN PROGRESS", with_us)}
-    {build_section_html("JOBS WITH YOU", with_you)}
-    {build_section_html("ON HOLD", on_hold, "#999999")}
-    {build_completed_section(completed_projects)}
-    
-    <!-- Footer -->
-    <tr>
-      <td style="padding: 25px 20px; border-top: 1px solid #eee; text-align: center;">
-        <p style="margin: 0; font-size: 12px; color: #999;">WIP updated by Dot@hunch</p>
-      </td>
-    </tr>
-    
-  </table>
-  
-</body>
-</html>'''
-    
-    return html
+        response = jsonify(result)
+    
+    return _wip_headers(response, result, fingerprint, cache_status)
+
+
+def _streamed_wip_response(client_code, wip_data, fingerprint):
+    """Render straight into a streamed text/html response, caching the
+    finished email once the last section has been sent"""
+    active_projects = wip_data['active']
+    completed_projects = wip_data['completed']
+    client_info = wip_data['client_info']
+    
+    header_url = client_info.get('header_url', '') if client_info else ''
+    client_name = _client_name(client_code, active_projects, client_info)
+    result = {
+        'clientCode': client_code,
+        'partial': bool(wip_data['missing']),
+        'missing': wip_data['missing']
+    }
+    
+    def generate():
+        chunks = []
+        for chunk in generate_wip_email(client_name, active_projects, completed_projects, header_url):
+            chunks.append(chunk)
+            yield chunk
+        
+        # Never cache a partial WIP
+        if not wip_data['missing']:
+            html = ''.join(chunks)
+            store_wip(client_code, fingerprint, {
+                **build_client_wip(client_code, active_projects, completed_projects, client_info, html=html),
+                **result
+            })
+    
+    response = Response(generate(), mimetype='text/html')
+    return _wip_headers(response, result, fingerprint, 'miss')
 
 
 @app.route('/wip', methods=['POST'])
@@ -321,47 +632,142 @@ def wip():
         - html: Complete WIP email HTML
         - clientCode, clientName
         - activeCount, completedCount
+        - partial/missing: set if a query failed or missed the deadline
+    
+    Send If-None-Match with a previous ETag to get a 304 if unchanged,
+    or refresh: true to skip the rendered cache's max-age window.
+    
+    format: 'html' returns the email itself as text/html, streamed
+    section by section when freshly rendered. Counts and cache status
+    come back in X-WIP-* headers.
     """
     try:
         data = request.get_json()
         client_code = data.get('clientCode', data.get('client', ''))
+        output_format = data.get('format', 'json')
         
         if not client_code:
             return jsonify({'error': 'No client code provided'}), 400
         
+        if output_format not in ('json', 'html'):
+            return jsonify({'error': f"Unknown format '{output_format}'"}), 400
+        
         # Normalize client code (convert name to code if needed)
         client_code = normalize_client_code(client_code)
         
-        # Get projects from Airtable
-        active_projects, completed_projects = get_client_projects(client_code)
+        cached = get_cached_wip(client_code)
+        
+        # Recently rendered - serve without touching Airtable
+        if cached and not data.get('refresh') and time.time() - cached['storedAt'] < WIP_CACHE_MAX_AGE:
+            return _wip_response(cached['result'], cached['fingerprint'], 'hit', output_format)
+        
+        # Get projects and client info (including header image) from Airtable
+        wip_data = fetch_wip_data(client_code)
+        active_projects = wip_data['active']
+        completed_projects = wip_data['completed']
+        client_info = wip_data['client_info']
         
         if not active_projects and not completed_projects:
+            if 'active' in wip_data['missing'] or 'completed' in wip_data['missing']:
+                return jsonify({
+                    'error': 'Airtable unavailable',
+                    'clientCode': client_code,
+                    'missing': wip_data['missing']
+                }), 503
             return jsonify({
                 'error': 'No projects found',
                 'clientCode': client_code
             }), 404
         
-        # Get client info (including header image) from Clients table
-        client_info = get_client_info(client_code)
-        header_url = client_info.get('header_url', '') if client_info else ''
+        fingerprint = wip_fingerprint(client_code, active_projects, completed_projects, client_info)
         
-        # Get client name from first project or client info
-        if active_projects:
-            client_name = active_projects[0].get('client', client_code)
-        elif client_info:
-            client_name = client_info.get('client_name', client_code)
-        else:
-            client_name = client_code
+        # Source records unchanged - reuse the rendered email
+        if cached and cached['fingerprint'] == fingerprint and not wip_data['missing']:
+            store_wip(client_code, fingerprint, cached['result'])
+            return _wip_response(cached['result'], fingerprint, 'revalidated', output_format)
         
-        # Build HTML
-        html = build_wip_email(client_name, active_projects, completed_projects, header_url)
+        if output_format == 'html':
+            if request.if_none_match.contains_weak(fingerprint):
+                return _wip_response({'clientCode': client_code}, fingerprint, 'miss')
+            return _streamed_wip_response(client_code, wip_data, fingerprint)
+        
+        result = build_client_wip(client_code, active_projects, completed_projects, client_info)
+        result['partial'] = bool(wip_data['missing'])
+        result['missing'] = wip_data['missing']
         
+        # Never cache a partial WIP
+        if not wip_data['missing']:
+            store_wip(client_code, fingerprint, result)
+        
+        return _wip_response(result, fingerprint, 'miss')
+        
+    except Exception as e:
         return jsonify({
-            'clientCode': client_code,
-            'clientName': client_name,
-            'activeCount': len(active_projects),
-            'completedCount': len(completed_projects),
-            'html': html
+            'error': 'Internal server error',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/wip/batch', methods=['POST'])
+def wip_batch():
+    """Generate WIP email HTML for many clients at once.
+    
+    Uses one project scan and one Clients query for all of them
+    instead of a /wip call (three queries) per client.
+    
+    Accepts:
+        - clientCodes: Client codes or names (optional, defaults to all)
+        - format: 'json' (default), 'ndjson' (one client per line,
+          streamed as rendered) or 'zip' (one HTML file per client)
+    
+    Returns:
+        - clients: A /wip style result per client with projects
+        - skipped: Client codes with no projects
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        output_format = data.get('format', 'json')
+        client_codes = [normalize_client_code(code) for code in data.get('clientCodes') or VALID_CLIENT_CODES]
+        client_codes = list(dict.fromkeys(client_codes))
+        
+        if output_format not in ('json', 'ndjson', 'zip'):
+            return jsonify({'error': f"Unknown format '{output_format}'"}), 400
+        
+        try:
+            all_data = fetch_all_wip_data(client_codes)
+        except Exception as e:
+            print(f"Airtable error fetching batch WIP: {e}")
+            return jsonify({'error': 'Airtable unavailable', 'details': str(e)}), 503
+        
+        with_projects = [code for code in client_codes if all_data[code]['active'] or all_data[code]['completed']]
+        skipped = [code for code in client_codes if code not in with_projects]
+        
+        def render(code):
+            client_data = all_data[code]
+            return build_client_wip(code, client_data['active'], client_data['completed'], client_data['client_info'])
+        
+        if output_format == 'ndjson':
+            def generate():
+                for code in with_projects:
+                    yield json.dumps(render(code)) + '\n'
+                for code in skipped:
+                    yield json.dumps({'clientCode': code, 'error': 'No projects found'}) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        if output_format == 'zip':
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for code in with_projects:
+                    archive.writestr(f"{code}-wip.html", render(code)['html'])
+            return Response(
+                buffer.getvalue(),
+                mimetype='application/zip',
+                headers={'Content-Disposition': 'attachment; filename="wip.zip"'}
+            )
+        
+        return jsonify({
+            'clients': [render(code) for code in with_projects],
+            'skipped': skipped
         })
         
     except Exception as e:
@@ -371,16 +777,43 @@ def wip():
         }), 500
 
 
+@app.route('/wip/warm', methods=['POST'])
+def wip_warm():
+    """Pre-render WIP for every client (or clientCodes) into the cache.
+    
+    For triggering from a scheduler; the built-in weekly warm-up
+    (WIP_WARMUP_ENABLED) calls the same thing.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        client_codes = [normalize_client_code(code) for code in data.get('clientCodes') or VALID_CLIENT_CODES]
+        
+        warmed = warm_wip_cache(list(dict.fromkeys(client_codes)))
+        
+        return jsonify({'warmed': warmed, 'count': len(warmed)})
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Internal server error',
+            'details': str(e)
+        }), 500
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'Dot WIP',
-        'version': '2.0'
+        'version': '2.0',
+        'cache': _wip_cache.stats()
     })
 
 
+# Weekly WIP pre-render (no-op unless WIP_WARMUP_ENABLED)
+start_warmup_scheduler()
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,70 @@
+# Dot WIP render benchmark
+# Times build_wip_email for growing job counts to check rendering stays linear.
+#
+#   python wip/bench_render.py [--jobs 10,100,500,1000] [--repeat 50]
+
+import sys
+import os
+import argparse
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import build_wip_email
+
+
+STATUSES = [('In Progress', False), ('In Progress', True), ('On Hold', False)]
+
+
+def sample_jobs(count):
+    """Fake active jobs, including names that need escaping"""
+    jobs = []
+    for i in range(count):
+        status, with_client = STATUSES[i % len(STATUSES)]
+        jobs.append({
+            'job_number': f"BEN {i:03d}",
+            'job_name': f"Campaign <{i}> & friends",
+            'description': 'Refresh the summer TVC and cutdowns for social',
+            'stage': 'Craft',
+            'status': status,
+            'with_client': with_client,
+            'update_summary': ['Awaiting feedback on round 2'],
+            'update_due': ['2026-10-20'],
+            'live_date': 'Early Nov',
+            'client': 'Bench Co',
+            'project_owner': 'Producer'
+        })
+    return jobs
+
+
+def sample_completed(count):
+    return [
+        {'job_number': f"BEN {900 + i}", 'job_name': f"Done {i}", 'description': 'Wrapped'}
+        for i in range(count)
+    ]
+
+
+def bench(job_count, repeat):
+    jobs = sample_jobs(job_count)
+    completed = sample_completed(max(1, job_count // 10))
+    
+    build_wip_email('Bench Co', jobs, completed)  # warm up
+    
+    start = time.perf_counter()
+    for _ in range(repeat):
+        html = build_wip_email('Bench Co', jobs, completed)
+    elapsed = (time.perf_counter() - start) / repeat
+    
+    return elapsed, len(html)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark WIP email rendering')
+    parser.add_argument('--jobs', default='10,100,500,1000', help='Comma-separated job counts')
+    parser.add_argument('--repeat', type=int, default=50, help='Renders per job count')
+    args = parser.parse_args()
+    
+    print(f"{'jobs':>6}  {'ms/render':>10}  {'us/job':>8}  {'bytes':>9}")
+    for count in [int(n) for n in args.jobs.split(',')]:
+        elapsed, size = bench(count, args.repeat)
+        print(f"{count:>6}  {elapsed * 1000:>10.2f}  {elapsed * 1e6 / count:>8.1f}  {size:>9}")
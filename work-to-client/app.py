@@ -8,35 +8,48 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, request, jsonify
-from anthropic import Anthropic
-import httpx
 import json
 
 from shared import (
-    ANTHROPIC_API_KEY,
-    ANTHROPIC_MODEL,
-    strip_markdown_json,
+    compact_email,
+    create_structured,
+    LLMUnavailable,
+    AirtableUnavailable,
+    model_for,
+    get_llm_stats,
     get_project_by_job_number,
-    increment_project_round,
-    create_update,
-    update_project_fields
+    get_cache_stats,
+    start_mirror_sync,
+    mark_sent_to_client,
+    create_update
 )
+from shared.jobs import async_job, init_jobs, get_jobs_stats
 
 app = Flask(__name__)
 
-# Anthropic client
-anthropic_client = Anthropic(
-    api_key=ANTHROPIC_API_KEY,
-    http_client=httpx.Client(timeout=60.0, follow_redirects=True)
-)
+# GET /jobs/<id> and background workers for ?async=true requests
+init_jobs(app)
+
+# Keep the local Airtable mirror warm (no-op unless AIRTABLE_MIRROR_ENABLED)
+start_mirror_sync()
 
 # Load prompt
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), 'prompt.txt')
 with open(PROMPT_PATH, 'r') as f:
     WORK_TO_CLIENT_PROMPT = f.read()
 
+# Load output schema (the tool Claude must answer with)
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.json')
+with open(SCHEMA_PATH, 'r') as f:
+    WORK_TO_CLIENT_SCHEMA = json.load(f)
+
+# Model for this app (WORK_TO_CLIENT_MODEL, else ANTHROPIC_MODEL)
+WORK_TO_CLIENT_MODEL = model_for('work-to-client')
+
 
 @app.route('/work-to-client', methods=['POST'])
+# Not re-run - an interrupted run may already have logged the update and bumped the round
+@async_job('work-to-client', retry_on_503=False)
 def work_to_client():
     """Process deliverables being sent to client.
     
@@ -63,8 +76,8 @@ def work_to_client():
         if not job_number:
             return jsonify({'error': 'No job number provided'}), 400
         
-        # Get project details from Airtable
-        project = get_project_by_job_number(job_number)
+        # Get project details from Airtable (live read - we need the current round)
+        project = get_project_by_job_number(job_number, use_cache=False)
         
         if not project:
             return jsonify({
@@ -73,11 +86,8 @@ def work_to_client():
                 'message': f"Could not find job {job_number} in the system"
             }), 404
         
-        # Increment the round counter
-        new_round = increment_project_round(job_number)
-        
-        if new_round is None:
-            new_round = 1  # Fallback if increment failed
+        # The round this send will be - written to Airtable once the update is logged
+        new_round = (project['round'] or 0) + 1
         
         # Check if this is a chargeable round (Round 3+)
         chargeable_flag = new_round >= 3
@@ -85,6 +95,9 @@ def work_to_client():
         # Generate folder path for SharePoint
         folder_path = f"/{job_number}/Round {new_round}/"
         
+        # Strip quoted history, signatures and disclaimers
+        email_content, compaction = compact_email(email_content)
+        
         # Build content for Claude to generate update text
         wtc_content = f"""Job Number: {job_number}
 Job Name: {project['jobName']}
@@ -96,8 +109,10 @@ Email content:
 {email_content}"""
         
         # Call Claude to generate update summary
-        response = anthropic_client.messages.create(
-            model=ANTHROPIC_MODEL,
+        analysis, usage = create_structured(
+            tool=WORK_TO_CLIENT_SCHEMA,
+            label='Work-to-Client',
+            model=WORK_TO_CLIENT_MODEL,
             max_tokens=1000,
             temperature=0.2,
             system=WORK_TO_CLIENT_PROMPT,
@@ -106,11 +121,6 @@ Email content:
             ]
         )
         
-        # Parse response
-        content = response.content[0].text
-        content = strip_markdown_json(content)
-        analysis = json.loads(content)
-        
         # Create update record
         update_text = analysis.get('updateText', f"Round {new_round} sent to client")
         update_created = create_update(
@@ -118,8 +128,11 @@ Email content:
             update_text=update_text
         )
         
-        # Update project - set With Client to true
-        update_project_fields(job_number, {'With Client?': True})
+        # Increment the round counter and set With Client in one write,
+        # only after the update is logged so a failed run leaves the project as it was
+        project_updated = False
+        if update_created:
+            project_updated = mark_sent_to_client(project['recordId'], project['round'], job_number=job_number) is not None
         
         # Build Teams post
         teams_post = f"SENT TO CLIENT | Round {new_round}"
@@ -136,15 +149,28 @@ Email content:
             'chargeableFlag': chargeable_flag,
             'updateText': update_text,
             'updateCreated': update_created,
+            'projectUpdated': project_updated,
             'teamsChannelId': project['teamsChannelId'],
-            'projectRecordId': project['recordId']
+            'projectRecordId': project['recordId'],
+            'usage': usage,
+            'compaction': compaction
         })
         
+    except LLMUnavailable as e:
+        return jsonify({
+            'error': 'Claude unavailable',
+            'details': str(e)
+        }), 503
+    except AirtableUnavailable as e:
+        return jsonify({
+            'error': 'Airtable unavailable',
+            'details': str(e)
+        }), 503
     except json.JSONDecodeError as e:
         return jsonify({
             'error': 'Claude returned invalid JSON',
             'details': str(e),
-            'raw_response': content if 'content' in locals() else 'No response'
+            'raw_response': getattr(e, 'raw_response', 'No response')
         }), 500
     except Exception as e:
         return jsonify({
@@ -159,7 +185,10 @@ def health():
     return jsonify({
         'status': 'healthy',
         'service': 'Dot Work-to-Client',
-        'version': '2.0'
+        'version': '2.0',
+        'cache': get_cache_stats(),
+        'llm': get_llm_stats(),
+        'jobs': get_jobs_stats()
     })
 
 